@@ -0,0 +1,171 @@
+'''
+Benchmark of the volume estimation pipeline on synthetic specimens (see vol_est_yolov8.utils.synthetic_specimens).
+
+For every combination of shape, resolution and number of segments the script reports
+- the time of every stage of process_vol_est_main.vol_est_single_image (see utils.profiling.PIPELINE_STAGES),
+- the throughput of all_vol_est_main [images/s],
+- the peak memory of a single image (tracemalloc, numpy/python allocations),
+- the relative error of the volumes and lengths against the analytic ground truth.
+
+Results are written to a JSON file, a previous result file can be passed as baseline to compare against.
+
+Usage:
+    python benchmarks/benchmark_vol_est.py --output benchmarks/baseline.json
+    python benchmarks/benchmark_vol_est.py --baseline benchmarks/baseline.json --output new.json
+    python benchmarks/benchmark_vol_est.py --resolutions 1280x960 --segments 3 --repeats 3
+'''
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import profiling, synthetic_specimens
+
+K_MM_PER_PX = 0.003118
+N_POLYNOM_FALLBACK = 3
+NUM_ORTHOGONAL_LINES = 150
+ROI_PADDING = 10
+
+
+def time_stages(results, labels) -> tuple[dict, pd.DataFrame]:
+    '''
+    Runs process_vol_est_main.vol_est_single_image with a StageProfiler.
+    Returns the duration per stage [s] (see utils.profiling.PIPELINE_STAGES) and the result row.
+    '''
+    profiler = profiling.StageProfiler()
+    df_res_row, _ = process_vol_est_main.vol_est_single_image(results.path, [results], labels, K_MM_PER_PX, N_POLYNOM_FALLBACK, NUM_ORTHOGONAL_LINES, ROI_PADDING, profiler=profiler)
+    stages = {stage: durations[0] for stage, durations in profiler.durations.items()}
+    return stages, df_res_row
+
+
+def relative_errors(df_res_row: pd.DataFrame, ground_truth: dict) -> dict:
+    'Relative error (estimate / ground truth - 1) per result column'
+    return {column: float(df_res_row[column].iloc[0] / value - 1) for column, value in ground_truth.items() if column in df_res_row}
+
+
+def run_case(specimen, repeats: int) -> dict:
+    results = specimen.to_results()
+    labels = results.names
+    ground_truth = specimen.ground_truth(K_MM_PER_PX)
+
+    # Warm up (imports, caches) without measuring
+    time_stages(results, labels)
+
+    all_stages = []
+    for _ in range(repeats):
+        stages, df_res_row = time_stages(results, labels)
+        all_stages.append(stages)
+    stages_s = {stage: float(np.median([stages[stage] for stages in all_stages])) for stage in all_stages[0]}
+
+    t = time.perf_counter()
+    df_vol_res, _ = process_vol_est_main.all_vol_est_main([specimen.name] * repeats, [[results]] * repeats, K_MM_PER_PX, N_POLYNOM_FALLBACK, NUM_ORTHOGONAL_LINES, roi_padding=ROI_PADDING)
+    duration = time.perf_counter() - t
+
+    tracemalloc.start()
+    process_vol_est_main.vol_est_single_image(specimen.name, [results], labels, K_MM_PER_PX, N_POLYNOM_FALLBACK, NUM_ORTHOGONAL_LINES, ROI_PADDING)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'stages_s': stages_s,
+        'total_s': float(sum(stages_s.values())),
+        'throughput_img_per_s': repeats / duration,
+        'peak_memory_mb': peak_bytes / 1024**2,
+        'relative_error': relative_errors(df_vol_res.iloc[[0]], ground_truth),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    '''
+    Prints the change of time, memory and accuracy per case against the baseline.
+    Returns the list of regressions (slower / more memory than tolerance, or a larger absolute error).
+    '''
+    regressions = []
+    for case, res in results['cases'].items():
+        if case not in baseline['cases']:
+            print(f"{case}: not in baseline")
+            continue
+        base = baseline['cases'][case]
+        time_change = res['total_s'] / base['total_s'] - 1
+        memory_change = res['peak_memory_mb'] / base['peak_memory_mb'] - 1
+        print(f"{case}: time {base['total_s'] * 1000:.1f} -> {res['total_s'] * 1000:.1f} ms ({time_change:+.1%}), "
+              f"peak memory {base['peak_memory_mb']:.1f} -> {res['peak_memory_mb']:.1f} MB ({memory_change:+.1%})")
+        for stage, duration in res['stages_s'].items():
+            if stage in base['stages_s']:
+                print(f"    {stage:<14} {base['stages_s'][stage] * 1000:8.1f} -> {duration * 1000:8.1f} ms")
+        if time_change > tolerance:
+            regressions.append(f"{case}: time {time_change:+.1%}")
+        if memory_change > tolerance:
+            regressions.append(f"{case}: peak memory {memory_change:+.1%}")
+        for column, error in res['relative_error'].items():
+            base_error = base['relative_error'].get(column)
+            if base_error is not None and abs(error) > abs(base_error) + 1e-3:
+                regressions.append(f"{case}: {column} error {base_error:+.4f} -> {error:+.4f}")
+    return regressions
+
+
+def parse_resolution(resolution: str) -> tuple[int, int]:
+    width, height = resolution.lower().split('x')
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shapes', nargs='+', default=list(synthetic_specimens.SPECIMEN_SHAPES), choices=list(synthetic_specimens.SPECIMEN_SHAPES))
+    parser.add_argument('--resolutions', nargs='+', default=['1280x960', '4032x3040'], help="WIDTHxHEIGHT")
+    parser.add_argument('--segments', nargs='+', type=int, default=[3, 5])
+    parser.add_argument('--repeats', type=int, default=5, help="Number of timed runs per case (the median is reported)")
+    parser.add_argument('--output', default=None, help="JSON file the results are written to")
+    parser.add_argument('--baseline', default=None, help="JSON file of a previous run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="Allowed relative increase of time and memory against the baseline")
+    args = parser.parse_args()
+
+    results = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'repeats': args.repeats,
+        },
+        'cases': {},
+    }
+
+    for shape in args.shapes:
+        for resolution in args.resolutions:
+            for num_segments in args.segments:
+                width, height = parse_resolution(resolution)
+                specimen = synthetic_specimens.SPECIMEN_SHAPES[shape](width=width, height=height, num_segments=num_segments)
+                res = run_case(specimen, args.repeats)
+                results['cases'][specimen.name] = res
+                errors = res['relative_error']
+                print(f"{specimen.name}: {res['total_s'] * 1000:.1f} ms, {res['throughput_img_per_s']:.2f} img/s, {res['peak_memory_mb']:.1f} MB, "
+                      f"volume error {errors['total_volume']:+.3f}, length error {errors['total_length']:+.3f}")
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions:")
+            for regression in regressions:
+                print(f"    {regression}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,20 @@
 import os
 
-from ultralytics import YOLO
-from PIL import Image
 import matplotlib.pyplot as plt
 
 import vol_est_yolov8 as vol_est
 from vol_est_yolov8.plotting import inference_results
 from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.perform_inference import inference_yolov8seg
 
 
-def run_seg_inference(img_names:list, path_selected_model:str, task:str="segment"):
-
-    model = YOLO(path_selected_model, task=task)
-    predictions = []
-    for image in img_names:
-
-        # Raw image
-        image = Image.open(image)
-
-        # Run inference on the image
-        prediction = model.predict(image)
-        predictions.append(prediction[0])
-
-        assert len(predictions) == 1, "Only one prediction object is expected for inference"
+def run_seg_inference(img_names:list, path_selected_model:str, task:str="segment", batch_size:int=8):
+    '''
+    Returns one prediction (list of Results) per image.
+    The model is loaded once per model path and reused by subsequent calls.
+    '''
+    driver = inference_yolov8seg.get_driver(path_selected_model, task=task, batch_size=batch_size)
+    predictions = driver.predict(img_names)
 
     return predictions
 
@@ -44,7 +36,7 @@ if __name__ == '__main__':
 
     predictions = run_seg_inference(img_names, model_path, task="segment")
 
-    img_w_segmentation = inference_results.plot_segments_from_results(predictions[0], return_image=True)
+    img_w_segmentation = inference_results.plot_segments_from_results(predictions[0][0], return_image=True)
 
     if predictions:
         # Volume estimation
@@ -0,0 +1,34 @@
+import numpy as np
+import cv2
+import torch
+
+from vol_est_yolov8.analyze_segments.calc_2d_cog_binary_mask import compute_2d_cog, compute_cogs_from_polygons
+
+
+def _ellipse(cx, cy, ax, ay, num=80):
+    t = np.linspace(0, 2 * np.pi, num, endpoint=False)
+    return np.column_stack((cx + ax * np.cos(t), cy + ay * np.sin(t))).astype(np.int32)
+
+def test_polygon_cogs_match_binary_masks():
+    polygons = [_ellipse(150, 60, 40, 25), _ellipse(50, 60, 30, 20), _ellipse(250, 70, 20, 15)]
+    all_cls = torch.tensor([2., 0., 2.])
+
+    cogs, class_ids = compute_cogs_from_polygons(polygons, all_cls)
+
+    # Classes in order of their first appearance, instances of a class combined
+    assert class_ids.tolist() == [2, 0]
+    for cog, cls in zip(cogs, class_ids):
+        mask = np.zeros((140, 300), dtype=np.uint8)
+        cv2.fillPoly(mask, [p for p, c in zip(polygons, all_cls.tolist()) if c == cls], 1)
+        np.testing.assert_allclose(cog, compute_2d_cog(mask, validate=False), atol=0.5)
+
+def test_polygon_cogs_without_area():
+    cogs, class_ids = compute_cogs_from_polygons([np.array([[10, 20], [30, 20]])], [1])
+    assert class_ids.tolist() == [1]
+    np.testing.assert_allclose(cogs, [[20, 20]])
+
+def test_self_intersecting_polygon_uses_moments():
+    bowtie = np.array([[0, 0], [40, 40], [40, 0], [0, 10]], dtype=np.float32)
+    cogs, _ = compute_cogs_from_polygons([bowtie], [1])
+    moments = cv2.moments(bowtie)
+    np.testing.assert_allclose(cogs[0], [moments['m10'] / moments['m00'], moments['m01'] / moments['m00']])
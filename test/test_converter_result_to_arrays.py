@@ -0,0 +1,48 @@
+import numpy as np
+from PIL import Image
+
+from vol_est_yolov8.converter import converter_result_to_arrays, converter_result_to_json
+from vol_est_yolov8.utils import load_json_annotation, synthetic_specimens
+
+
+class _IterableMasks:
+    'masks.xyn plus the iteration over single masks of ultralytics Masks, as used by ResultsConverter'
+    def __init__(self, xyn: list):
+        self.xyn = xyn
+
+    def __iter__(self):
+        return iter([_IterableMasks([xyn]) for xyn in self.xyn])
+
+def _json_path(results):
+    img_pil = Image.fromarray(np.ascontiguousarray(results.orig_img[..., ::-1]))
+    json_anno_data = converter_result_to_json.ResultsConverter(results, img_name=results.path).get_as_json()
+    return load_json_annotation.AnnotationConverter(results.names, json_annotation=json_anno_data, img=img_pil).load()
+
+def test_arrays_match_json_path():
+    specimen = synthetic_specimens.ellipsoid_chain(640, 480, num_segments=3)
+    results = specimen.to_results()
+    results.masks = _IterableMasks(results.masks.xyn)
+
+    img_np, _, _, masks, _, all_cls, mask_w_label, labels = converter_result_to_arrays.ResultsArrayConverter(results).load()
+    img_np_json, _, _, masks_json, _, all_cls_json, mask_w_label_json, labels_json = _json_path(results)
+
+    np.testing.assert_array_equal(img_np, img_np_json)
+    np.testing.assert_array_equal(all_cls.numpy(), all_cls_json.numpy())
+    assert labels == labels_json
+    # The JSON path truncates the polygons to integer pixels
+    for mask, mask_json in zip(masks, masks_json):
+        assert np.abs(mask - mask_json).max() <= 1 / 480
+    assert {key: len(value) for key, value in mask_w_label.items()} == {key: len(value) for key, value in mask_w_label_json.items()}
+
+def test_no_detections():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    results = specimen.to_results()
+    results.masks = None
+
+    _, _, boxes, masks, scores, all_cls, mask_w_label, _ = converter_result_to_arrays.ResultsArrayConverter(results).load()
+    # Same as the JSON path for an annotation without shapes
+    img_pil = Image.fromarray(np.ascontiguousarray(results.orig_img[..., ::-1]))
+    _, _, boxes_json, masks_json, scores_json, all_cls_json, mask_w_label_json, _ = load_json_annotation.AnnotationConverter(results.names, json_annotation={'shapes': []}, img=img_pil).load()
+    assert list(boxes) == boxes_json and list(masks) == masks_json and list(scores) == scores_json
+    assert len(all_cls) == len(all_cls_json) == 0
+    assert mask_w_label == mask_w_label_json
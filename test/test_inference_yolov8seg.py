@@ -0,0 +1,73 @@
+import numpy as np
+from PIL import Image
+
+from vol_est_yolov8.perform_inference import inference_yolov8seg
+
+
+class _FakeResult:
+    def __init__(self, image):
+        self.size = image.size if isinstance(image, Image.Image) else None
+        self.path = None
+
+class _FakeYOLO:
+    'Stands in for ultralytics.YOLO, records the constructor calls and the sizes of the predicted batches'
+    instances = []
+
+    def __init__(self, model_path, task=None):
+        self.model_path = model_path
+        self.batches = []
+        self.decoded_at_predict = []
+        _FakeYOLO.instances.append(self)
+
+    def predict(self, images, **kwargs):
+        if isinstance(images, np.ndarray):  # warmup
+            return [_FakeResult(images)]
+        self.batches.append(len(images))
+        self.decoded_at_predict.append(len(_decoded))
+        return [_FakeResult(image) for image in images]
+
+# Images passed to load_image, in the order the decoding started
+_decoded = []
+
+def _write_images(folder, num_images: int) -> list:
+    paths = []
+    for i in range(num_images):
+        path = str(folder / f"img_{i}.png")
+        # The width encodes the index, so the order of the results can be checked
+        Image.fromarray(np.zeros((8, 10 + i, 3), dtype=np.uint8)).save(path)
+        paths.append(path)
+    return paths
+
+def test_batches_keep_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(inference_yolov8seg, 'YOLO', _FakeYOLO)
+    original_load_image = inference_yolov8seg.load_image
+    def load_image(img_path):
+        _decoded.append(img_path)
+        return original_load_image(img_path)
+    monkeypatch.setattr(inference_yolov8seg, 'load_image', load_image)
+    _decoded.clear()
+    paths = _write_images(tmp_path, 7)
+
+    driver = inference_yolov8seg.SegInferenceDriver('model.pt', batch_size=3, prefetch_batches=1, num_decode_workers=2)
+    predictions = list(driver.iter_predictions(paths))
+
+    assert driver.model.batches == [3, 3, 1]
+    assert [img_name for img_name, _ in predictions] == paths
+    assert [prediction[0].path for _, prediction in predictions] == paths
+    assert [prediction[0].size[0] for _, prediction in predictions] == [10 + i for i in range(7)]
+    # At most the current batch and prefetch_batches further batches are decoded ahead of the model
+    assert all(decoded <= 3 * i + 3 + 3 for i, decoded in enumerate(driver.model.decoded_at_predict))
+    assert sorted(_decoded) == sorted(paths)
+
+def test_driver_is_cached_per_model(monkeypatch):
+    monkeypatch.setattr(inference_yolov8seg, 'YOLO', _FakeYOLO)
+    monkeypatch.setattr(inference_yolov8seg, '_drivers', {})
+    _FakeYOLO.instances = []
+
+    driver = inference_yolov8seg.get_driver('a.pt', batch_size=2, conf=0.5)
+    assert inference_yolov8seg.get_driver('a.pt') is driver and driver.batch_size == 2
+    # Settings of a later call are applied to the cached driver, the model is not loaded again
+    assert inference_yolov8seg.get_driver('a.pt', batch_size=4, imgsz=320) is driver
+    assert driver.batch_size == 4 and driver.predict_kwargs == {'verbose': False, 'conf': 0.5, 'imgsz': 320}
+    assert inference_yolov8seg.get_driver('b.pt') is not driver
+    assert [model.model_path for model in _FakeYOLO.instances] == ['a.pt', 'b.pt']
@@ -0,0 +1,60 @@
+import numpy as np
+import torch
+
+from vol_est_yolov8.analyze_segments.calc_2d_cog_binary_mask import compute_2d_cog, compute_cogs_from_label_map
+from vol_est_yolov8.analyze_segments.label_map import xyn_to_label_map, get_label_names, label_map_to_masks
+from vol_est_yolov8.extract_skeleton.orthogonal_slicer import OrthogonalLinesGenerator
+from vol_est_yolov8.length_estimation.length_estimation import LengthEstimator
+
+
+def _ellipse_xyn(cx, cy, ax, ay, w, h, num=60):
+    t = np.linspace(0, 2 * np.pi, num, endpoint=False)
+    return np.column_stack(((cx + ax * np.cos(t)) / w, (cy + ay * np.sin(t)) / h)).astype(np.float32)
+
+def _label_map():
+    w, h = 200, 120
+    xyn_s = [_ellipse_xyn(55, 60, 30, 22, w, h), _ellipse_xyn(130, 62, 40, 28, w, h)]
+    all_cls = torch.tensor([0., 2.])
+    image = np.zeros((h, w, 3), dtype=np.uint8)
+    return xyn_to_label_map(xyn_s, all_cls, w, h, image), all_cls
+
+def test_later_instance_wins_on_overlap():
+    w, h = 100, 100
+    xyn_s = [_ellipse_xyn(40, 50, 25, 25, w, h), _ellipse_xyn(60, 50, 25, 25, w, h)]
+    label_map = xyn_to_label_map(xyn_s, torch.tensor([1., 0.]), w, h, np.zeros((h, w, 3)))
+    assert label_map.dtype == np.uint8
+    assert label_map[50, 50] == 1
+    assert label_map[50, 20] == 2
+    assert label_map[0, 0] == 0
+
+def test_label_map_cogs_match_binary_masks():
+    label_map, all_cls = _label_map()
+    label_names = get_label_names(all_cls, {0: 'head', 1: 'thorax', 2: 'abdomen'})
+    assert label_names == {1: 'head', 3: 'abdomen'}
+
+    cogs = compute_cogs_from_label_map(label_map, all_cls)
+    masks = label_map_to_masks(label_map, label_names)
+    assert list(cogs.keys()) == ['0', '2']
+    np.testing.assert_allclose(cogs['0'], compute_2d_cog(masks['head']))
+    np.testing.assert_allclose(cogs['2'], compute_2d_cog(masks['abdomen']))
+
+def test_label_map_slicing_and_lengths_match_separate_masks():
+    label_map, all_cls = _label_map()
+    label_names = get_label_names(all_cls, {0: 'head', 1: 'thorax', 2: 'abdomen'})
+    masks = label_map_to_masks(label_map, label_names)
+    combined_mask = (label_map > 0).view(np.uint8)
+    middle_line = np.column_stack((np.linspace(28, 168, 40), np.linspace(58, 66, 40)))
+
+    lines_masks = OrthogonalLinesGenerator(middle_line, combined_mask, separate_masks=masks)
+    lines_label_map = OrthogonalLinesGenerator(middle_line, combined_mask, separate_masks=label_map, label_names=label_names)
+    lines_masks.generate_orthogonal_lines(num_lines=40)
+    lines_label_map.generate_orthogonal_lines(num_lines=40)
+    for key, lines in lines_masks.get_orthogonal_lines().items():
+        other_lines = lines_label_map.get_orthogonal_lines()[key]
+        assert len(lines) == len(other_lines)
+        for line, other_line in zip(lines, other_lines):
+            np.testing.assert_array_equal(line, other_line)
+
+    lengths_masks = LengthEstimator(middle_line, masks, 0.1).calculate_lengths(round_to=6)
+    lengths_label_map = LengthEstimator(middle_line, label_map, 0.1, label_names=label_names).calculate_lengths(round_to=6)
+    assert lengths_masks == lengths_label_map
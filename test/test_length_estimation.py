@@ -1,7 +1,7 @@
 import pytest
 import numpy as np
 
-from computer_vision_streamlit_app.length_estimation.length_estimation import LengthEstimator
+from vol_est_yolov8.length_estimation.length_estimation import LengthEstimator
 
 def test_total_length():
     points = [(0, 0), (0, 1), (1, 1), (1, 0)]
@@ -0,0 +1,103 @@
+import cv2
+import numpy as np
+import pytest
+import scipy.stats
+
+from vol_est_yolov8.extract_skeleton.line_refiner import GraphRefiner, trim_line, sample_points_from_segments, sample_points_from_segments_batch, _bilinear_interpolation
+
+
+def _reference_trim_line(binary_mask, refined_points):
+    # Per-sample implementation the vectorized trimmer has to reproduce
+    def point_in_mask(x, y):
+        if 0 <= int(y) < binary_mask.shape[0] and 0 <= int(x) < binary_mask.shape[1]:
+            return binary_mask[int(y), int(x)]
+        return False
+
+    refined_points = [tuple(point) for point in refined_points]
+    for i in range(len(refined_points) - 1):
+        for x, y in zip(np.linspace(refined_points[i][0], refined_points[i+1][0], 100), np.linspace(refined_points[i][1], refined_points[i+1][1], 100)):
+            if point_in_mask(x, y):
+                refined_points[i] = (x, y)
+                break
+    for i in range(len(refined_points) - 1, 0, -1):
+        for x, y in zip(np.linspace(refined_points[i][0], refined_points[i-1][0], 100), np.linspace(refined_points[i][1], refined_points[i-1][1], 100)):
+            if point_in_mask(x, y):
+                refined_points[i] = (x, y)
+                break
+    return np.array(refined_points, dtype=float)
+
+def test_trim_line_matches_per_sample_scan():
+    mask = np.zeros((300, 400), dtype=np.uint8)
+    cv2.ellipse(mask, (200, 150), (120, 50), 10, 0, 360, 1, -1)
+    t = np.linspace(-1.4, 1.4, 60)
+    points = np.column_stack((200 + 190 * t, 150 + 40 * t**2))
+    points[0] = (-0.5, 3.2)  # Truncates to pixel 0
+
+    trimmed = trim_line(mask, points)
+    np.testing.assert_array_equal(trimmed, _reference_trim_line(mask, points))
+    # Points next to the mask border were moved, the input is not modified
+    assert not np.array_equal(trimmed, points)
+    np.testing.assert_array_equal(points[0], (-0.5, 3.2))
+    assert points[0, 0] == -0.5
+
+def _reference_sample_points(middle_line_points, n):
+    # Segment walk the arc-length resampling has to reproduce
+    total_length = sum(np.linalg.norm(np.subtract(middle_line_points[i+1], middle_line_points[i])) for i in range(len(middle_line_points) - 1))
+    distance_between_samples = total_length / (n - 1)
+    sampled_points = [middle_line_points[0]]
+    remaining_distance = distance_between_samples
+    for i in range(len(middle_line_points) - 1):
+        p1, p2 = np.array(middle_line_points[i]), np.array(middle_line_points[i+1])
+        segment_length = np.linalg.norm(p2 - p1)
+        while segment_length >= remaining_distance:
+            t = remaining_distance / segment_length
+            next_point = (1 - t) * p1 + t * p2
+            sampled_points.append(tuple(next_point))
+            segment_length -= remaining_distance
+            remaining_distance = distance_between_samples
+            p1 = next_point
+        if segment_length > 0:
+            remaining_distance -= segment_length
+    if len(sampled_points) < n:
+        sampled_points.append(middle_line_points[-1])
+    return np.array(sampled_points)
+
+def test_sample_points_matches_segment_walk():
+    rng = np.random.default_rng(0)
+    lines = [np.cumsum(rng.uniform(-20, 40, (num_points, 2)), axis=0) for num_points in (2, 7, 150)]
+    for line in lines:
+        sampled = sample_points_from_segments(line, 110)
+        assert sampled.shape == (110, 2)
+        np.testing.assert_allclose(sampled, _reference_sample_points(line, 110), atol=1e-8)
+        np.testing.assert_array_equal(sampled[[0, -1]], line[[0, -1]])
+
+    batch = sample_points_from_segments_batch(lines, 110)
+    assert batch.shape == (3, 110, 2)
+    for line, sampled in zip(lines, batch):
+        np.testing.assert_allclose(sampled, sample_points_from_segments(line, 110), atol=1e-8)
+
+    with pytest.raises(ValueError):
+        sample_points_from_segments(lines[0], 1)
+
+def test_graph_refiner_density_and_gradient():
+    rng = np.random.default_rng(0)
+    scatter_points = np.column_stack((rng.normal(500, 80, 400), rng.normal(300, 30, 400)))
+    control_points = np.array([[380., 330.], [450., 300.], [550., 300.], [620., 270.]])
+    refiner = GraphRefiner(control_points, scatter_points, alpha=1, iterations=50)
+
+    # Binned FFT density is close to the exact gaussian KDE
+    X, Y, Z = refiner.density_map
+    exact = scipy.stats.gaussian_kde(scatter_points.T)(np.vstack([X.ravel(), Y.ravel()])).reshape(X.shape)
+    assert np.abs(Z - exact).max() < 0.05 * exact.max()
+
+    # Bilinear interpolation reproduces a linear field exactly
+    field = 2 * X + 3 * Y
+    query = np.array([[431.7, 287.2], [512.3, 301.9]])
+    np.testing.assert_allclose(_bilinear_interpolation(field, X[0, :], Y[:, 0], query), 2 * query[:, 0] + 3 * query[:, 1])
+
+    # Both endpoints are pulled towards the dense center, the inner points stay
+    refined_points = refiner.get_refined_points()
+    center = np.array([500., 300.])
+    for idx in (0, -1):
+        assert np.linalg.norm(refined_points[idx] - center) < np.linalg.norm(control_points[idx] - center) - 20
+    np.testing.assert_array_equal(refined_points[1:-1], control_points[1:-1])
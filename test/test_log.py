@@ -0,0 +1,26 @@
+import logging
+
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import log, synthetic_specimens
+
+
+def _run(num_images=2):
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    process_vol_est_main.all_vol_est_main([specimen.name] * num_images, [[specimen.to_results()]] * num_images, 0.01, 3, 150)
+
+def test_pipeline_is_silent_by_default(capsys):
+    _run()
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err == ""
+
+def test_progress_is_logged_once_per_batch(caplog):
+    logger = log.set_verbosity(logging.INFO, handler=logging.NullHandler())
+    try:
+        with caplog.at_level(logging.INFO, logger=log.PACKAGE_LOGGER):
+            _run(num_images=3)
+    finally:
+        logger.setLevel(logging.WARNING)
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == [message for message in messages if "3 image(s)" in message]
+    assert len(messages) == 1
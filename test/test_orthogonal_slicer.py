@@ -0,0 +1,42 @@
+import cv2
+import numpy as np
+
+from vol_est_yolov8.extract_skeleton.orthogonal_slicer import OrthogonalLinesGenerator
+
+
+def _separate_masks():
+    head = np.zeros((120, 200), dtype=np.uint8)
+    body = np.zeros((120, 200), dtype=np.uint8)
+    cv2.ellipse(head, (60, 60), (35, 25), 0, 0, 360, 1, -1)
+    cv2.ellipse(body, (125, 62), (45, 30), 10, 0, 360, 1, -1)
+    return {'head': head, 'body': body}
+
+def _reference_trimmed_line(combined_mask, separate_masks, start_point, slope):
+    # Per-row implementation the vectorized tracer has to reproduce
+    y_vals = np.arange(0, combined_mask.shape[0])
+    x_vals = start_point[0] + (y_vals - start_point[1]) / slope
+    valid = [(x, y) for x, y in zip(x_vals, y_vals) if 0 <= x < combined_mask.shape[1] and combined_mask[int(y), int(x)] == 1]
+    segmented = {key: [(x, y) for x, y in valid if mask[int(y), int(x)] == 1] for key, mask in separate_masks.items()}
+    key = max(segmented, key=lambda k: len(segmented[k]))
+    return segmented[key], key
+
+def test_vectorized_lines_match_per_row_tracing():
+    separate_masks = _separate_masks()
+    combined_mask = separate_masks['head'] | separate_masks['body']
+    middle_line = np.column_stack((np.linspace(28, 168, 40), np.linspace(58, 66, 40)))
+
+    generator = OrthogonalLinesGenerator(middle_line, combined_mask, separate_masks=separate_masks)
+    generator.generate_orthogonal_lines(num_lines=40)
+    lines = generator.get_orthogonal_lines()
+
+    expected = {'head': [], 'body': []}
+    for idx in range(len(middle_line)):
+        prev_idx, next_idx = max(idx - 1, 0), min(idx + 1, len(middle_line) - 1)
+        gradient = generator.get_gradient(middle_line[prev_idx], middle_line[next_idx])
+        line, key = _reference_trimmed_line(combined_mask, separate_masks, middle_line[idx], -1 / gradient)
+        expected[key].append(line)
+
+    for key in expected:
+        assert len(lines[key]) == len(expected[key])
+        for line, expected_line in zip(lines[key], expected[key]):
+            np.testing.assert_allclose(line, np.array(expected_line, dtype=float).reshape(-1, 2))
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+from vol_est_yolov8 import parameter_sweep, process_vol_est_main
+from vol_est_yolov8.utils import synthetic_specimens
+
+
+def test_sweep_long_format_matches_single_runs():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    results = specimen.to_results()
+    grid = {'k_mm_per_px': [0.01, 0.02], 'num_orthogonal_lines': [40, 60], 'n_samples': [80, 110]}
+
+    df_sweep = parameter_sweep.sweep([specimen.name], [[results]], grid, params={'n_polynom_fallback': 3})
+
+    assert list(df_sweep.columns) == ['img_name', 'n_samples', 'num_orthogonal_lines', 'k_mm_per_px', 'quantity', 'value', 'error']
+    assert df_sweep['error'].isna().all()
+    quantities = {'total_volume', 'total_length', *(f'{q}_{name}' for q in ('volume', 'length') for name in specimen.labels.values())}
+    assert set(df_sweep['quantity']) == quantities
+    assert len(df_sweep) == 8 * len(quantities)
+
+    df_single, _ = process_vol_est_main.vol_est_single_image(specimen.name, [results], specimen.labels, 0.02, 3, 40)
+    row = df_sweep[(df_sweep['k_mm_per_px'] == 0.02) & (df_sweep['num_orthogonal_lines'] == 40) & (df_sweep['n_samples'] == 110)]
+    values = dict(zip(row['quantity'], row['value']))
+    assert np.isclose(values['total_volume'], df_single['total_volume'][0])
+    assert np.isclose(values['length_segment_1'], df_single['length_segment_1'][0])
+
+def test_parameter_grid_order_and_validation():
+    combinations = parameter_sweep.parameter_grid({'k_mm_per_px': [1, 2], 'n_polynom_fallback': [2, 3]})
+    assert combinations == [{'n_polynom_fallback': 2, 'k_mm_per_px': 1}, {'n_polynom_fallback': 2, 'k_mm_per_px': 2},
+                            {'n_polynom_fallback': 3, 'k_mm_per_px': 1}, {'n_polynom_fallback': 3, 'k_mm_per_px': 2}]
+    with pytest.raises(ValueError):
+        parameter_sweep.parameter_grid({'n_polynom': [2]})
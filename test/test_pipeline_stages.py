@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from vol_est_yolov8 import pipeline_stages, process_vol_est_main
+from vol_est_yolov8.utils import synthetic_specimens
+
+
+def test_only_invalidated_stages_rerun():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    results = specimen.to_results()
+    params = {'k_mm_per_px': 0.01, 'n_polynom_fallback': 3, 'num_orthogonal_lines': 50}
+    store = pipeline_stages.ArtifactStore()
+
+    artifacts = pipeline_stages.run_stages(results, specimen.labels, params, store=store)
+    assert all(count == 1 for count in store.computed.values())
+
+    # A new scale only reruns the measurements
+    rescaled = pipeline_stages.run_stages(results, specimen.labels, {**params, 'k_mm_per_px': 0.02}, store=store)
+    assert store.computed['orthogonal_lines'] == 1 and store.computed['measurements'] == 2
+    assert rescaled['measurements']['volumes']['total_volume'][0] > 7 * artifacts['measurements']['volumes']['total_volume'][0]
+
+    # More orthogonal lines rerun the slicing, the middle line is reused
+    pipeline_stages.run_stages(results, specimen.labels, {**params, 'num_orthogonal_lines': 80}, store=store)
+    assert store.computed['centerline'] == 1 and store.computed['resampled_line'] == 1
+    assert store.computed['orthogonal_lines'] == 2 and store.computed['measurements'] == 3
+
+    # Unchanged parameters are served from the store, the result equals a run without store
+    df_stored, _ = process_vol_est_main.vol_est_single_image(specimen.name, [results], specimen.labels, 0.01, 3, 50, artifact_store=store)
+    df_fresh, _ = process_vol_est_main.vol_est_single_image(specimen.name, [results], specimen.labels, 0.01, 3, 50)
+    assert store.computed['measurements'] == 3
+    pd.testing.assert_frame_equal(df_stored, df_fresh)
+
+def test_partial_run_and_eviction():
+    specimen = synthetic_specimens.ellipsoid_chain(640, 480)
+    store = pipeline_stages.ArtifactStore(max_entries=2)
+    artifacts = pipeline_stages.run_stages(specimen.to_results(), specimen.labels, {'n_polynom_fallback': 3}, store=store, until='resampled_line')
+    assert len(artifacts['resampled_line']['fitted_points']) == 110
+    assert 'orthogonal_lines' not in artifacts
+    assert [stage for stage, _ in store.artifacts] == ['centerline', 'resampled_line']
+
+def test_fingerprint_without_detections():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    empty = specimen.to_results()
+    empty.masks = None
+    assert pipeline_stages.prediction_fingerprint(empty, specimen.labels) != pipeline_stages.prediction_fingerprint(specimen.to_results(), specimen.labels)
+
+def test_artifacts_do_not_hold_the_image():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    results = specimen.to_results()
+    # Same polygons, different pixels: the masks artifact is shared, the image is not
+    other = specimen.to_results()
+    other.orig_img = 255 - other.orig_img
+    store = pipeline_stages.ArtifactStore()
+
+    artifacts = pipeline_stages.run_stages(results, specimen.labels, {'n_polynom_fallback': 3}, store=store, until='masks')
+    assert artifacts['masks']['image_size'] == (640, 480)
+    assert 'img_np' not in artifacts['masks']
+
+    _, res = process_vol_est_main.vol_est_single_image(specimen.name, [results], specimen.labels, 0.01, 3, 50, artifact_store=store)
+    _, res_other = process_vol_est_main.vol_est_single_image(specimen.name, [other], specimen.labels, 0.01, 3, 50, artifact_store=store)
+    assert store.computed['measurements'] == 1
+    np.testing.assert_array_equal(res['img_np'], results.orig_img[..., ::-1])
+    np.testing.assert_array_equal(res_other['img_np'], other.orig_img[..., ::-1])
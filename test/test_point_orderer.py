@@ -0,0 +1,31 @@
+import numpy as np
+
+from vol_est_yolov8.extract_skeleton.point_orderer import PointOrderer
+
+
+def _reference_order(extended_reference_points, unordered_points):
+    # Per-point sort key the vectorized projection has to reproduce
+    def custom_sort(point):
+        min_distance, order_value = float('inf'), None
+        for i in range(len(extended_reference_points) - 1):
+            segment_start, segment_end = np.array(extended_reference_points[i]), np.array(extended_reference_points[i+1])
+            segment_vector = segment_end - segment_start
+            t = np.dot(np.array(point) - segment_start, segment_vector) / np.dot(segment_vector, segment_vector)
+            distance = np.linalg.norm(np.array(point) - (segment_start + t * segment_vector))
+            if distance < min_distance:
+                min_distance, order_value = distance, i + t
+        return order_value
+    return sorted(unordered_points, key=custom_sort)
+
+def test_order_points_matches_per_point_sort():
+    rng = np.random.default_rng(0)
+    reference_points = [(600., 700.), (900., 820.), (1300., 760.), (1650., 1000.)]
+    # Rounded coordinates produce ties between points and segments
+    unordered_points = list(np.round(rng.uniform(0, 3000, (400, 2)), -2))
+
+    orderer = PointOrderer(reference_points)
+    ordered_points = orderer.order_points(unordered_points)
+    expected = _reference_order(orderer.extended_reference_points, unordered_points)
+
+    assert len(ordered_points) == len(unordered_points)
+    assert all(point is expected_point for point, expected_point in zip(ordered_points, expected))
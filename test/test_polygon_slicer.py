@@ -0,0 +1,57 @@
+import numpy as np
+import cv2
+import pytest
+
+from vol_est_yolov8 import pipeline_stages
+
+from vol_est_yolov8.extract_skeleton.polygon_slicer import PolygonSlicer, label_points, points_in_polygons
+from vol_est_yolov8.utils import synthetic_specimens
+
+
+def _rotate(points, angle_deg, center=(200.0, 150.0)):
+    angle = np.deg2rad(angle_deg)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return (np.asarray(points, dtype=float) - center) @ rotation.T + center
+
+def test_widths_are_exact_on_rotated_segments():
+    # Two rectangles of width 40 next to each other along a rotated axis
+    left = _rotate([[100, 130], [200, 130], [200, 170], [100, 170]], 30)
+    right = _rotate([[200, 130], [300, 130], [300, 170], [200, 170]], 30)
+    middle_line = _rotate(np.column_stack((np.linspace(105, 295, 60), np.full(60, 150.0))), 30)
+
+    slicer = PolygonSlicer(middle_line, [left, right], [0, 2], {1: 'head', 3: 'abdomen'})
+    slicer.generate_orthogonal_lines(num_lines=20)
+    endpoints = slicer.get_line_endpoints()
+
+    assert len(endpoints['head']) == 10 and len(endpoints['abdomen']) == 10
+    for seg_endpoints in endpoints.values():
+        widths = np.linalg.norm(seg_endpoints[:, 0] - seg_endpoints[:, 1], axis=1)
+        np.testing.assert_allclose(widths, 40, rtol=1e-9)
+    assert np.isnan(slicer.entry_exit['abdomen'][0]).all()
+
+def test_points_in_polygons_match_opencv():
+    polygon = np.array([[10, 10], [120, 30], [60, 60], [110, 110], [15, 90]], dtype=float)
+    points = np.random.default_rng(0).uniform(0, 130, (500, 2))
+    inside = points_in_polygons(points, [polygon])[:, 0]
+    expected = [cv2.pointPolygonTest(polygon.astype(np.float32), (float(x), float(y)), False) > 0 for x, y in points]
+    np.testing.assert_array_equal(inside, expected)
+
+def test_label_points_later_instance_wins():
+    first = np.array([[0, 0], [10, 0], [10, 10], [0, 10]], dtype=float)
+    second = first + [5, 0]
+    labels = label_points([[2, 5], [7, 5], [13, 5], [30, 5]], [first, second], [1, 0])
+    np.testing.assert_array_equal(labels, [2, 1, 1, 0])
+
+def test_polygon_method_matches_raster():
+    specimen = synthetic_specimens.ellipsoid_chain(640, 480)
+    results = specimen.to_results()
+    params = {'k_mm_per_px': 0.01, 'n_polynom_fallback': 3, 'num_orthogonal_lines': 60}
+    store = pipeline_stages.ArtifactStore()
+    raster = pipeline_stages.run_stages(results, specimen.labels, params, store=store)['measurements']
+    polygon = pipeline_stages.run_stages(results, specimen.labels, {**params, 'slicing_method': 'polygon'}, store=store)['measurements']
+    assert store.computed['centerline'] == 1
+    np.testing.assert_allclose(polygon['volumes'].to_numpy(), raster['volumes'].to_numpy(), rtol=0.05)
+    np.testing.assert_allclose(polygon['lengths'].to_numpy(), raster['lengths'].to_numpy(), rtol=0.05)
+
+    with pytest.raises(ValueError):
+        pipeline_stages.run_stages(results, specimen.labels, {**params, 'slicing_method': 'mesh'})
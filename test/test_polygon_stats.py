@@ -0,0 +1,51 @@
+import numpy as np
+import cv2
+
+from vol_est_yolov8.analyze_segments import polygon_stats, segment_extractors, xyn_to_bin_mask
+
+
+def _star(center, num_vertices=60, seed=0):
+    angles = np.linspace(0, 2 * np.pi, num_vertices, endpoint=False)
+    radii = np.random.default_rng(seed).uniform(20, 40, num_vertices)
+    return np.column_stack((center[0] + radii * np.cos(angles), center[1] + radii * np.sin(angles))).astype(np.int32)
+
+def test_stats_match_opencv():
+    polygons = [_star((50, 60), seed=0), _star((150, 80), seed=1)[::-1], np.array([[5, 5], [9, 5]])]
+    stats = polygon_stats.polygon_stats(polygons)
+
+    for i, polygon in enumerate(polygons[:2]):
+        moments = cv2.moments(polygon.astype(np.float32))
+        assert stats['area'][i] == abs(cv2.contourArea(polygon))
+        np.testing.assert_allclose(stats['centroid'][i], [moments['m10'] / moments['m00'], moments['m01'] / moments['m00']])
+        x, y, w, h = cv2.boundingRect(polygon)
+        np.testing.assert_array_equal(stats['bbox'][i], [x, y, x + w - 1, y + h - 1])
+    # A degenerate polygon has no area, its centroid is the mean of the vertices
+    assert stats['area'][2] == 0
+    np.testing.assert_array_equal(stats['centroid'][2], [7, 5])
+    assert not stats['rasterized'].any()
+
+def test_self_intersecting_polygon_is_rasterized():
+    bowtie = np.array([[0, 0], [20, 20], [20, 0], [0, 20]])
+    square = np.array([[0, 0], [20, 0], [20, 20], [0, 20]])
+    np.testing.assert_array_equal(polygon_stats.self_intersecting([bowtie, square]), [True, False])
+
+    stats = polygon_stats.polygon_stats([bowtie])
+    mask = xyn_to_bin_mask.xyn_to_bin_mask([bowtie / 100], 100, 100, np.zeros((100, 100)))[0]
+    assert stats['rasterized'][0] and stats['area'][0] == mask.sum()
+    np.testing.assert_allclose(stats['centroid'][0], [10, 10], atol=0.5)
+
+def test_area_ratios_close_to_raster():
+    w, h = 400, 300
+    xyn_s = [_star((100, 150), seed=2) / [w, h], _star((250, 150), seed=3) / [w, h], _star((330, 150), seed=4) / [w, h]]
+    labels = {0: 'head', 1: 'abdomen'}
+    polygon_areas = polygon_stats.PolygonSegmentArea.from_xyn(xyn_s, [0, 1, 1], labels, w, h)
+    assert [len(polygon_areas[label]) for label in ['head', 'abdomen']] == [1, 2]
+
+    image = np.zeros((h, w, 3), dtype=np.uint8)
+    raster_areas = {}
+    for i_cls, mask in zip([0, 1, 1], xyn_to_bin_mask.xyn_to_bin_mask(xyn_s, w, h, image)):
+        raster_areas.setdefault(labels[i_cls], []).append(segment_extractors.SegmentArea(image, mask))
+
+    polygon_ratios = segment_extractors.segment_area_comparison(polygon_areas)
+    raster_ratios = segment_extractors.segment_area_comparison(raster_areas)
+    np.testing.assert_allclose(polygon_ratios.to_numpy(), raster_ratios.to_numpy(), rtol=0.02)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from vol_est_yolov8.extract_skeleton.polynom_regression_in_mask import MaskPointGenerator, grouped_mean
+
+
+def test_poly_func_matches_power_sum():
+    beta = np.array([3.0, -2.0, 0.5, 1e-3])
+    x = np.linspace(-10, 500, 50)
+    expected = sum(coef * x**i for i, coef in enumerate(beta))
+    np.testing.assert_allclose(MaskPointGenerator.poly_func(beta, x), expected)
+
+def test_fit_get_odr_follows_band():
+    mask = np.zeros((300, 1000), dtype=np.uint8)
+    x = np.arange(100, 900)
+    y_center = np.rint(150 + 60 * np.sin(np.pi * (x - 100) / 800)).astype(int)
+    for dy in range(-12, 13):
+        mask[y_center + dy, x] = 1
+
+    generator = MaskPointGenerator(mask)
+    fitted_points = generator.fit_get_odr(degree=4)
+
+    assert len(fitted_points) > 300
+    assert generator.inside_mask(fitted_points).all()
+    y_true = np.interp(fitted_points[:, 0], x, y_center)
+    assert np.abs(fitted_points[:, 1] - y_true).mean() < 2
+
+def test_grouped_mean_and_spline():
+    keys = np.array([3.0, 1.0, 3.0, 2.0, 1.0, 1.0])
+    values = np.array([1.0, 2.0, 5.0, 7.0, 4.0, 6.0])
+    unique_keys, means = grouped_mean(keys, values)
+    np.testing.assert_array_equal(unique_keys, [1, 2, 3])
+    np.testing.assert_allclose(means, [4, 7, 3])
+
+    generator = MaskPointGenerator(np.ones((10, 10), dtype=np.uint8), num_points=5)
+    spline = generator.fit_spline(np.column_stack((keys, values)))
+    np.testing.assert_allclose(spline([1, 2, 3]), [4, 7, 3])
+    assert generator.interpolate_points_spline(np.column_stack((keys, values))).shape == (30, 2)
+    assert generator.interpolate_points(np.column_stack((keys, values)), kind='linear', num_samples=7).shape == (7, 2)
+
+def test_points_are_lazy_reproducible_and_inside_mask():
+    mask = np.zeros((200, 300), dtype=np.uint8)
+    mask[50:80, 120:260] = 1
+
+    generator = MaskPointGenerator(mask, given_points=np.array([[130.0, 60.0]]), num_points=100, seed=3)
+    assert generator._points is None
+    points = generator.points
+    assert points.shape == (101, 2)
+    assert (mask[points[:100, 1].astype(int), points[:100, 0].astype(int)] == 1).all()
+    assert len(np.unique(points[:100], axis=0)) == 100
+
+    np.testing.assert_array_equal(points, MaskPointGenerator(mask, given_points=np.array([[130.0, 60.0]]), num_points=100, seed=3).points)
@@ -0,0 +1,96 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import synthetic_specimens
+from vol_est_yolov8.utils.result_sinks import CsvResultSink, ParquetResultSink
+
+
+def test_parallel_keeps_order_and_isolates_errors():
+    specimens = [synthetic_specimens.curved_tube(640, 480), synthetic_specimens.ellipsoid_chain(640, 480), synthetic_specimens.ellipsoid_chain(640, 480, num_segments=2)]
+    predictions = [[s.to_results()] for s in specimens]
+    broken = specimens[1].to_results()
+    broken.orig_img = None
+    predictions.insert(1, [broken])
+    names = [specimens[0].name, 'broken', specimens[1].name, specimens[2].name]
+
+    df_parallel, first_res = process_vol_est_main.all_vol_est_main_parallel(names, predictions, 0.01, 3, 50, max_workers=2)
+
+    assert len(df_parallel) == 4
+    assert df_parallel['error'][1] is not None and df_parallel['error'].drop(index=1).isna().all()
+    assert np.isnan(df_parallel['total_volume'][1])
+    df_sequential, _ = process_vol_est_main.all_vol_est_main([names[i] for i in (0, 2, 3)], [predictions[i] for i in (0, 2, 3)], 0.01, 3, 50)
+    pd.testing.assert_frame_equal(df_parallel.drop(index=1).drop(columns='error').reset_index(drop=True)[df_sequential.columns], df_sequential)
+    assert first_res['img_np'] is not None and len(first_res['lines']) > 0
+
+def test_roi_matches_full_frame():
+    specimen = synthetic_specimens.ellipsoid_chain(1280, 960)
+    prediction = [specimen.to_results()]
+    df_roi, res_roi = process_vol_est_main.vol_est_single_image(specimen.name, prediction, specimen.labels, 0.01, 3, 80, roi_padding=10)
+    df_full, res_full = process_vol_est_main.vol_est_single_image(specimen.name, prediction, specimen.labels, 0.01, 3, 80, roi_padding=None)
+    pd.testing.assert_frame_equal(df_roi, df_full)
+    np.testing.assert_allclose(res_roi['fitted_points'], res_full['fitted_points'], atol=1e-6)
+
+def test_image_size_other_than_4032x3040():
+    # The specimen extends beyond x = 4032, the middle line must not be clipped there
+    for specimen in [synthetic_specimens.ellipsoid_chain(8000, 3000), synthetic_specimens.curved_tube(640, 480)]:
+        ground_truth = specimen.ground_truth(0.01)
+        df_vol_res, _ = process_vol_est_main.all_vol_est_main([specimen.name], [[specimen.to_results()]], 0.01, 3, 100, roi_padding=10)
+        assert abs(df_vol_res['total_length'][0] / ground_truth['total_length'] - 1) < 0.02
+
+class _RecordingExecutor(ProcessPoolExecutor):
+    'ProcessPoolExecutor that keeps the futures of all submitted images'
+    futures = []
+
+    def submit(self, *args, **kwargs):
+        future = super().submit(*args, **kwargs)
+        _RecordingExecutor.futures.append(future)
+        return future
+
+def _stream_inputs():
+    specimens = [synthetic_specimens.curved_tube(640, 480), synthetic_specimens.ellipsoid_chain(640, 480), synthetic_specimens.ellipsoid_chain(640, 480, num_segments=2)]
+    broken = specimens[1].to_results()
+    broken.orig_img = None
+    names = [specimens[0].name, 'broken', specimens[1].name, specimens[2].name]
+    predictions = [[specimens[0].to_results()], [broken], [specimens[1].to_results()], [specimens[2].to_results()]]
+    return names, predictions
+
+def test_iter_vol_est_streams_into_sinks(tmp_path):
+    pytest.importorskip('pyarrow')
+    names, predictions = _stream_inputs()
+    csv_path, parquet_path = str(tmp_path / 'results.csv'), str(tmp_path / 'results')
+
+    records = []
+    with CsvResultSink(csv_path) as csv_sink, ParquetResultSink(parquet_path, row_group_size=1) as parquet_sink:
+        for record in process_vol_est_main.iter_vol_est(names, predictions, 0.01, 3, 50, sinks=[csv_sink, parquet_sink], max_workers=2, max_in_flight=1):
+            records.append(record)
+            # Every record is on disk before it is yielded
+            assert len(pd.read_csv(csv_path)) == len(records)
+            assert len(pd.read_parquet(parquet_path)) == len(records)
+
+    assert [record['img_name'] for record in records] == names
+    assert records[1]['error'] is not None and records[1]['total_volume'] is None
+    assert all(records[i]['error'] is None and records[i]['total_volume'] > 0 for i in (0, 2, 3))
+    df_csv = pd.read_csv(csv_path)
+    assert list(df_csv['img_name']) == names and df_csv['error'].notna().tolist() == [False, True, False, False]
+    assert sorted(pd.read_parquet(parquet_path)['img_name']) == sorted(names)
+
+def test_iter_vol_est_stops_early(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_vol_est_main, 'ProcessPoolExecutor', _RecordingExecutor)
+    _RecordingExecutor.futures = []
+    names, predictions = _stream_inputs()
+    csv_path = str(tmp_path / 'results.csv')
+
+    with CsvResultSink(csv_path) as sink:
+        records = process_vol_est_main.iter_vol_est(names, predictions, 0.01, 3, 50, sinks=[sink], max_workers=2, max_in_flight=1)
+        for record in records:
+            break
+        records.close()
+
+    # The remaining images were not queued, nothing is left running
+    assert record['img_name'] == names[0]
+    assert len(_RecordingExecutor.futures) <= 2 and all(future.done() for future in _RecordingExecutor.futures)
+    assert list(pd.read_csv(csv_path)['img_name']) == [names[0]]
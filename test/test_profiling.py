@@ -0,0 +1,50 @@
+import tracemalloc
+
+import numpy as np
+
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import profiling, synthetic_specimens
+
+
+def test_stage_profiler_records_all_stages():
+    specimens = [synthetic_specimens.ellipsoid_chain(640, 480), synthetic_specimens.curved_tube(640, 480)]
+    calls = []
+    profiler = profiling.StageProfiler(callbacks=[lambda stage, duration, img_name: calls.append((stage, img_name))], capture_image=1)
+
+    process_vol_est_main.all_vol_est_main([s.name for s in specimens], [[s.to_results()] for s in specimens], 0.01, 3, 50, profiler=profiler)
+
+    assert profiler.num_images == 2
+    assert list(profiler.summary().index) == profiling.PIPELINE_STAGES
+    assert all(len(durations) == 2 for durations in profiler.durations.values())
+    assert calls[0] == ('rasterization', specimens[0].name)
+    assert calls[-1] == ('length', specimens[1].name)
+    assert profiler.profile_stats is not None and profiler.memory_peak_bytes > 0
+
+    counts, edges = profiler.histograms(bins=5)['slicing']
+    assert counts.sum() == 2 and len(edges) == 6
+    assert 'Stage latencies over 2 image(s)' in profiler.report()
+
+def test_stage_recorder_forwards_worker_timings():
+    specimen = synthetic_specimens.curved_tube(640, 480)
+    recorder = profiling.StageRecorder()
+    process_vol_est_main.vol_est_single_image(specimen.name, [specimen.to_results()], specimen.labels, 0.01, 3, 50, profiler=recorder)
+
+    profiler = profiling.StageProfiler()
+    profiler.record_image(specimen.name, recorder.records)
+    assert [stage for stage, _ in recorder.records] == profiling.PIPELINE_STAGES
+    assert profiler.num_images == 1
+
+def test_capture_keeps_running_trace():
+    specimen = synthetic_specimens.ellipsoid_chain(640, 480)
+    profiler = profiling.StageProfiler(capture_image=0)
+    tracemalloc.start()
+    try:
+        allocated_before = np.ones(8 * 1024**2)  # 64 MB
+        with profiling.image(profiler, specimen.name):
+            process_vol_est_main.vol_est_single_image(specimen.name, [specimen.to_results()], specimen.labels, 0.01, 3, 50, profiler=profiler)
+        # The trace of the caller still knows its earlier allocations
+        assert tracemalloc.is_tracing() and tracemalloc.get_object_traceback(allocated_before) is not None
+        # Only the allocations of the image count
+        assert 0 < profiler.memory_peak_bytes < 32 * 1024**2
+    finally:
+        tracemalloc.stop()
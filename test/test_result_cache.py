@@ -0,0 +1,107 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import synthetic_specimens
+from vol_est_yolov8.utils.result_cache import ResultCache
+
+
+def _inputs():
+    specimens = [synthetic_specimens.ellipsoid_chain(640, 480), synthetic_specimens.curved_tube(640, 480)]
+    return [s.name for s in specimens], [[s.to_results()] for s in specimens]
+
+def test_rerun_is_served_from_cache(tmp_path):
+    names, predictions = _inputs()
+    cache = ResultCache(str(tmp_path), model_weights='yolov8-test')
+
+    df_first, _ = process_vol_est_main.all_vol_est_main(names, predictions, 0.01, 3, 50, cache=cache)
+    df_second, first_res = process_vol_est_main.all_vol_est_main(names, predictions, 0.01, 3, 50, cache=cache)
+    pd.testing.assert_frame_equal(df_first, df_second)
+    assert first_res['img_np'] is not None and len(first_res['fitted_points']) > 0
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 2 and cache.stats()['entries'] == 2
+
+    # Changed parameters, model or polygons are new entries
+    process_vol_est_main.all_vol_est_main(names, predictions, 0.02, 3, 50, cache=cache)
+    assert cache.stats()['entries'] == 4
+    other_model = ResultCache(str(tmp_path), model_weights='yolov8-other')
+    assert other_model.key(predictions[0][0], {}) != cache.key(predictions[0][0], {})
+
+    records = list(process_vol_est_main.iter_vol_est(names, predictions, 0.01, 3, 50, cache=cache))
+    assert cache.hits == 4
+    assert np.isclose(records[1]['total_volume'], df_first['total_volume'][1])
+
+def test_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=None)
+    for i in range(4):
+        cache.put(f'key{i}', (pd.DataFrame({'total_volume': [i]}), {'lines': [np.zeros(100)]}))
+        os.utime(cache._path(f'key{i}'), (i, i))
+    assert cache.get('key0') is not None  # key0 is the most recently used entry now
+
+    entry_bytes = os.path.getsize(cache._path('key0'))
+    cache.evict(2 * entry_bytes)
+    assert sorted(os.listdir(tmp_path)) == ['key0.pkl', 'key3.pkl']
+    assert cache.get('key1') is None
+    assert cache.stats()['evictions'] == 2 and cache.stats()['hit_rate'] == 0.5
+
+def test_empty_prediction_in_parallel_batch(tmp_path):
+    names, predictions = _inputs()
+    empty = synthetic_specimens.curved_tube(640, 480).to_results()
+    empty.masks = None
+    cache = ResultCache(str(tmp_path))
+    assert cache.key(empty, {}) != cache.key(predictions[1][0], {})
+
+    df_vol_res, _ = process_vol_est_main.all_vol_est_main_parallel([names[0], 'empty', names[1]], [predictions[0], [empty], predictions[1]], 0.01, 3, 50, max_workers=2, cache=cache)
+    assert len(df_vol_res) == 3
+    assert df_vol_res['error'][[0, 2]].isna().all()
+    assert cache.stats()['entries'] == 2
+
+def test_size_is_tracked_without_scanning(tmp_path, monkeypatch):
+    value = (pd.DataFrame({'total_volume': [0]}), {'lines': [np.zeros(100)]})
+    cache = ResultCache(str(tmp_path), max_bytes=10**6)
+    scans = []
+    original_entries = cache._entries
+    def entries():
+        scans.append(1)
+        return original_entries()
+    monkeypatch.setattr(cache, '_entries', entries)
+
+    for i in range(5):
+        cache.put(f'key{i}', value)
+    assert not scans and cache.size_bytes == 5 * os.path.getsize(cache._path('key0'))
+
+    # Over the limit: a single eviction down to the low-water mark
+    cache.max_bytes = 4 * os.path.getsize(cache._path('key0'))
+    cache.put('key5', value)
+    cache.put('key6', value)
+    assert len(scans) == 1 and len(os.listdir(tmp_path)) == 4
+    assert cache.size_bytes == sum(os.path.getsize(os.path.join(tmp_path, name)) for name in os.listdir(tmp_path))
+
+def test_slicing_methods_are_separate_entries(tmp_path):
+    names, predictions = _inputs()
+    cache = ResultCache(str(tmp_path))
+    process_vol_est_main.all_vol_est_main(names[:1], predictions[:1], 0.01, 3, 50, cache=cache)
+    df_polygon, _ = process_vol_est_main.all_vol_est_main(names[:1], predictions[:1], 0.01, 3, 50, cache=cache, slicing_method='polygon')
+    assert cache.hits == 0 and cache.stats()['entries'] == 2
+
+    records = list(process_vol_est_main.iter_vol_est(names[:1], predictions[:1], 0.01, 3, 50, cache=cache, slicing_method='polygon'))
+    assert cache.hits == 1 and records[0]['total_volume'] == df_polygon['total_volume'][0]
+
+def test_unreadable_entries_are_misses(tmp_path):
+    names, predictions = _inputs()
+    cache = ResultCache(str(tmp_path))
+    process_vol_est_main.all_vol_est_main(names, predictions, 0.01, 3, 50, cache=cache)
+    first_path, second_path = [os.path.join(tmp_path, name) for name in sorted(os.listdir(tmp_path))]
+
+    # A truncated entry and a stale entry that refers to a module that does not exist anymore
+    with open(first_path, 'wb') as f:
+        f.write(b'\x80\x05')
+    with open(second_path, 'wb') as f:
+        f.write(b'cremoved_module\nOld\n.')
+
+    df_vol_res, _ = process_vol_est_main.all_vol_est_main_parallel(names, predictions, 0.01, 3, 50, max_workers=1, cache=cache)
+    assert df_vol_res['error'].isna().all()
+    assert cache.misses == 4 and cache.hits == 0
+    # The unreadable entries were replaced by new ones
+    assert cache.get(os.path.basename(first_path)[:-4]) is not None and cache.get(os.path.basename(second_path)[:-4]) is not None
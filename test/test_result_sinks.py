@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from vol_est_yolov8.utils.result_sinks import CsvResultSink, JsonLinesResultSink, ParquetResultSink
+
+RECORDS = [
+    {'img_name': 'a.png', 'total_volume': np.float64(1.5), 'volume_head': np.nan, 'error': None},
+    {'img_name': 'b.png', 'total_volume': None, 'volume_head': None, 'error': 'ValueError: no masks'},
+]
+
+def test_csv_sink_appends_without_second_header(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    for _ in range(2):
+        with CsvResultSink(path) as sink:
+            for record in RECORDS:
+                sink.write(record)
+    df = pd.read_csv(path)
+    assert list(df.columns) == list(RECORDS[0].keys())
+    assert len(df) == 4
+    assert df['total_volume'].iloc[0] == 1.5
+
+def test_json_lines_sink_writes_one_object_per_line(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    with JsonLinesResultSink(path) as sink:
+        for record in RECORDS:
+            sink.write(record)
+    lines = [json.loads(line) for line in open(path)]
+    assert lines[0]['volume_head'] is None
+    assert lines[1]['error'] == 'ValueError: no masks'
+
+def test_parquet_sink_writes_row_groups(tmp_path):
+    pytest.importorskip('pyarrow')
+    path = str(tmp_path / 'results')
+    with ParquetResultSink(path, row_group_size=1) as sink:
+        for record in RECORDS:
+            sink.write(record)
+    df = pd.read_parquet(path)
+    assert len(df) == 2
+    assert set(df['img_name']) == {'a.png', 'b.png'}
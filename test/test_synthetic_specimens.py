@@ -0,0 +1,24 @@
+import numpy as np
+
+from vol_est_yolov8 import process_vol_est_main
+from vol_est_yolov8.utils import synthetic_specimens
+
+
+def _polygon_area(polygon):
+    x, y = polygon[:, 0], polygon[:, 1]
+    return 0.5 * abs(np.dot(x, np.roll(y, 1)) - np.dot(y, np.roll(x, 1)))
+
+def test_ellipsoid_chain_projection_matches_ground_truth():
+    specimen = synthetic_specimens.ellipsoid_chain(width=1280, height=960, num_segments=4, num_vertices=400)
+    for i_cls, polygon in enumerate(specimen.polygons):
+        length = specimen.lengths_px[f'segment_{i_cls}']
+        # Projected ellipse area pi * a * b with b from the volume 4/3 * pi * a * b^2
+        radius = np.sqrt(specimen.volumes_px[f'segment_{i_cls}'] / (4 / 3 * np.pi * length / 2))
+        np.testing.assert_allclose(_polygon_area(polygon), np.pi * length / 2 * radius, rtol=1e-3)
+
+def test_pipeline_length_on_curved_tube():
+    specimen = synthetic_specimens.curved_tube(width=1280, height=960, num_segments=3)
+    ground_truth = specimen.ground_truth(k_mm_per_px=0.01)
+    df_vol_res, _ = process_vol_est_main.all_vol_est_main([specimen.name], [[specimen.to_results()]], 0.01, 3, 150)
+    assert set(ground_truth) <= set(df_vol_res.columns)
+    np.testing.assert_allclose(df_vol_res['total_length'][0], ground_truth['total_length'], rtol=0.05)
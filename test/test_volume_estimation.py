@@ -0,0 +1,26 @@
+import numpy as np
+
+from vol_est_yolov8.length_estimation.volume_estimation import VolumeEstimator, ArrayVolumeEstimator, lines_to_endpoints, stack_endpoints, calculate_volumes_batch
+
+
+def _random_lines(rng, num_lines):
+    lines = []
+    for _ in range(num_lines):
+        num_points = rng.integers(0, 3) if rng.random() < 0.1 else rng.integers(2, 100)
+        lines.append([(float(x), int(y)) for x, y in zip(rng.random(num_points) * 500, rng.integers(0, 500, num_points))])
+    return lines
+
+def test_array_estimator_matches_line_estimator():
+    rng = np.random.default_rng(0)
+    lines = {'head': _random_lines(rng, 30), 'thorax': _random_lines(rng, 45), 'abdomen': []}
+    expected = VolumeEstimator(lines, 1.7, k_conv_factor=0.003).calculate_volume_in_mm_3(round_to=9)
+
+    endpoints = {seg: lines_to_endpoints(seg_lines) for seg, seg_lines in lines.items()}
+    assert ArrayVolumeEstimator(endpoints, 1.7, k_conv_factor=0.003).calculate_volume_in_mm_3(round_to=9) == expected
+
+def test_batch_volumes_of_stacked_specimens():
+    # Cylinder of diameter 2 and length 3 (4 lines, h=1) and a single line without volume
+    cylinder = [[(0, y), (2, y)] for y in range(4)]
+    endpoints = stack_endpoints([lines_to_endpoints(cylinder), lines_to_endpoints(cylinder[:1])])
+    volumes = calculate_volumes_batch(endpoints, h=1.0)
+    np.testing.assert_allclose(volumes, [3 * np.pi, 0.0])
@@ -1,3 +1,8 @@
+import logging
+
+# Library default: no log output unless the application configures logging (see utils.log.set_verbosity)
+logging.getLogger(__name__).addHandler(logging.NullHandler())
+
 from . import plotting
 from . import utils
 from . import length_estimation
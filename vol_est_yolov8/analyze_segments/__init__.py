@@ -1,3 +1,5 @@
 from . import xyn_to_bin_mask
 from . import segment_extractors
-from . import calc_2d_cog_binary_mask
\ No newline at end of file
+from . import calc_2d_cog_binary_mask
+from . import label_map
+from . import polygon_stats
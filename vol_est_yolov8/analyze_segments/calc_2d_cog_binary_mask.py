@@ -1,19 +1,24 @@
 import numpy as np
 import torch
+import cv2
 
-def compute_2d_cog(binary_mask: np.ndarray) -> tuple:
+from vol_est_yolov8.analyze_segments import polygon_stats
+
+def compute_2d_cog(binary_mask: np.ndarray, validate: bool = True) -> tuple:
     """
     Compute the 2D center of gravity from a binary mask.
     
     Parameters:
     binary_mask (np.ndarray): 2D binary mask with 1s representing the object and 0s the background.
+    validate (bool): Check that the mask only contains 0 and 1 (an additional pass over the whole mask).
     
     Returns:
     tuple: (x_cog, y_cog) coordinates of the center of gravity.
     """
     # Ensure the input is a binary mask
     assert binary_mask.ndim == 2, "Input should be a 2D array"
-    assert np.isin(binary_mask, [0, 1]).all(), "Input should be a binary mask"
+    if validate:
+        assert np.isin(binary_mask, [0, 1]).all(), "Input should be a binary mask"
     
     # Get the indices where the binary mask is 1
     y, x = np.where(binary_mask == 1)
@@ -25,7 +30,7 @@ def compute_2d_cog(binary_mask: np.ndarray) -> tuple:
     return (x_cog, y_cog)
 
 
-def compute_cogs(masks: list, all_cls: torch.Tensor, label: dict) -> dict:
+def compute_cogs(masks: list, all_cls: torch.Tensor, label: dict, validate: bool = True) -> dict:
     """
     Compute the 2D center of gravity for a list of binary masks and their combinations.
     
@@ -33,6 +38,7 @@ def compute_cogs(masks: list, all_cls: torch.Tensor, label: dict) -> dict:
     masks (list): List of 2D binary masks with 1s representing the object and 0s the background.
     all_cls (list): List of class IDs corresponding to each mask.
     label (dict): Dictionary mapping class IDs to class labels.
+    validate (bool): Check that every mask is binary, see compute_2d_cog.
     
     Returns:
     dict: Dictionary with class labels as keys and (x_cog, y_cog) as values.
@@ -40,15 +46,85 @@ def compute_cogs(masks: list, all_cls: torch.Tensor, label: dict) -> dict:
     cogs = {}
     combined_masks = {}
 
-    all_cls = list(all_cls.numpy())
+    all_cls = np.asarray(all_cls).tolist()
 
     # Compute CoG for each mask and save it with the class label as key
     for mask, cls in zip(masks, all_cls):
-        cogs[str(int(cls))] = compute_2d_cog(mask)
+        cogs[str(int(cls))] = compute_2d_cog(mask, validate=validate)
     
     return cogs
 
 
+def compute_cogs_from_label_map(label_map: np.ndarray, all_cls: torch.Tensor) -> dict:
+    """
+    Compute the 2D center of gravity per class from a label map (see analyze_segments.label_map).
+
+    In contrast to compute_cogs all instances of a class contribute to its CoG and pixels covered by
+    several instances only count for the instance that was drawn last.
+
+    Parameters:
+    label_map (np.ndarray): 2D label map, pixel value = class ID + 1, 0 = background.
+    all_cls (list): List of class IDs of the instances, defines the order of the returned dict.
+
+    Returns:
+    dict: Dictionary with class IDs (str) as keys and (x_cog, y_cog) as values.
+    """
+    cogs = {}
+    for cls in np.asarray(all_cls).tolist():
+        key = str(int(cls))
+        if key in cogs:
+            continue
+        moments = cv2.moments((label_map == int(cls) + 1).view(np.uint8), binaryImage=True)
+        if moments['m00'] == 0:
+            cogs[key] = (np.nan, np.nan)
+        else:
+            cogs[key] = (moments['m10'] / moments['m00'], moments['m01'] / moments['m00'])
+
+    return cogs
+
+
+def compute_cogs_from_polygons(polygons: list, all_cls: torch.Tensor) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the 2D center of gravity per class from the moments of the mask polygons (no rasterization).
+
+    All instances of a class contribute to its CoG weighted by their area. This differs from compute_cogs,
+    which returns the CoG of the last instance if a class occurs several times. The CoG of a class whose
+    polygons have no area (less than 3 distinct vertices) is the mean of its vertices. Self-intersecting
+    polygons are not rasterized, their moments are the (shoelace) moments of cv2.moments.
+
+    Parameters:
+    polygons (list): List of (N, 2) polygons in pixel coordinates, one per instance.
+    all_cls (list): List of class IDs corresponding to each polygon.
+
+    Returns:
+    np.ndarray: (num_classes, 2) CoGs (x_cog, y_cog), classes in order of their first appearance in all_cls.
+    np.ndarray: Class ID of each row.
+    """
+    all_cls = np.asarray(all_cls).astype(int)
+    class_ids, first_idx, inverse = np.unique(all_cls, return_index=True, return_inverse=True)
+    if len(all_cls) == 0:
+        return np.empty((0, 2)), class_ids
+
+    # Area and centroid of all polygons in one pass (see polygon_stats), self-intersecting polygons keep their shoelace moments
+    stats = polygon_stats.polygon_stats(polygons, check_self_intersection=False)
+    moments = np.column_stack((stats['area'], stats['area'][:, np.newaxis] * stats['centroid']))
+    counts = np.array([len(np.asarray(polygon).reshape(-1, 2)) for polygon in polygons], dtype=float)
+    vertex_sums = np.column_stack((counts, np.nan_to_num(counts[:, np.newaxis] * stats['centroid'])))
+
+    class_moments = np.zeros((len(class_ids), 3))
+    class_vertex_sums = np.zeros((len(class_ids), 3))
+    np.add.at(class_moments, inverse.ravel(), moments)
+    np.add.at(class_vertex_sums, inverse.ravel(), vertex_sums)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cogs = np.where(class_moments[:, :1] > 0,
+                        class_moments[:, 1:] / class_moments[:, :1],
+                        class_vertex_sums[:, 1:] / class_vertex_sums[:, :1])
+
+    order = np.argsort(first_idx, kind='stable')
+    return cogs[order], class_ids[order]
+
+
 if __name__ == "__main__":
     # Example binary mask: a 10x10 array with a 4x4 square of 1s at the center
     example_mask = np.zeros((10, 10), dtype=int)
@@ -0,0 +1,53 @@
+import numpy as np
+import cv2
+from typing import Optional
+
+from vol_est_yolov8.analyze_segments.xyn_to_bin_mask import xyn_to_px
+
+def xyn_to_label_map(xyn_s:list[np.ndarray], all_cls, w:int, h:int, image:np.ndarray, roi:Optional[tuple]=None) -> np.ndarray:
+    '''
+    Rasterize all normalized mask polygons into a single label map.
+    Each pixel holds the class ID + 1 of the instance covering it, 0 is background.
+    If instances overlap, the later instance (order of xyn_s) wins.
+
+    Parameters:
+        xyn_s: List of (N, 2) normalized polygons
+        all_cls: Class ID of each polygon (torch.Tensor, np.ndarray or list)
+        w: image width
+        h: image height
+        roi: (x_min, y_min, x_max, y_max) region of the image the label map is cropped to (see utils_vol_estimation.get_roi).
+            If None, the label map has the full image size.
+    '''
+    if roi is None:
+        roi = (0, 0, image.shape[1], image.shape[0])
+    x_min, y_min, x_max, y_max = roi
+
+    label_values = [int(i_cls) + 1 for i_cls in np.asarray(all_cls).tolist()]
+    dtype = np.uint8 if max(label_values, default=0) <= np.iinfo(np.uint8).max else np.uint16
+    label_map = np.zeros((y_max - y_min, x_max - x_min), dtype=dtype)
+
+    for xyn, label_value in zip(xyn_s, label_values):
+        mask_points = xyn_to_px(xyn, w, h) - np.array([x_min, y_min], dtype=np.int32)
+        cv2.fillPoly(label_map, [mask_points], label_value)
+
+    return label_map
+
+def get_label_names(all_cls, labels:dict) -> dict:
+    '''
+    Label map value -> segment name of all classes present in all_cls (in the order of labels).
+    Example: {1: 'dog', 3: 'umbrella'}
+    '''
+    present_cls = {int(i_cls) for i_cls in np.asarray(all_cls).tolist()}
+    return {i_cls + 1: name for i_cls, name in labels.items() if i_cls in present_cls}
+
+def label_map_to_mask(label_map:np.ndarray, label_value:int) -> np.ndarray:
+    '''
+    Binary (uint8) mask of a single segment. The mask is a view on the comparison result, no additional copy.
+    '''
+    return (label_map == label_value).view(np.uint8)
+
+def label_map_to_masks(label_map:np.ndarray, label_names:dict) -> dict:
+    '''
+    Binary mask per segment, same format as utils_vol_estimation.get_binary_masks: {segment name: mask}
+    '''
+    return {name: label_map_to_mask(label_map, label_value) for label_value, name in label_names.items()}
@@ -0,0 +1,195 @@
+'''
+Area, centroid and extents of the mask polygons (masks.xyn of the YOLO output) without rasterization.
+
+The statistics of all polygons are computed in one vectorized pass over their concatenated vertices (shoelace formula).
+Only polygons whose edges cross each other (the shoelace area of a self-intersecting polygon is not its covered area)
+are rasterized as fallback, within their bounding box.
+
+The shoelace area is the area enclosed by the polygon. The pixel count of the rasterized mask (SegmentArea.calculate_area)
+also includes the pixels on the boundary, i.e. it is larger by about half the perimeter.
+'''
+
+import numpy as np
+import cv2
+
+from vol_est_yolov8.analyze_segments.xyn_to_bin_mask import xyn_to_px
+
+
+def _concat_polygons(polygons: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Returns:
+        vertices: (V, 2) vertices of all polygons
+        next_idx: (V,) index of the next vertex of the same polygon (closing edge included)
+        polygon_idx: (V,) index of the polygon of every vertex
+    '''
+    polygons = [np.asarray(polygon, dtype=float).reshape(-1, 2) for polygon in polygons]
+    counts = np.array([len(polygon) for polygon in polygons], dtype=np.intp)
+    if counts.sum() == 0:
+        return np.empty((0, 2)), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    vertices = np.concatenate(polygons)
+    polygon_idx = np.repeat(np.arange(len(polygons)), counts)
+    starts = np.cumsum(counts) - counts
+    next_idx = np.arange(len(vertices)) + 1
+    # The last vertex of every polygon is connected to its first one
+    last = starts[counts > 0] + counts[counts > 0] - 1
+    next_idx[last] = starts[counts > 0]
+    return vertices, next_idx, polygon_idx
+
+def self_intersecting(polygons: list) -> np.ndarray:
+    '''
+    Check for every polygon whether two of its non-adjacent edges cross (touching edges do not count).
+
+    Only edge pairs with overlapping x-ranges are tested: the edges are sorted by their minimal x (per polygon)
+    and every edge is paired with the following edges that start before it ends.
+
+    Returns:
+        (P,) boolean array
+    '''
+    vertices, next_idx, polygon_idx = _concat_polygons(polygons)
+    result = np.zeros(len(polygons), dtype=bool)
+    if len(vertices) < 4:
+        return result
+    starts, ends = vertices, vertices[next_idx]
+    x_min = np.minimum(starts[:, 0], ends[:, 0])
+    x_max = np.maximum(starts[:, 0], ends[:, 0])
+
+    # Sort by polygon and minimal x, a shift per polygon keeps the polygons apart in one sorted key
+    shift = polygon_idx * (x_max.max() - x_min.min() + 1)
+    order = np.argsort(x_min + shift, kind='stable')
+    key = (x_min + shift)[order]
+    end = np.searchsorted(key, (x_max + shift)[order], side='right')
+
+    # Candidate pairs (i, j) with i < j < end_i in sorted order
+    num_candidates = np.maximum(end - np.arange(len(order)) - 1, 0)
+    first = np.repeat(np.arange(len(order)), num_candidates)
+    second = first + 1 + np.arange(num_candidates.sum()) - np.repeat(np.cumsum(num_candidates) - num_candidates, num_candidates)
+    i, j = order[first], order[second]
+
+    # Edges sharing a vertex are adjacent
+    not_adjacent = (next_idx[i] != j) & (next_idx[j] != i)
+    y_overlap = (np.minimum(starts[i, 1], ends[i, 1]) <= np.maximum(starts[j, 1], ends[j, 1])) & \
+                (np.minimum(starts[j, 1], ends[j, 1]) <= np.maximum(starts[i, 1], ends[i, 1]))
+    keep = not_adjacent & y_overlap
+    i, j = i[keep], j[keep]
+
+    def orientation(a, b, c):
+        return (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0])
+
+    crossing = (orientation(starts[i], ends[i], starts[j]) * orientation(starts[i], ends[i], ends[j]) < 0) & \
+               (orientation(starts[j], ends[j], starts[i]) * orientation(starts[j], ends[j], ends[i]) < 0)
+    result[np.unique(polygon_idx[i[crossing]])] = True
+    return result
+
+def _raster_stats(polygon: np.ndarray) -> tuple[float, np.ndarray]:
+    'Pixel count and centroid of the polygon filled within its bounding box (same pixels as xyn_to_bin_mask)'
+    points = polygon.astype(np.int32)
+    x, y, w, h = cv2.boundingRect(points)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    cv2.fillPoly(mask, [points - np.array([x, y], dtype=np.int32)], 1)
+    moments = cv2.moments(mask, binaryImage=True)
+    if moments['m00'] == 0:
+        return 0.0, polygon.mean(axis=0)
+    return moments['m00'], np.array([moments['m10'] / moments['m00'] + x, moments['m01'] / moments['m00'] + y])
+
+def polygon_stats(polygons: list, check_self_intersection: bool = True) -> dict:
+    '''
+    Area, centroid and bounding box of all polygons at once.
+
+    Parameters:
+        polygons: List of (N, 2) polygons in pixel coordinates, one per instance.
+        check_self_intersection: Rasterize the polygons with crossing edges (see self_intersecting).
+            If False, the shoelace result is used for all polygons.
+
+    Returns:
+        dict with
+            'area': (P,) enclosed area [px^2] (pixel count for rasterized polygons)
+            'centroid': (P, 2) centroid (x, y), mean of the vertices for polygons without area
+            'bbox': (P, 4) x_min, y_min, x_max, y_max of the vertices (NaN for empty polygons)
+            'rasterized': (P,) True if the values of the polygon come from the raster fallback
+    '''
+    num_polygons = len(polygons)
+    vertices, next_idx, polygon_idx = _concat_polygons(polygons)
+    x, y = vertices[:, 0], vertices[:, 1]
+    x_next, y_next = x[next_idx], y[next_idx]
+
+    # Shoelace: signed doubled area and first moments per polygon
+    cross = x * y_next - x_next * y
+    area2 = np.bincount(polygon_idx, cross, minlength=num_polygons)
+    moment_x = np.bincount(polygon_idx, (x + x_next) * cross, minlength=num_polygons)
+    moment_y = np.bincount(polygon_idx, (y + y_next) * cross, minlength=num_polygons)
+    counts = np.bincount(polygon_idx, minlength=num_polygons)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        vertex_mean = np.column_stack((np.bincount(polygon_idx, x, minlength=num_polygons),
+                                       np.bincount(polygon_idx, y, minlength=num_polygons))) / counts[:, np.newaxis]
+        centroid = np.where(area2[:, np.newaxis] != 0, np.column_stack((moment_x, moment_y)) / (3 * area2[:, np.newaxis]), vertex_mean)
+    area = np.abs(area2) / 2
+
+    bbox = np.full((num_polygons, 4), np.nan)
+    non_empty = counts > 0
+    if non_empty.any():
+        starts = (np.cumsum(counts) - counts)[non_empty]
+        bbox[non_empty, :2] = np.minimum.reduceat(vertices, starts, axis=0)
+        bbox[non_empty, 2:] = np.maximum.reduceat(vertices, starts, axis=0)
+
+    rasterized = self_intersecting(polygons) if check_self_intersection else np.zeros(num_polygons, dtype=bool)
+    for i in np.flatnonzero(rasterized):
+        area[i], centroid[i] = _raster_stats(np.asarray(polygons[i], dtype=float).reshape(-1, 2))
+
+    return {'area': area, 'centroid': centroid, 'bbox': bbox, 'rasterized': rasterized}
+
+def polygon_stats_from_xyn(xyn_s: list, w: int, h: int, check_self_intersection: bool = True) -> dict:
+    '''
+    polygon_stats of normalized mask polygons (masks.xyn) in the pixel coordinates of xyn_to_bin_mask.
+
+    Parameters:
+        xyn_s: List of (N, 2) normalized polygons
+        w: image width
+        h: image height
+    '''
+    return polygon_stats([xyn_to_px(np.asarray(xyn), w, h) for xyn in xyn_s], check_self_intersection=check_self_intersection)
+
+
+class PolygonSegmentArea:
+    def __init__(self, polygon: np.ndarray, area: float = None, centroid: np.ndarray = None, bbox: np.ndarray = None):
+        """
+        Area of a segment given by its mask polygon, can be used instead of SegmentArea (e.g. in segment_area_comparison).
+
+        Parameters:
+        - polygon: (N, 2) polygon in pixel coordinates.
+        - area, centroid, bbox: Precomputed values (see polygon_stats), computed from the polygon if None.
+        """
+        self.polygon = np.asarray(polygon, dtype=float).reshape(-1, 2)
+        if area is None or centroid is None or bbox is None:
+            stats = polygon_stats([self.polygon])
+            area, centroid, bbox = stats['area'][0], stats['centroid'][0], stats['bbox'][0]
+        self.area = area
+        self.centroid = centroid
+        self.bbox = bbox
+
+    def calculate_area(self):
+        """
+        Calculate the area of the segment.
+        """
+        return self.area
+
+    @classmethod
+    def from_xyn(cls, xyn_s: list, all_cls, labels: dict, w: int, h: int) -> dict:
+        """
+        Segment areas of all instances of a prediction, with the statistics of all polygons computed in one call.
+
+        Parameters:
+        - xyn_s: Normalized mask polygons (masks.xyn).
+        - all_cls: Class ID of every polygon (boxes.cls).
+        - labels: Class labels of the model (names).
+        - w, h: Image width and height.
+
+        Returns:
+        dict: Class label -> list of PolygonSegmentArea, as expected by segment_area_comparison.
+        """
+        polygons = [xyn_to_px(np.asarray(xyn), w, h) for xyn in xyn_s]
+        stats = polygon_stats(polygons)
+        segment_areas = {}
+        for i, class_id in enumerate(np.asarray(all_cls).tolist()):
+            segment = cls(polygons[i], stats['area'][i], stats['centroid'][i], stats['bbox'][i])
+            segment_areas.setdefault(labels[int(class_id)], []).append(segment)
+        return segment_areas
@@ -17,6 +17,14 @@ class BaseSegmentExtractor(ABC):
         self.image = image
         self.mask = mask
 
+    @classmethod
+    def from_label_map(cls, image, label_map: np.ndarray, label_value: int):
+        """
+        Create the extractor for one segment of a label map (see analyze_segments.label_map).
+        The image must have the same size as the label map (i.e. be cropped to the same ROI).
+        """
+        return cls(image, (label_map == label_value).view(np.uint8))
+
     @abstractmethod
     def _extract_segment(self):
         """
@@ -1,8 +1,23 @@
 import torch
 import numpy as np
 import cv2
+from typing import Optional
 
-def xyn_to_bin_mask(xyn_s:list[np.ndarray], w:int, h:int, image:np.ndarray) -> list[np.ndarray]:
+def xyn_to_px(xyn: np.ndarray, w: int, h: int) -> np.ndarray:
+    '''
+    Denormalize a mask polygon to (integer) pixel coordinates.
+
+    Parameters:
+        xyn: (N, 2) normalized polygon
+        w: image width
+        h: image height
+    '''
+    mask_points = xyn.copy()
+    mask_points[:, 0] *= w
+    mask_points[:, 1] *= h
+    return mask_points.astype(np.int32)
+
+def xyn_to_bin_mask(xyn_s:list[np.ndarray], w:int, h:int, image:np.ndarray, roi:Optional[tuple]=None) -> list[np.ndarray]:
     '''
     Convert a normalized mask to a binary mask.
 
@@ -10,16 +25,20 @@ def xyn_to_bin_mask(xyn_s:list[np.ndarray], w:int, h:int, image:np.ndarray) -> l
         xyn: (N, 2) torch.tensor
         w: image width
         h: image height
+        roi: (x_min, y_min, x_max, y_max) region of the image the binary masks are cropped to (see utils_vol_estimation.get_roi).
+            If None, the masks have the full image size.
     '''       
+    if roi is None:
+        roi = (0, 0, image.shape[1], image.shape[0])
+    x_min, y_min, x_max, y_max = roi
+
     bin_masks = []
     for xyn in xyn_s:
-        mask_points = xyn.copy()
-        mask_points[:, 0] *= w
-        mask_points[:, 1] *= h
+        mask_points = xyn_to_px(xyn, w, h) - np.array([x_min, y_min], dtype=np.int32)
 
         # Convert denormalized mask points to a binary mask
-        mask = np.zeros(image.shape[:2], dtype=np.uint8)
-        cv2.fillPoly(mask, [mask_points.astype(np.int32)], 1)
+        mask = np.zeros((y_max - y_min, x_max - x_min), dtype=np.uint8)
+        cv2.fillPoly(mask, [mask_points], 1)
         bin_masks.append(mask)
 
     return bin_masks
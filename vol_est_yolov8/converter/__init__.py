@@ -1,2 +1,3 @@
 from . import converter_result_to_json
-from . import converter_annotation
\ No newline at end of file
+from . import converter_annotation
+from . import converter_result_to_arrays
\ No newline at end of file
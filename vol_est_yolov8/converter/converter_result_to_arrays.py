@@ -0,0 +1,49 @@
+import numpy as np
+import torch
+
+
+class ResultsArrayConverter:
+    def __init__(self, results, labels: dict = None):
+        """
+        Convert a Results object directly to the arrays used by the volume estimation.
+
+        In contrast to ResultsConverter + AnnotationConverter there is no LabelMe JSON round trip
+        (no int-rounded point lists that are normalized again) and the image is not decoded a second time.
+        The rasterization is unchanged: xyn_to_bin_mask truncates the polygons to integer pixels like the JSON path.
+
+        Parameters:
+        - results: An instance of ultralytics.engine.results.Results
+        - labels: Dictionary with class labels. Default: results.names
+            Example: {0: 'dog', 1: 'bicycle', 2: 'umbrella'}
+        """
+        self.results = results
+        self.labels = labels if labels is not None else results.names
+
+    def get_image(self) -> np.ndarray:
+        """
+        Return the original image as RGB array (same channel order as the PIL based loaders).
+        Note: This is a view on Results.orig_img (BGR), not a copy.
+        """
+        return self.results.orig_img[..., ::-1]
+
+    def load(self):
+        """
+        Same return values as AnnotationLoader.load(). The masks are the normalized polygons
+        (masks.xyn) of the Results object and are not copied. Instead of a PIL image None is returned.
+        """
+        img_np = self.get_image()
+
+        if self.results.masks is None:
+            # No detections in this image
+            masks, all_cls, boxes, scores = [], torch.Tensor([]), [], []
+        else:
+            masks = self.results.masks.xyn
+            all_cls = self.results.boxes.cls.cpu()
+            boxes = self.results.boxes.xyxy.cpu().numpy()
+            scores = self.results.boxes.conf.cpu().numpy()
+
+        mask_w_label = {key: [] for key in self.labels.values()}
+        for mask, i_cls in zip(masks, all_cls.tolist()):
+            mask_w_label[self.labels[int(i_cls)]].append(mask)
+
+        return img_np, None, boxes, masks, scores, all_cls, mask_w_label, self.labels
@@ -4,4 +4,5 @@ from . import orthogonal_slicer
 from . import point_orderer
 from . import line_refiner
 from . import combine_masks
-from . import extract_skeleton_w_cogs
\ No newline at end of file
+from . import extract_skeleton_w_cogs
+from . import polygon_slicer
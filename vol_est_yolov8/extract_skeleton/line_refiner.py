@@ -1,7 +1,10 @@
 import numpy as np
+import scipy.signal
 import scipy.stats
 import matplotlib.pyplot as plt
 
+from vol_est_yolov8.utils.geometry import row_norms
+
 
 class GraphRefiner:
     
@@ -9,41 +12,64 @@ class GraphRefiner:
         self.control_points = control_points
         self.scatter_points = scatter_points
         self.density_map = self.compute_density_map()
+        self.density_gradient = self.compute_density_gradient()
+        self.gradient_field = np.stack(self.density_gradient)  # (2, grid_size, grid_size) to interpolate both components at once
         self.refined_points = self.refine_endpoints(iterations=iterations, alpha=alpha)
     
     def compute_density_map(self, grid_size=100):
-        """Compute a 2D density map using gaussian KDE."""
-        kde = scipy.stats.gaussian_kde(np.array(self.scatter_points).T)
-        x_grid = np.linspace(min(np.array(self.scatter_points)[:,0]), max(np.array(self.scatter_points)[:,0]), grid_size)
-        y_grid = np.linspace(min(np.array(self.scatter_points)[:,1]), max(np.array(self.scatter_points)[:,1]), grid_size)
+        """
+        Compute a 2D density map using a binned gaussian KDE.
+
+        The scatter points are binned to the grid nodes and the histogram is convolved (FFT) with the gaussian kernel
+        of scipy.stats.gaussian_kde (Scott's rule, full covariance), instead of evaluating the KDE at every grid node.
+        """
+        points = np.asarray(self.scatter_points, dtype=float)
+        kde = scipy.stats.gaussian_kde(points.T)
+        x_grid = np.linspace(points[:, 0].min(), points[:, 0].max(), grid_size)
+        y_grid = np.linspace(points[:, 1].min(), points[:, 1].max(), grid_size)
         X, Y = np.meshgrid(x_grid, y_grid)
-        Z = kde.evaluate(np.vstack([X.ravel(), Y.ravel()]))
-        return X, Y, Z.reshape(X.shape)
+
+        # Number of points closest to each grid node (rows: y, columns: x)
+        counts, _, _ = np.histogram2d(points[:, 1], points[:, 0], bins=(_node_bin_edges(y_grid), _node_bin_edges(x_grid)))
+
+        # Kernel on all node offsets that can occur within the grid
+        dx = np.arange(-(grid_size - 1), grid_size) * (x_grid[1] - x_grid[0] if grid_size > 1 else 0)
+        dy = np.arange(-(grid_size - 1), grid_size) * (y_grid[1] - y_grid[0] if grid_size > 1 else 0)
+        offsets = np.stack(np.meshgrid(dx, dy), axis=-1)
+        mahalanobis = np.einsum('...i,ij,...j->...', offsets, kde.inv_cov, offsets)
+        kernel = np.exp(-0.5 * mahalanobis) / np.sqrt(np.linalg.det(2 * np.pi * kde.covariance))
+
+        Z = scipy.signal.fftconvolve(counts, kernel, mode='same') / len(points)
+        return X, Y, np.maximum(Z, 0)  # FFT round-off can produce tiny negative values
+
+    def compute_density_gradient(self):
+        """Gradient fields (d/dx, d/dy) of the density map in physical units, computed once."""
+        X, Y, Z = self.density_map
+        x_grid, y_grid = X[0, :], Y[:, 0]
+        gradient_y, gradient_x = np.gradient(Z, y_grid, x_grid)
+        return gradient_x, gradient_y
     
     def pull_point_by_density(self, point, alpha=0.1):
-        """Pull a point based on the density map."""
-        X, Y, Z = self.density_map
-        gradient_x = np.gradient(Z, axis=1)
-        gradient_y = np.gradient(Z, axis=0)
-        
-        # Interpolate gradient at the given point
-        grad_x_interp = np.interp(point[0], X[0, :], gradient_x[int(len(X) / 2)])
-        grad_y_interp = np.interp(point[1], Y[:, 0], gradient_y[:, int(len(Y) / 2)])
-        
-        # Compute the direction to move
-        direction = np.array([grad_x_interp, grad_y_interp])
-        direction /= (np.linalg.norm(direction) + 1e-9)  # Normalize
+        """Pull a point (or an (N, 2) array of points) based on the density map."""
+        X, Y, _ = self.density_map
+        point = np.asarray(point, dtype=float)
+
+        # Bilinear interpolation of both gradient fields at the given point
+        direction = np.moveaxis(_bilinear_interpolation(self.gradient_field, X[0, :], Y[:, 0], point), 0, -1)
+        direction /= (np.linalg.norm(direction, axis=-1, keepdims=True) + 1e-9)  # Normalize
         
         # Move the point
-        new_point = np.array(point) + alpha * direction
+        new_point = point + alpha * direction
         return new_point
     
     def refine_endpoints(self, iterations=100, alpha=2):
-        """Refine the endpoints of the graph based on the density map."""
+        """Refine the endpoints of the graph based on the density map (both endpoints are pulled at once)."""
         refined_points = self.control_points.copy()
+        endpoints = np.array([refined_points[0], refined_points[-1]], dtype=float)
         for _ in range(iterations):
-            for i in [0, -1]:
-                refined_points[i] = tuple(self.pull_point_by_density(refined_points[i], alpha))
+            endpoints = self.pull_point_by_density(endpoints, alpha)
+        refined_points[0] = tuple(endpoints[0])
+        refined_points[-1] = tuple(endpoints[1])
         return refined_points
     
     def get_refined_points(self):
@@ -61,77 +87,130 @@ class GraphRefiner:
         return refined_points
 
 
+def _node_bin_edges(grid: np.ndarray) -> np.ndarray:
+    "Bin edges halfway between the (equally spaced) grid nodes, so every bin belongs to one node"
+    if len(grid) < 2:
+        return np.array([grid[0] - 0.5, grid[0] + 0.5])
+    half_step = (grid[1] - grid[0]) / 2
+    return np.concatenate((grid - half_step, [grid[-1] + half_step]))
+
+def _bilinear_interpolation(field: np.ndarray, x_grid: np.ndarray, y_grid: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """
+    Bilinear interpolation of field (..., rows: y_grid, columns: x_grid, both equally spaced) at (..., 2) points.
+    Points outside the grid get the value at the closest grid border.
+    """
+    def cell_position(values, grid):
+        step = grid[1] - grid[0] if len(grid) > 1 else 1.0
+        position = np.clip((values - grid[0]) / step, 0, len(grid) - 1)
+        idx = np.minimum(position.astype(int), max(len(grid) - 2, 0))
+        return idx, position - idx
+
+    x_idx, x_frac = cell_position(points[..., 0], x_grid)
+    y_idx, y_frac = cell_position(points[..., 1], y_grid)
+    x_next = np.minimum(x_idx + 1, len(x_grid) - 1)
+    y_next = np.minimum(y_idx + 1, len(y_grid) - 1)
+
+    top = field[..., y_idx, x_idx] * (1 - x_frac) + field[..., y_idx, x_next] * x_frac
+    bottom = field[..., y_next, x_idx] * (1 - x_frac) + field[..., y_next, x_next] * x_frac
+    return top * (1 - y_frac) + bottom * y_frac
+
 def sample_points_from_segments(middle_line_points, n) -> np.ndarray:
     '''
     Samples n points from the middle line segments.
     Other functions require the middle line, to be desribed by a list of points.
+
+    The points are equally spaced along the polyline (arc-length parametrization), the first and last point are kept.
+    '''
+    if n < 2:
+        raise ValueError(f"At least two points must be sampled, got n={n}.")
+
+    points = np.asarray(middle_line_points, dtype=float).reshape(-1, 2)
+    arc_length = arc_length_parametrization(points)
+
+    # Distance of each sample from the first point, n-1 intervals for n points
+    sample_positions = np.linspace(0, arc_length[-1], n)
+    sampled_points = np.column_stack((np.interp(sample_positions, arc_length, points[:, 0]), np.interp(sample_positions, arc_length, points[:, 1])))
+
+    return sampled_points
+
+def sample_points_from_segments_batch(middle_lines: list, n) -> np.ndarray:
     '''
+    Batch version of sample_points_from_segments for several middle lines (each (N_i, 2), N_i may differ).
 
-    # Calculate the total length of the piecewise linear connection
-    total_length = 0
-    for i in range(len(middle_line_points) - 1):
-        total_length += np.linalg.norm(np.array(middle_line_points[i+1]) - np.array(middle_line_points[i]))
+    All lines are concatenated and parametrized by a single global arc length, in which every line is shifted by an offset
+    larger than the longest line. Then all samples of all lines are interpolated with one np.interp call per coordinate.
 
-    # Distance between each sampled point
-    distance_between_samples = total_length / (n-1)  # n-1 intervals for n points
+    Returns:
+        (num_lines, n, 2) array
+    '''
+    if n < 2:
+        raise ValueError(f"At least two points must be sampled, got n={n}.")
+    if len(middle_lines) == 0:
+        return np.zeros((0, n, 2))
 
-    sampled_points = [middle_line_points[0]]  # starting with the first point
-    remaining_distance = distance_between_samples
+    lines = [np.asarray(line, dtype=float).reshape(-1, 2) for line in middle_lines]
+    arc_lengths = [arc_length_parametrization(line) for line in lines]
+    total_lengths = np.array([arc_length[-1] for arc_length in arc_lengths])
 
-    for i in range(len(middle_line_points) - 1):
-        p1 = np.array(middle_line_points[i])
-        p2 = np.array(middle_line_points[i+1])
-        segment_length = np.linalg.norm(p2 - p1)
+    # Disjoint parameter ranges [offset_i, offset_i + length_i] for all lines
+    offsets = np.arange(len(lines)) * (total_lengths.max() + 1)
+    global_arc_length = np.concatenate([arc_length + offset for arc_length, offset in zip(arc_lengths, offsets)])
+    all_points = np.concatenate(lines)
 
-        while segment_length >= remaining_distance:
-            # Calculate the next sampled point on the current segment
-            t = remaining_distance / segment_length
-            next_point = (1 - t) * p1 + t * p2
-            sampled_points.append(tuple(next_point))
-            
-            # Move to the next sampling position
-            segment_length -= remaining_distance
-            remaining_distance = distance_between_samples
-            p1 = next_point
+    sample_positions = offsets[:, np.newaxis] + np.linspace(0, 1, n)[np.newaxis, :] * total_lengths[:, np.newaxis]
+    sample_positions[:, -1] = offsets + total_lengths  # Exactly the last point of every line
+    sampled_x = np.interp(sample_positions.ravel(), global_arc_length, all_points[:, 0])
+    sampled_y = np.interp(sample_positions.ravel(), global_arc_length, all_points[:, 1])
 
-        # If we haven't reached the end of the segment, set the remaining distance for the next segment
-        if segment_length > 0:
-            remaining_distance -= segment_length
+    return np.stack((sampled_x, sampled_y), axis=-1).reshape(len(lines), n, 2)
 
-    # Ensure the last point is included
-    if len(sampled_points) < n:
-        sampled_points.append(middle_line_points[-1])
+def arc_length_parametrization(points: np.ndarray) -> np.ndarray:
+    "Cumulative distance of every point of the (N, 2) polyline from its first point (N,)"
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return np.concatenate(([0.0], np.cumsum(row_norms(np.diff(points, axis=0)))))
 
-    sampled_points = np.array(sampled_points)
+def trim_line(binary_mask: np.ndarray, refined_points: list, num_samples: int = 100) -> np.ndarray:
+    '''
+    Trim the line (polyline of refined_points) to the mask.
 
-    return sampled_points
+    Start segments: every point outside the mask is moved to the first in-mask sample on the segment to its successor.
+    End segments: afterwards every point outside the mask is moved to the first in-mask sample on the segment to its predecessor.
+    Each segment is sampled at num_samples points. Points without any in-mask sample are kept.
+
+    Only the points outside of the mask are sampled, all of them at once. Returns a new (N, 2) array.
+    '''
+    points = np.array(refined_points, dtype=float).reshape(-1, 2)
+    if len(points) < 2:
+        return points
 
-def trim_line(binary_mask: np.ndarray, refined_points: list):
-    # Create a grid of x and y coordinates for mask
-    x_grid, y_grid = np.meshgrid(np.arange(binary_mask.shape[1]), np.arange(binary_mask.shape[0]))
-    
-    # Function to check if a point lies within the mask boundaries
-    def point_in_mask(x, y):
-        if 0 <= int(y) < binary_mask.shape[0] and 0 <= int(x) < binary_mask.shape[1]:
-            return binary_mask[int(y), int(x)]
-        return False
-    
     # Trim start segment
-    for i in range(len(refined_points)-1):
-        x_values = np.linspace(refined_points[i][0], refined_points[i+1][0], 100)
-        y_values = np.linspace(refined_points[i][1], refined_points[i+1][1], 100)
-        for x, y in zip(x_values, y_values):
-            if point_in_mask(x, y):
-                refined_points[i] = (x, y)
-                break
-    
+    points[:-1] = _move_into_mask(binary_mask, points[:-1], points[1:], num_samples)
+
     # Trim end segment
-    for i in range(len(refined_points)-1, 0, -1):
-        x_values = np.linspace(refined_points[i][0], refined_points[i-1][0], 100)
-        y_values = np.linspace(refined_points[i][1], refined_points[i-1][1], 100)
-        for x, y in zip(x_values, y_values):
-            if point_in_mask(x, y):
-                refined_points[i] = (x, y)
-                break
-    
-    return refined_points
\ No newline at end of file
+    points[1:] = _move_into_mask(binary_mask, points[1:], points[:-1], num_samples)
+
+    return points
+
+def _points_in_mask(binary_mask: np.ndarray, points: np.ndarray) -> np.ndarray:
+    "Mask value (!= 0) at (..., 2) points, coordinates are truncated to the pixel index, points outside the mask are False"
+    with np.errstate(invalid='ignore'):
+        x_idx = np.trunc(points[..., 0])
+        y_idx = np.trunc(points[..., 1])
+        in_bounds = (x_idx >= 0) & (x_idx < binary_mask.shape[1]) & (y_idx >= 0) & (y_idx < binary_mask.shape[0])
+    inside = np.zeros(in_bounds.shape, dtype=bool)
+    inside[in_bounds] = binary_mask[y_idx[in_bounds].astype(np.intp), x_idx[in_bounds].astype(np.intp)] != 0
+    return inside
+
+def _move_into_mask(binary_mask: np.ndarray, start_points: np.ndarray, end_points: np.ndarray, num_samples: int) -> np.ndarray:
+    "Move every start point outside the mask to the first in-mask sample of np.linspace(start, end, num_samples)"
+    moved_points = start_points.copy()
+    outside = np.flatnonzero(~_points_in_mask(binary_mask, start_points))
+    if len(outside) == 0:
+        return moved_points
+
+    samples = np.linspace(start_points[outside], end_points[outside], num_samples, axis=1)
+    inside = _points_in_mask(binary_mask, samples)
+    found = inside.any(axis=1)
+    first_inside = np.argmax(inside, axis=1)
+    moved_points[outside[found]] = samples[found, first_inside[found]]
+    return moved_points
@@ -1,14 +1,34 @@
+import logging
 import numpy as np
-from tqdm import tqdm
+from typing import Optional, Union
+
+from vol_est_yolov8.length_estimation.volume_estimation import lines_to_endpoints
+
+logger = logging.getLogger(__name__)
 
 class OrthogonalLinesGenerator:
-    def __init__(self, middle_line_points, combined_mask, separate_masks:dict=None):
+    def __init__(self, middle_line_points, combined_mask, separate_masks:Union[dict, np.ndarray]=None, label_names:Optional[dict]=None):
+        '''
+        separate_masks: Dictionary with a binary mask per segment or a label map (see analyze_segments.label_map).
+        label_names: Segment name per label map value, e.g. {1: 'head', 3: 'abdomen'}. Required if separate_masks is a label map.
+        '''
         self.middle_line_points = middle_line_points
         self.combined_mask = combined_mask
-        self.separate_masks = separate_masks if separate_masks is not None else {}
+        if isinstance(separate_masks, np.ndarray):
+            if label_names is None:
+                raise ValueError("label_names are required if separate_masks is a label map.")
+            self.label_map = separate_masks
+            self.label_names = label_names
+            self.separate_masks = {}
+            segment_keys = list(label_names.values())
+        else:
+            self.label_map = None
+            self.label_names = None
+            self.separate_masks = separate_masks if separate_masks is not None else {}
+            segment_keys = list(self.separate_masks.keys())
         self.orthogonal_lines = []
-        self.orthogonal_lines_w_seg = {k: [] for k in self.separate_masks.keys()} if separate_masks is not None else {}
-        self.segmented_lines = {key: [] for key in self.separate_masks}
+        self.orthogonal_lines_w_seg = {k: [] for k in segment_keys} if separate_masks is not None else {}
+        self.segmented_lines = {key: [] for key in segment_keys}
 
     def get_gradient(self, p1, p2):
         """Calculate gradient (slope) of the line defined by p1 and p2."""
@@ -19,8 +39,8 @@ class OrthogonalLinesGenerator:
 
         if len(self.middle_line_points) < num_lines:
             #raise ValueError(f"Number of orthogonal lines ({num_lines}) cannot be greater than the number of points in the middle line ({self.middle_line_points.shape}).")
-            print(f"Number of orthogonal lines ({num_lines}) cannot be greater than the number of points in the middle line ({self.middle_line_points.shape}).")
-            print("Automatically set number of orthogonal lines to the number of points in the middle line.")
+            logger.debug("Number of orthogonal lines (%d) cannot be greater than the number of points in the middle line (%d). "
+                         "Automatically set number of orthogonal lines to the number of points in the middle line.", num_lines, len(self.middle_line_points))
             num_lines = len(self.middle_line_points)
 
         # Sample points from the middle line
@@ -31,31 +51,26 @@ class OrthogonalLinesGenerator:
                     for i in range(len(sampled_points)-1)]
         self.h_mean = np.mean(distances)
         
-        print("Generate orthogonal lines...")
-        for idx in tqdm(sampled_points):
-            if idx == 0:
-                # Use the next point to calculate the gradient
-                gradient = self.get_gradient(self.middle_line_points[idx], self.middle_line_points[idx + 1])
-            elif idx == len(self.middle_line_points) - 1:
-                # Use the previous point to calculate the gradient
-                gradient = self.get_gradient(self.middle_line_points[idx - 1], self.middle_line_points[idx])
-            else:
-                # Use both previous and next points to calculate the gradient
-                gradient = self.get_gradient(self.middle_line_points[idx - 1], self.middle_line_points[idx + 1])
+        logger.debug("Generate orthogonal lines...")
+        middle_line_points = np.asarray(self.middle_line_points, dtype=float)
 
-            # Calculate the negative reciprocal for orthogonal slope
-            ortho_slope = -1 / gradient
-            
-            # Generate and trim orthogonal line
+        # Gradient from the neighbouring points (only the next/previous point at the start/end of the middle line)
+        idx_prev = np.clip(sampled_points - 1, 0, len(middle_line_points) - 1)
+        idx_next = np.clip(sampled_points + 1, 0, len(middle_line_points) - 1)
+        gradients = self.get_gradient(middle_line_points[idx_prev].T, middle_line_points[idx_next].T)
+
+        # Calculate the negative reciprocal for orthogonal slope
+        with np.errstate(divide='ignore'):
+            ortho_slopes = -1 / gradients
+
+        # Generate and trim all orthogonal lines at once
+        lines, belongs_to_segs = self.generate_trimmed_lines(middle_line_points[sampled_points], ortho_slopes)
+        for orthogonal_line, belongs_to_seg in zip(lines, belongs_to_segs):
             if self.orthogonal_lines_w_seg:
-                orthogonal_line, belongs_to_seg = self.generate_trimmed_line(self.middle_line_points[idx], ortho_slope)
                 self.orthogonal_lines_w_seg[belongs_to_seg].append(orthogonal_line)
             else:
-                orthogonal_line, _ = self.generate_trimmed_line(self.middle_line_points[idx], ortho_slope)
                 self.orthogonal_lines.append(orthogonal_line)
 
-        print("Done.")
-
     def generate_trimmed_line_OLD(self, start_point, slope):
         """Generate orthogonal line and trim based on combined mask."""
         y_vals = np.arange(0, self.combined_mask.shape[0])
@@ -70,27 +85,85 @@ class OrthogonalLinesGenerator:
 
     def generate_trimmed_line(self, start_point, slope):
         """Generate orthogonal line, trim based on combined mask, and determine its segment."""
-        y_vals = np.arange(0, self.combined_mask.shape[0])
-        x_vals = start_point[0] + (y_vals - start_point[1]) / slope
+        lines, belongs_to_segs = self.generate_trimmed_lines(np.asarray([start_point], dtype=float), np.asarray([slope], dtype=float))
+        return lines[0], belongs_to_segs[0]
+
+    def generate_trimmed_lines(self, start_points: np.ndarray, slopes: np.ndarray) -> tuple[list, list]:
+        """
+        Generate orthogonal lines (one per image row), trim them based on the combined mask and determine their segment.
+
+        All lines are sampled at once as (num_lines, num_rows) coordinate array and the mask values are gathered by fancy indexing.
+        Each line is assigned to the segment containing most of its points and only keeps these points.
+
+        Parameters:
+            start_points: (num_lines, 2) points on the middle line
+            slopes: (num_lines,) slopes of the lines
+
+        Returns:
+            lines: List of (num_points, 2) arrays
+            belongs_to_segs: Segment (key of separate_masks) of each line, None if no separate masks are given
+        """
+        height, width = self.combined_mask.shape
+        y_vals = np.arange(0, height)
+        x_vals = start_points[:, 0:1] + (y_vals[np.newaxis, :] - start_points[:, 1:2]) / slopes[:, np.newaxis]
 
         # Filter points based on combined mask and boundary conditions
-        valid_points_combined_mask = [(x, y) for x, y in zip(x_vals, y_vals) if 
-                                     0 <= x < self.combined_mask.shape[1] and 
-                                     self.combined_mask[int(y), int(x)] == 1]
-
-        segmented_points = {key: [] for key in self.separate_masks}
-
-        # Filter points based on each separate mask and store in the segmented_points dictionary
-        for key, mask in self.separate_masks.items():
-            segmented_points[key] = [(x, y) for x, y in valid_points_combined_mask if mask[int(y), int(x)] == 1]
-            
-        # Determine the mask with the most points
-        if segmented_points:
-            dominant_mask_key = max(segmented_points, key=lambda k: len(segmented_points[k]))
-            self.segmented_lines[dominant_mask_key].append(segmented_points[dominant_mask_key])
-            return segmented_points[dominant_mask_key], dominant_mask_key
-        else:
-            return valid_points_combined_mask, None
+        with np.errstate(invalid='ignore'):
+            in_image = (x_vals >= 0) & (x_vals < width)
+        x_idx = np.where(in_image, x_vals, 0).astype(int)
+        y_idx = np.broadcast_to(y_vals, x_vals.shape)
+        in_combined_mask = in_image & (self.combined_mask[y_idx, x_idx] == 1)
+
+        if self.label_map is not None and self.label_names:
+            return self._assign_lines_by_label_map(x_vals, y_vals, x_idx, y_idx, in_combined_mask)
+
+        if not self.separate_masks:
+            lines = [np.column_stack((x_vals[i][in_combined_mask[i]], y_vals[in_combined_mask[i]])) for i in range(len(x_vals))]
+            return lines, [None] * len(lines)
+
+        # Filter points based on each separate mask
+        keys = list(self.separate_masks.keys())
+        in_segment = np.stack([in_combined_mask & (self.separate_masks[key][y_idx, x_idx] == 1) for key in keys])
+
+        # Determine the mask with the most points (first mask in case of a tie)
+        dominant_idx = np.argmax(in_segment.sum(axis=2), axis=0)
+
+        lines, belongs_to_segs = [], []
+        for i, seg_idx in enumerate(dominant_idx):
+            selected = in_segment[seg_idx, i]
+            line = np.column_stack((x_vals[i][selected], y_vals[selected]))
+            self.segmented_lines[keys[seg_idx]].append(line)
+            lines.append(line)
+            belongs_to_segs.append(keys[seg_idx])
+
+        return lines, belongs_to_segs
+
+    def _assign_lines_by_label_map(self, x_vals, y_vals, x_idx, y_idx, in_combined_mask) -> tuple[list, list]:
+        """
+        Same as generate_trimmed_lines for a label map: the labels of all line points are gathered once
+        and the points per line and segment are counted with a single bincount.
+        """
+        num_lines = len(x_vals)
+        label_values = np.array(list(self.label_names.keys()))
+        keys = list(self.label_names.values())
+
+        point_labels = np.where(in_combined_mask, self.label_map[y_idx, x_idx], 0).astype(np.intp)
+        num_bins = max(int(label_values.max()), int(point_labels.max(initial=0))) + 1
+        line_offsets = (np.arange(num_lines) * num_bins)[:, np.newaxis]
+        counts = np.bincount((point_labels + line_offsets).ravel(), minlength=num_lines * num_bins).reshape(num_lines, num_bins)
+
+        # Determine the segment with the most points (first segment in case of a tie)
+        dominant_idx = np.argmax(counts[:, label_values], axis=1)
+
+        lines, belongs_to_segs = [], []
+        for i, seg_idx in enumerate(dominant_idx):
+            selected = point_labels[i] == label_values[seg_idx]
+            line = np.column_stack((x_vals[i][selected], y_vals[selected]))
+            self.segmented_lines[keys[seg_idx]].append(line)
+            lines.append(line)
+            belongs_to_segs.append(keys[seg_idx])
+
+        return lines, belongs_to_segs
 
     def get_orthogonal_lines(self):
         """Return generated orthogonal lines."""
@@ -98,6 +171,12 @@ class OrthogonalLinesGenerator:
             return self.orthogonal_lines_w_seg
         return self.orthogonal_lines
 
+    def get_line_endpoints(self):
+        """Return the first and last point of every orthogonal line as (N, 2, 2) array (dict per segment if separate masks are given)."""
+        if self.orthogonal_lines_w_seg:
+            return {key: lines_to_endpoints(lines) for key, lines in self.orthogonal_lines_w_seg.items()}
+        return lines_to_endpoints(self.orthogonal_lines)
+
     def get_h_mean(self):
         """Return the mean distance between consecutive points in the middle line."""
         return self.h_mean
@@ -121,12 +200,10 @@ class OrthogonalLinesGenerator:
     def remove_intersecting_lines(self):
         """Remove lines that intersect with their neighbors."""
         to_remove = set()
-        print("Remove intersecting lines...")
-        for i in tqdm(range(len(self.orthogonal_lines) - 1)):  # Only go up to the second last line
+        for i in range(len(self.orthogonal_lines) - 1):  # Only go up to the second last line
             if self.lines_intersect(self.orthogonal_lines[i], self.orthogonal_lines[i + 1]):
                 # Decide which line to remove. In this case, we remove the next line.
                 to_remove.add(i + 1)
-        print("Done.")
         self.orthogonal_lines = [line for idx, line in enumerate(self.orthogonal_lines) if idx not in to_remove]
-        print(f"Total number of deleted lines: {len(to_remove)}")
+        logger.debug("Total number of deleted lines: %d", len(to_remove))
 
@@ -1,5 +1,7 @@
 import numpy as np
 
+from vol_est_yolov8.utils.geometry import row_norms
+
 
 class PointOrderer:
     '''
@@ -43,20 +45,33 @@ class PointOrderer:
 
     def order_points(self, unordered_points):
         """Order the unordered points by projecting them onto the extended reference line."""
-        def custom_sort(point):
-            min_distance = float('inf')
-            order_value = None
-            for i in range(len(self.extended_reference_points) - 1):
-                segment_start, segment_end = self.extended_reference_points[i], self.extended_reference_points[i+1]
-                segment_vector = np.array(segment_end) - np.array(segment_start)
-                point_vector = np.array(point) - np.array(segment_start)
-                t = np.dot(point_vector, segment_vector) / np.dot(segment_vector, segment_vector)
-                projection = np.array(segment_start) + t * segment_vector
-                distance = np.linalg.norm(np.array(point) - projection)
-                if distance < min_distance:
-                    min_distance = distance
-                    order_value = i + t
-            return order_value
-
-        ordered_points = sorted(unordered_points, key=custom_sort)
+        order = np.argsort(self.order_values(unordered_points), kind='stable')
+        ordered_points = [unordered_points[i] for i in order]
         return ordered_points
+
+    def order_values(self, points) -> np.ndarray:
+        """
+        Position of every point along the extended reference line: i + t for the projection onto the nearest segment i
+        (nearest = smallest distance to the line through the segment, first segment in case of a tie), t is the projection parameter.
+        All points are projected onto all segments at once as (num_points, num_segments) arrays.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        reference_points = np.asarray(self.extended_reference_points, dtype=float)
+        segment_starts = reference_points[:-1]
+        segment_vectors = reference_points[1:] - segment_starts
+
+        point_vectors = points[:, np.newaxis, :] - segment_starts[np.newaxis, :, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = _dot(point_vectors, segment_vectors) / _dot(segment_vectors, segment_vectors)
+        projections = segment_starts + t[..., np.newaxis] * segment_vectors
+        distances = row_norms(points[:, np.newaxis, :] - projections)
+        # Degenerate (zero length) segments are never the nearest one
+        distances = np.where(np.isnan(distances), np.inf, distances)
+
+        nearest_segment = np.argmin(distances, axis=1)
+        return nearest_segment + t[np.arange(len(points)), nearest_segment]
+
+
+def _dot(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    "Dot product along the last axis (broadcasting), same accumulation as np.dot on single vectors"
+    return (a[..., np.newaxis, :] @ b[..., :, np.newaxis])[..., 0, 0]
@@ -0,0 +1,196 @@
+'''
+Orthogonal slicing on the mask polygons instead of the rasterized masks.
+
+The orthogonal lines are intersected analytically with the edges of the polygons (masks.xyn of the YOLO output in pixel
+coordinates), so the entry and exit point of every line and segment is exact (sub-pixel) and no mask has to be rasterized.
+The interior of a polygon is given by the even-odd rule. The orthogonal lines are cut at the full polygon of every segment,
+the labels of single points (label_points) follow the label map: a point covered by several instances belongs to the
+instance that comes last (see analyze_segments.label_map).
+'''
+
+import numpy as np
+
+from vol_est_yolov8.extract_skeleton.orthogonal_slicer import OrthogonalLinesGenerator
+
+
+def polygon_edges(polygons: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Edges of all (closed) polygons.
+
+    Returns:
+        starts: (E, 2) start vertex of every edge
+        ends: (E, 2) end vertex of every edge
+        polygon_idx: (E,) index of the polygon of every edge
+    '''
+    starts, ends, polygon_idx = [], [], []
+    for i, polygon in enumerate(polygons):
+        polygon = np.asarray(polygon, dtype=float).reshape(-1, 2)
+        starts.append(polygon)
+        ends.append(np.roll(polygon, -1, axis=0))
+        polygon_idx.append(np.full(len(polygon), i))
+    if not starts:
+        return np.empty((0, 2)), np.empty((0, 2)), np.empty(0, dtype=int)
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(polygon_idx)
+
+def line_edge_intersections(origins: np.ndarray, directions: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    '''
+    Intersections of infinite lines with polygon edges, for all lines and edges at once.
+
+    An edge is crossed if its vertices lie on different sides of the line (one strictly left, the other right or on the line),
+    so a line through a vertex is counted once and the number of crossings per closed polygon is even.
+
+    Parameters:
+        origins: (L, 2) a point on every line
+        directions: (L, 2) direction of every line
+        starts, ends: (E, 2) vertices of the edges
+
+    Returns:
+        (L, E) line parameter t of the intersection (point = origin + t * direction), NaN if the edge is not crossed
+    '''
+    # Side of every vertex relative to every line, (L, E)
+    side_start = directions[:, 0:1] * (starts[:, 1] - origins[:, 1:2]) - directions[:, 1:2] * (starts[:, 0] - origins[:, 0:1])
+    side_end = directions[:, 0:1] * (ends[:, 1] - origins[:, 1:2]) - directions[:, 1:2] * (ends[:, 0] - origins[:, 0:1])
+    line_idx, edge_idx = np.nonzero((side_start > 0) != (side_end > 0))
+
+    # Line parameter of the intersection, only for the crossed edges: cross(a - o, e) / cross(d, e) with the edge vector e
+    a = starts[edge_idx] - origins[line_idx]
+    e = ends[edge_idx] - starts[edge_idx]
+    d = directions[line_idx]
+    t = np.full(side_start.shape, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t[line_idx, edge_idx] = (a[:, 0] * e[:, 1] - a[:, 1] * e[:, 0]) / (d[:, 0] * e[:, 1] - d[:, 1] * e[:, 0])
+    return t
+
+
+def line_polygon_intervals(t: np.ndarray, polygon_idx: np.ndarray, num_polygons: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''
+    Inside intervals of every line in every polygon from the intersections of line_edge_intersections (even-odd rule).
+
+    Returns:
+        t_entry: (L, P) line parameter of the first intersection with each polygon (NaN if the line misses the polygon)
+        t_exit: (L, P) line parameter of the last intersection
+        inside_length: (L, P) summed length of the inside intervals (in units of the direction vector)
+    '''
+    num_lines = len(t)
+    t_entry = np.full((num_lines, num_polygons), np.nan)
+    t_exit = np.full((num_lines, num_polygons), np.nan)
+    inside_length = np.zeros((num_lines, num_polygons))
+    for i in range(num_polygons):
+        t_sorted = np.sort(t[:, polygon_idx == i], axis=1)  # NaN at the end
+        if t_sorted.shape[1] < 2:
+            continue
+        num_hits = np.count_nonzero(~np.isnan(t_sorted), axis=1)
+        hit = num_hits >= 2
+        t_entry[hit, i] = t_sorted[hit, 0]
+        t_exit[hit, i] = t_sorted[hit, num_hits[hit] - 1]
+        # Consecutive pairs of crossings enclose the inside intervals
+        num_pairs = t_sorted.shape[1] // 2
+        interval_lengths = t_sorted[:, 1:2 * num_pairs:2] - t_sorted[:, 0:2 * num_pairs:2]
+        inside_length[:, i] = np.nansum(interval_lengths, axis=1)
+    return t_entry, t_exit, inside_length
+
+def points_in_polygons(points: np.ndarray, polygons: list) -> np.ndarray:
+    '''
+    Even-odd point in polygon test for all points and polygons (horizontal ray casting, vectorized over points and edges).
+
+    Returns:
+        (N, P) boolean array, True if point n lies inside polygon p
+    '''
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    starts, ends, polygon_idx = polygon_edges(polygons)
+    x, y = points[:, 0:1], points[:, 1:2]
+    # Edges that span the height of the point (half-open, so vertices are counted once)
+    spans = (starts[:, 1] > y) != (ends[:, 1] > y)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_cross = starts[:, 0] + (y - starts[:, 1]) * (ends[:, 0] - starts[:, 0]) / (ends[:, 1] - starts[:, 1])
+    crossings = spans & (x < x_cross)
+
+    inside = np.zeros((len(points), len(polygons)), dtype=bool)
+    for i in range(len(polygons)):
+        inside[:, i] = np.count_nonzero(crossings[:, polygon_idx == i], axis=1) % 2 == 1
+    return inside
+
+def label_points(points: np.ndarray, polygons: list, all_cls) -> np.ndarray:
+    '''
+    Label of every point as in a label map: class ID + 1 of the last polygon containing the point, 0 for background.
+    '''
+    label_values = np.asarray([int(i_cls) + 1 for i_cls in np.asarray(all_cls).tolist()], dtype=np.intp)
+    inside = points_in_polygons(points, polygons)
+    if inside.shape[1] == 0:
+        return np.zeros(len(inside), dtype=np.intp)
+    last_inside = inside.shape[1] - 1 - np.argmax(inside[:, ::-1], axis=1)
+    return np.where(inside.any(axis=1), label_values[last_inside], 0)
+
+
+class PolygonSlicer(OrthogonalLinesGenerator):
+    def __init__(self, middle_line_points, polygons: list, all_cls, label_names: dict):
+        '''
+        Orthogonal lines of the middle line, cut at the segment polygons (same interface as OrthogonalLinesGenerator).
+
+        Every orthogonal line is assigned to the segment with the longest inside part and consists of the entry and exit point of
+        that segment (first and last intersection along the line). The middle line points and polygons have to be in the same coordinates.
+
+        polygons: List of (N, 2) polygons in pixel coordinates, one per instance.
+        all_cls: Class ID of every polygon.
+        label_names: Segment name per label map value (class ID + 1), e.g. {1: 'head', 3: 'abdomen'}, see analyze_segments.label_map.get_label_names
+        '''
+        super().__init__(middle_line_points, combined_mask=None, separate_masks=None)
+        self.polygons = [np.asarray(polygon, dtype=float).reshape(-1, 2) for polygon in polygons]
+        self.all_cls = np.asarray(all_cls).astype(int)
+        self.label_names = label_names
+        segment_keys = list(label_names.values())
+        self.orthogonal_lines_w_seg = {key: [] for key in segment_keys}
+        self.segmented_lines = {key: [] for key in segment_keys}
+        # Entry / exit point of every line in every segment (NaN if the line misses the segment)
+        self.entry_exit = {}
+
+    def generate_trimmed_lines(self, start_points: np.ndarray, slopes: np.ndarray) -> tuple[list, list]:
+        """
+        Intersect the orthogonal lines (through start_points with the given slopes) with all polygons at once.
+
+        Returns:
+            lines: List of (2, 2) arrays with the entry and exit point of the dominant segment (empty (0, 2) array if the line misses all segments)
+            belongs_to_segs: Segment of each line
+        """
+        start_points = np.asarray(start_points, dtype=float).reshape(-1, 2)
+        slopes = np.asarray(slopes, dtype=float)
+        # Direction (1, slope), vertical for infinite slopes
+        directions = np.where(np.isfinite(slopes)[:, np.newaxis], np.column_stack((np.ones_like(slopes), slopes)), [0.0, 1.0])
+
+        if not self.label_names:
+            return [np.empty((0, 2))] * len(start_points), [None] * len(start_points)
+
+        starts, ends, polygon_idx = polygon_edges(self.polygons)
+        t = line_edge_intersections(start_points, directions, starts, ends)
+        t_entry, t_exit, inside_length = line_polygon_intervals(t, polygon_idx, len(self.polygons))
+
+        # Combine the instances of every segment
+        keys = list(self.label_names.values())
+        num_lines = len(start_points)
+        seg_entry = np.full((num_lines, len(keys)), np.nan)
+        seg_exit = np.full((num_lines, len(keys)), np.nan)
+        seg_length = np.zeros((num_lines, len(keys)))
+        with np.errstate(invalid='ignore'):
+            for j, label_value in enumerate(self.label_names):
+                of_segment = self.all_cls + 1 == label_value
+                if of_segment.any():
+                    seg_entry[:, j] = np.fmin.reduce(t_entry[:, of_segment], axis=1)
+                    seg_exit[:, j] = np.fmax.reduce(t_exit[:, of_segment], axis=1)
+                    seg_length[:, j] = inside_length[:, of_segment].sum(axis=1)
+
+        for j, key in enumerate(keys):
+            self.entry_exit[key] = np.stack((start_points + seg_entry[:, j:j + 1] * directions, start_points + seg_exit[:, j:j + 1] * directions), axis=1)
+
+        # Segment with the longest inside part (first segment in case of a tie)
+        dominant_idx = np.argmax(seg_length, axis=1)
+
+        lines, belongs_to_segs = [], []
+        for i, seg_idx in enumerate(dominant_idx):
+            line = self.entry_exit[keys[seg_idx]][i]
+            if np.isnan(line).any():
+                line = np.empty((0, 2))
+            self.segmented_lines[keys[seg_idx]].append(line)
+            lines.append(line)
+            belongs_to_segs.append(keys[seg_idx])
+
+        return lines, belongs_to_segs
@@ -1,3 +1,6 @@
+import logging
+from typing import Optional
+
 import numpy as np
 from sklearn.preprocessing import PolynomialFeatures
 from sklearn.linear_model import LinearRegression
@@ -6,20 +9,75 @@ from scipy.odr import ODR, Model, Data
 from scipy.interpolate import interp1d, CubicSpline
 import scipy.interpolate
 
+logger = logging.getLogger(__name__)
+
+
+def grouped_mean(keys: np.ndarray, values: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Mean of values per unique key in a single pass (np.unique + np.bincount).
+
+    Returns:
+        unique_keys: Sorted unique keys
+        means: Mean of the values of each unique key
+    """
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    inverse = inverse.ravel()
+    sums = np.bincount(inverse, weights=values, minlength=len(unique_keys))
+    counts = np.bincount(inverse, minlength=len(unique_keys))
+    return unique_keys, sums / counts
+
+def _sample_function(f, x: np.ndarray, num_samples: int = None) -> np.ndarray:
+    """Evaluate y = f(x) at num_samples equidistant x values over the range of x (default: 10 per x value)."""
+    if num_samples is None:
+        num_samples = len(x) * 10  # Create finer x values for interpolation
+    x_new = np.linspace(x.min(), x.max(), num_samples)
+    return np.column_stack((x_new, f(x_new)))
+
 
 class MaskPointGenerator:
-    def __init__(self, masks: list, given_points: np.ndarray = None, given_weights: np.ndarray = None, num_points:int= 500):
+    def __init__(self, masks: list, given_points: np.ndarray = None, given_weights: np.ndarray = None, num_points:int= 500, offset: tuple = (0, 0), seed: Optional[int] = 0, image_size: Optional[tuple] = None):
+        '''
+        masks: List of binary masks or a single label map (2D array, 0 = background, see analyze_segments.label_map).
+        offset: (x, y) position of the mask canvas in the image, if the masks are cropped to a region of interest.
+            All points are in mask coordinates, the offset is only used to find the image boundaries.
+        image_size: (width, height) of the full image, the extrapolated middle line is clipped to it.
+            Default: the extent of the mask canvas (offset + mask size).
+        seed: Seed of the random generator used to sample the points (None: not reproducible).
+
+        The random points (plus the given points) are only generated when they are first used (see points).
+        '''
         self.masks = masks
-        if len(masks) == 0:
-            raise ValueError("At least one mask must be provided.")
-        self.combined_mask = self.combine_masks(masks)
-        self.points = self.generate_points(num_points)
+        self.offset = offset
+        self.num_points = num_points
+        self.given_points = given_points
+        self.given_weights = given_weights
+        self.rng = np.random.default_rng(seed)
+        self._points = None
+        if isinstance(masks, np.ndarray) and masks.ndim == 2:
+            self.combined_mask = (masks > 0).view(np.uint8)
+        else:
+            if len(masks) == 0:
+                raise ValueError("At least one mask must be provided.")
+            self.combined_mask = self.combine_masks(masks)
+        if image_size is None:
+            image_size = (offset[0] + self.combined_mask.shape[1], offset[1] + self.combined_mask.shape[0])
+        self.image_size = image_size
         self.model = None
         self.poly = None  # Store the PolynomialFeatures instance
-        
-        # Combine given points with generated points
-        if given_points is not None:
-            self.points = self.combine_given_points(given_points, given_weights)
+
+    @property
+    def points(self) -> np.ndarray:
+        """num_points random points in the combined mask combined with the given points, generated on first access."""
+        if self._points is None:
+            self._points = self.generate_points(self.num_points)
+            # Combine given points with generated points
+            if self.given_points is not None:
+                self._points = self.combine_given_points(self.given_points, self.given_weights)
+        return self._points
+
+    @points.setter
+    def points(self, points: np.ndarray):
+        self._points = points
 
     @staticmethod
     def combine_masks(masks: list) -> np.ndarray:
@@ -38,10 +96,12 @@ class MaskPointGenerator:
         return self.points
 
     def generate_points(self, n_points: int) -> np.ndarray:
-        """Generate n_points randomly within the combined mask."""
-        y, x = np.where(self.combined_mask == 1)
-        indices = np.random.choice(len(x), size=n_points, replace=False)
-        return np.column_stack((x[indices], y[indices]))
+        """Generate n_points randomly (without replacement) within the combined mask."""
+        # Only search the bounding box of the mask for foreground pixels
+        x_min, y_min, width, height = cv2.boundingRect(self.combined_mask)
+        y, x = np.nonzero(self.combined_mask[y_min:y_min + height, x_min:x_min + width] == 1)
+        indices = self.rng.choice(len(x), size=n_points, replace=False)
+        return np.column_stack((x[indices] + x_min, y[indices] + y_min))
 
     def fit_polynomial(self, degree: int = 6):
         """Fit a polynomial regression model to the generated points."""
@@ -77,11 +137,20 @@ class MaskPointGenerator:
         fitted_points = np.column_stack((unique_x, predicted_y))
 
         # Keep only the points that lie inside the combined mask
-        inside_mask = [self.combined_mask[int(round(y))][int(round(x))] == 1 for x, y in fitted_points]
-        fitted_points = fitted_points[inside_mask]
+        fitted_points = fitted_points[self.inside_mask(fitted_points)]
 
         return fitted_points
 
+    def inside_mask(self, points: np.ndarray) -> np.ndarray:
+        """Boolean array, True for the (x, y) points whose nearest pixel lies inside the image and the combined mask."""
+        height, width = self.combined_mask.shape
+        with np.errstate(invalid='ignore'):
+            x = np.rint(points[:, 0])
+            y = np.rint(points[:, 1])
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+        inside[inside] = self.combined_mask[y[inside].astype(np.intp), x[inside].astype(np.intp)] == 1
+        return inside
+
     def combine_given_points(self, given_points: np.ndarray, given_weights: np.ndarray = None) -> np.ndarray:
         """
         Combine the given points with the randomly generated points.
@@ -103,12 +172,18 @@ class MaskPointGenerator:
 
     @staticmethod    
     def poly_func(beta, x):
-        '''Define the polynomial function of degree n'''
-        # Compute polynomial based on beta's length
-        y = 0
-        for i, coef in enumerate(beta):
-            y += coef * (x ** i)
-        return y
+        '''Define the polynomial function of degree n (beta[i] is the coefficient of x**i, Horner scheme)'''
+        return np.polynomial.polynomial.polyval(x, beta)
+
+    @staticmethod
+    def poly_jac_beta(beta, x):
+        '''Derivative of poly_func with respect to beta, shape (len(beta), len(x))'''
+        return np.polynomial.polynomial.polyvander(x, len(beta) - 1).T
+
+    @staticmethod
+    def poly_jac_x(beta, x):
+        '''Derivative of poly_func with respect to x'''
+        return np.polynomial.polynomial.polyval(x, np.polynomial.polynomial.polyder(beta))
 
     def fit_get_odr(self, degree=6) -> np.ndarray:
         '''
@@ -121,9 +196,10 @@ class MaskPointGenerator:
         y = np.squeeze(y)
 
         assert len(x) == len(y), "x and y must have the same length, but got {} and {}".format(len(x), len(y))
-        model = Model(self.poly_func)
+        model = Model(self.poly_func, fjacb=self.poly_jac_beta, fjacd=self.poly_jac_x)
         data = Data(x, y)
-        beta_vec = np.ones(degree + 1)
+        # Start from the ordinary least squares fit, ODR only corrects for the errors in x
+        beta_vec = np.polynomial.polynomial.polyfit(x, y, degree)
         odr = ODR(data, model, beta0=beta_vec)
         output = odr.run()
 
@@ -138,93 +214,83 @@ class MaskPointGenerator:
         # Count the number of NaN values in fitted_points
         nan_count = np.sum(np.isnan(fitted_points))
         beta_nan_count = np.sum(np.isnan(output.beta))
-        print(f"Number of NaN values in fitted_points: {nan_count}")
-        print(f"Number of NaN values in beta: {beta_nan_count}")
+        if nan_count or beta_nan_count:
+            logger.warning("ODR fit returned NaN values: %d in fitted_points, %d in beta", nan_count, beta_nan_count)
 
         # Keep only the points that lie inside the combined mask
-        inside_mask = np.array([
-            0 <= int(round(x)) < self.combined_mask.shape[1] 
-            and 0 <= int(round(y)) < self.combined_mask.shape[0] 
-            and self.combined_mask[int(round(y))][int(round(x))] == 1 
-            for x, y in fitted_points
-        ])
-        fitted_points = fitted_points[inside_mask]
+        fitted_points = fitted_points[self.inside_mask(fitted_points)]
 
         return fitted_points
 
-    def interpolate_points(self, given_points=None, kind='cubic'):
-        """
-        Interpolate the provided points (or self-given points if not provided).
-        
-        Args:
-            given_points (np.ndarray, optional): Points to interpolate. If None, uses self-given points.
-            kind (str): Specifies the kind of interpolation. Can be 'linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic'.
-                        Default is 'cubic'.
-
-        Returns:
-            np.ndarray: Interpolated points.
-        """
-
-        # Use the provided points or the self-given points
+    def _get_given_points(self, given_points=None) -> np.ndarray:
+        """Return given_points or, if None, the points of the class instance."""
         if given_points is None:
             if self.points is not None:
                 given_points = self.points
             else:
                 raise ValueError("No points provided for interpolation and no given points in the class instance.")
+        return given_points
 
-        # Prevent: ValueError: Expect x to not have duplicates
-        # Sort the points based on x values
-        sorted_indices = np.argsort(given_points[:, 0])
-        sorted_points = given_points[sorted_indices]
-
-        # For each unique x value, average the y values
-        unique_x, unique_indices = np.unique(sorted_points[:, 0], return_index=True)
-        y_values = [np.mean(sorted_points[sorted_points[:, 0] == x_val, 1]) for x_val in unique_x]
-
-        # Create the interpolation function
-        f = interp1d(unique_x, y_values, kind=kind, fill_value="extrapolate")
+    def fit_interp1d(self, given_points=None, kind='cubic') -> interp1d:
+        """
+        Fit an interpolation function y(x) to the provided points (or self-given points if not provided).
+        The y values of duplicate x values are averaged (see grouped_mean).
 
-        # Interpolate for the x values
-        x_new = np.linspace(unique_x.min(), unique_x.max(), len(unique_x) * 10)  # Create finer x values for interpolation
-        y_new = f(x_new)
+        Args:
+            given_points (np.ndarray, optional): Points to interpolate. If None, uses self-given points.
+            kind (str): Specifies the kind of interpolation, see scipy.interpolate.interp1d.
 
-        return np.column_stack((x_new, y_new))
+        Returns:
+            interp1d: Interpolation function (extrapolates outside of the x range of the points).
+        """
+        given_points = self._get_given_points(given_points)
+        unique_x, y_values = grouped_mean(given_points[:, 0], given_points[:, 1])
+        return interp1d(unique_x, y_values, kind=kind, fill_value="extrapolate")
 
-    def interpolate_points_spline(self, given_points=None):
+    def fit_spline(self, given_points=None) -> CubicSpline:
         """
-        Perform spline interpolation on the provided points (or self-given points if not provided).
+        Fit a cubic spline y(x) to the provided points (or self-given points if not provided).
+        The y values of duplicate x values are averaged (see grouped_mean).
 
         Args:
             given_points (np.ndarray, optional): Points to interpolate. If None, uses self-given points.
 
         Returns:
-            np.ndarray: Interpolated points using spline interpolation.
+            CubicSpline: Spline, can be evaluated at any x (and differentiated).
         """
+        given_points = self._get_given_points(given_points)
+        unique_x, y_values = grouped_mean(given_points[:, 0], given_points[:, 1])
+        return CubicSpline(unique_x, y_values)
 
-        # Use the provided points or the self-given points
-        if given_points is None:
-            if self.points is not None:
-                given_points = self.points
-            else:
-                raise ValueError("No points provided for interpolation and no given points in the class instance.")
-
-        # Prevent: ValueError: Expect x to not have duplicates
-        # Sort the points based on x values
-        sorted_indices = np.argsort(given_points[:, 0])
-        sorted_points = given_points[sorted_indices]
+    def interpolate_points(self, given_points=None, kind='cubic', num_samples:int=None):
+        """
+        Interpolate the provided points (or self-given points if not provided).
+        
+        Args:
+            given_points (np.ndarray, optional): Points to interpolate. If None, uses self-given points.
+            kind (str): Specifies the kind of interpolation. Can be 'linear', 'nearest', 'zero', 'slinear', 'quadratic', 'cubic'.
+                        Default is 'cubic'.
+            num_samples (int, optional): Number of returned points. Default: 10 times the number of unique x values.
 
-        # For each unique x value, average the y values
-        unique_x, unique_indices = np.unique(sorted_points[:, 0], return_index=True)
-        y_values = [np.mean(sorted_points[sorted_points[:, 0] == x_val, 1]) for x_val in unique_x]
+        Returns:
+            np.ndarray: Interpolated points.
+        """
+        f = self.fit_interp1d(given_points, kind=kind)
+        return _sample_function(f, f.x, num_samples)
 
-        # Create the spline interpolation function
-        cs = CubicSpline(unique_x, y_values)
+    def interpolate_points_spline(self, given_points=None, num_samples:int=None):
+        """
+        Perform spline interpolation on the provided points (or self-given points if not provided).
 
-        # Interpolate for the x values
-        x_new = np.linspace(unique_x.min(), unique_x.max(), len(unique_x) * 10)  # Create finer x values for interpolation
-        y_new = cs(x_new)
+        Args:
+            given_points (np.ndarray, optional): Points to interpolate. If None, uses self-given points.
+            num_samples (int, optional): Number of returned points. Default: 10 times the number of unique x values.
 
-        return np.column_stack((x_new, y_new))
+        Returns:
+            np.ndarray: Interpolated points using spline interpolation.
+        """
+        cs = self.fit_spline(given_points)
+        return _sample_function(cs, cs.x, num_samples)
 
     def interpolate_points_parametric_spline(self, given_points=None):
         """
@@ -269,16 +335,18 @@ class MaskPointGenerator:
         tangent_start = np.array([spline_x.derivative()(path_t[0]), spline_y.derivative()(path_t[0])])
         tangent_end = np.array([spline_x.derivative()(path_t[-1]), spline_y.derivative()(path_t[-1])])
 
-        # Clip the extrapolated points to the boundaries
-        start_extension = self._extend_line_from_point(given_points[0], -tangent_start)  # Note the negative sign
-        end_extension = self._extend_line_from_point(given_points[-1], tangent_end)
+        # Clip the extrapolated points to the (image) boundaries
+        x_min, y_min = -self.offset[0], -self.offset[1]
+        x_max, y_max = self.image_size[0] - self.offset[0], self.image_size[1] - self.offset[1]
+        start_extension = self._extend_line_from_point(given_points[0], -tangent_start, x_min, y_min, x_max, y_max)  # Note the negative sign
+        end_extension = self._extend_line_from_point(given_points[-1], tangent_end, x_min, y_min, x_max, y_max)
 
         # Concatenate the extension points to the interpolated curve
         extended_curve = np.vstack(([start_extension], np.column_stack((x_interp, y_interp)), [end_extension]))
 
         return extended_curve
 
-    def _extend_line_from_point(self, point, direction, x_min=0, y_min=0, x_max=4032, y_max=3040):
+    def _extend_line_from_point(self, point, direction, x_min, y_min, x_max, y_max):
         """Extend a line from a given point in a specified direction until it reaches an image boundary."""
         m = direction[1] / direction[0] if direction[0] != 0 else float('inf')
         
@@ -1,20 +1,58 @@
 import numpy as np
 from typing import Optional
 
+from vol_est_yolov8.utils.geometry import row_norms
+
 class LengthEstimator:
-    def __init__(self, points, masks, k_conv_factor: Optional[float]):
+    def __init__(self, points, masks, k_conv_factor: Optional[float], label_names: Optional[dict] = None):
         """
         Initialize the LengthEstimator.
 
         Parameters:
         - points (list): List of 2D points that describe the skeleton middle line.
-        - masks (dict): Dictionary with keys as object_part strings and values as binary masks.
+        - masks (dict or np.ndarray): Dictionary with keys as object_part strings and values as binary masks,
+            or a label map (see analyze_segments.label_map).
         - k_conv_factor (float): Conversion factor to convert from pixels to mm. [mm/pixel]
+        - label_names (dict): object_part per label map value, e.g. {1: 'head', 3: 'abdomen'}. Required if masks is a label map.
         """
+        if isinstance(masks, np.ndarray) and label_names is None:
+            raise ValueError("label_names are required if masks is a label map.")
         self.points = np.array(points)
         self.masks = masks
+        self.label_names = label_names
         self.k_conv_factor = k_conv_factor if k_conv_factor is not None else 1
 
+        # Length of every line segment between two consecutive points (computed once for all masks)
+        points_float = self.points.astype(float).reshape(-1, 2)
+        self.segment_lengths = row_norms(np.diff(points_float, axis=0))
+
+        # Pixel indices of all points, points outside of the mask canvas do not belong to any mask
+        with np.errstate(invalid='ignore'):
+            self.x_idx = np.nan_to_num(points_float[:, 0], nan=-1).astype(int)
+            self.y_idx = np.nan_to_num(points_float[:, 1], nan=-1).astype(int)
+
+    def _points_in_mask(self, mask) -> np.ndarray:
+        """
+        Gather the mask values of all points at once.
+
+        Returns:
+        - np.ndarray: Boolean array, True for points within the mask.
+        """
+        in_bounds = (self.y_idx >= 0) & (self.y_idx < mask.shape[0]) & (self.x_idx >= 0) & (self.x_idx < mask.shape[1])
+        inside = np.zeros(len(self.x_idx), dtype=bool)
+        inside[in_bounds] = mask[self.y_idx[in_bounds], self.x_idx[in_bounds]] == 1
+        return inside
+
+    def _lengths_from_inside(self, inside: np.ndarray) -> np.ndarray:
+        """
+        Sum up the segments with both points inside, for every row of inside (num_masks, num_points).
+        The sum is sequential, as in a loop over the points.
+        """
+        if len(self.segment_lengths) == 0:
+            return np.zeros(len(inside))
+        both_inside = inside[:, :-1] & inside[:, 1:]
+        return np.cumsum(np.where(both_inside, self.segment_lengths, 0.0), axis=1)[:, -1]
+
     def _calculate_length(self, mask):
         """
         Calculate the length of the line segment that falls within the given mask.
@@ -25,13 +63,7 @@ class LengthEstimator:
         Returns:
         - float: Length of the segment within the mask.
         """
-        length = 0
-        for i in range(1, len(self.points)):
-            # Check if both the current point and the next point are within the mask
-            if mask[int(self.points[i-1][1]), int(self.points[i-1][0])] == 1 and \
-               mask[int(self.points[i][1]), int(self.points[i][0])] == 1:
-                length += np.linalg.norm(self.points[i] - self.points[i-1])
-        return length
+        return self._lengths_from_inside(self._points_in_mask(mask)[np.newaxis])[0]
 
     def calculate_lengths(self, round_to: int=1):
         """
@@ -40,9 +72,45 @@ class LengthEstimator:
         Returns:
         - dict: Dictionary with keys as body parts and values as lengths.
         """
+        if self.label_names is not None:
+            return self._calculate_lengths_from_label_map(round_to)
+        if not self.masks:
+            return {}
+        inside = np.stack([self._points_in_mask(mask) for mask in self.masks.values()])
+        lengths = self._lengths_from_inside(inside)
+        body_part_lengths = {}
+        for object_part, length in zip(self.masks.keys(), lengths):
+            body_part_lengths[f'length_{object_part}'] = round(float(length) * self.k_conv_factor, round_to)
+        return body_part_lengths
+
+    def _calculate_lengths_from_label_map(self, round_to: int):
+        """
+        calculate_lengths for a label map: the labels of all points are gathered once and the segments
+        with both points in the same label are summed up per label with a single (sequential) bincount.
+        """
+        if not self.label_names:
+            return {}
+        label_map = self.masks
+        in_bounds = (self.y_idx >= 0) & (self.y_idx < label_map.shape[0]) & (self.x_idx >= 0) & (self.x_idx < label_map.shape[1])
+        point_labels = np.zeros(len(self.x_idx), dtype=np.intp)
+        point_labels[in_bounds] = label_map[self.y_idx[in_bounds], self.x_idx[in_bounds]]
+        return self.calculate_lengths_from_point_labels(point_labels, round_to)
+
+    def calculate_lengths_from_point_labels(self, point_labels: np.ndarray, round_to: int = 1):
+        """
+        calculate_lengths with the label of every point given (label map value, 0 = background),
+        e.g. from the mask polygons (see extract_skeleton.polygon_slicer.label_points). Requires label_names.
+        """
+        point_labels = np.asarray(point_labels, dtype=np.intp)
+
+        # Segments that leave a label are assigned to the background (0)
+        segment_labels = np.where(point_labels[:-1] == point_labels[1:], point_labels[:-1], 0)
+        num_bins = max(max(self.label_names), int(segment_labels.max(initial=0))) + 1
+        lengths = np.bincount(segment_labels, weights=self.segment_lengths, minlength=num_bins)
+
         body_part_lengths = {}
-        for object_part, mask in self.masks.items():
-            body_part_lengths[f'length_{object_part}'] = round(self._calculate_length(mask) * self.k_conv_factor, round_to)
+        for label_value, object_part in self.label_names.items():
+            body_part_lengths[f'length_{object_part}'] = round(float(lengths[label_value]) * self.k_conv_factor, round_to)
         return body_part_lengths
 
     def calculate_total_length(self, round_to: int=1):
@@ -52,5 +120,5 @@ class LengthEstimator:
         Returns:
         - float: Total length of the skeleton.
         """
-        total_length = np.sum([np.linalg.norm(self.points[i] - self.points[i-1]) for i in range(1, len(self.points))])
+        total_length = np.sum(self.segment_lengths)
         return round(total_length * self.k_conv_factor, round_to)
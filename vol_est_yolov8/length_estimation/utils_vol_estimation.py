@@ -1,13 +1,45 @@
+import logging
+from typing import Optional, Union
+
 import numpy as np
 import pandas as pd
 
 import vol_est_yolov8 as vol_est
 
+logger = logging.getLogger(__name__)
+
+
+def get_roi(masks, img_np, padding:int=10) -> tuple[int, int, int, int]:
+    '''
+    Padded bounding box of all mask polygons in pixel coordinates: (x_min, y_min, x_max, y_max), x_max/y_max exclusive.
+    The geometry pipeline can run on this crop instead of the full image (see get_binary_masks).
+    '''
+    height, width = img_np.shape[:2]
+    px_polygons = [vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_px(xyn, width, height) for xyn in masks if len(xyn) > 0]
+    if not px_polygons:
+        return (0, 0, width, height)
+
+    all_points = np.concatenate(px_polygons)
+    x_min, y_min = all_points.min(axis=0) - padding
+    x_max, y_max = all_points.max(axis=0) + padding + 1
+    return (max(int(x_min), 0), max(int(y_min), 0), min(int(x_max), width), min(int(y_max), height))
 
-def get_binary_masks(masks, img_np, img, mask_w_label):
-    bin_masks = vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_bin_mask(masks, img.width, img.height, img_np)
+def shift_points(points, offset:tuple) -> np.ndarray:
+    'Shift (N, 2) points by offset=(dx, dy), e.g. from ROI to image coordinates'
+    return np.asarray(points, dtype=float).reshape(-1, 2) + np.asarray(offset, dtype=float)
+
+def shift_lines(lines:Union[list, dict], offset:tuple) -> Union[list, dict]:
+    'Shift orthogonal lines (list or dict of lists per segment) by offset=(dx, dy)'
+    if isinstance(lines, dict):
+        return {key: [shift_points(line, offset) for line in seg_lines] for key, seg_lines in lines.items()}
+    return [shift_points(line, offset) for line in lines]
+
+def get_binary_masks(masks, img_np, img, mask_w_label, roi:Optional[tuple]=None):
+    # The image size is taken from img_np, img (PIL image) may be None (see converter_result_to_arrays)
+    height, width = img_np.shape[:2]
+    bin_masks = vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_bin_mask(masks, width, height, img_np, roi=roi)
     for key, i_masks in mask_w_label.items():
-        mask_w_label[key] = vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_bin_mask(i_masks, img.width, img.height, img_np)
+        mask_w_label[key] = vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_bin_mask(i_masks, width, height, img_np, roi=roi)
         #print("Plot binary mask", key)
         #plot_binary_mask(mask_w_label[key][0])
 
@@ -16,6 +48,11 @@ def get_binary_masks(masks, img_np, img, mask_w_label):
 
     return bin_masks, mask_w_label
 
+def get_label_map(masks, all_cls, img_np, roi:Optional[tuple]=None) -> np.ndarray:
+    'Single label map (class ID + 1 per pixel) of all masks, see analyze_segments.label_map'
+    height, width = img_np.shape[:2]
+    return vol_est.analyze_segments.label_map.xyn_to_label_map(masks, all_cls, width, height, img_np, roi=roi)
+
 def get_cogs(bin_masks, all_cls, labels):
     cogs = vol_est.analyze_segments.calc_2d_cog_binary_mask.compute_cogs(bin_masks, all_cls, labels)
 
@@ -25,36 +62,79 @@ def get_cogs(bin_masks, all_cls, labels):
 
     return cogs_array, ordered_cogs
 
-def get_orth_lines(num_lines:int, fitted_points, combined_mask, mask_w_label):
-    generator = vol_est.extract_skeleton.orthogonal_slicer.OrthogonalLinesGenerator(fitted_points, combined_mask, separate_masks=mask_w_label)
+def get_cogs_from_label_map(label_map, all_cls, labels):
+    cogs = vol_est.analyze_segments.calc_2d_cog_binary_mask.compute_cogs_from_label_map(label_map, all_cls)
+
+    cogs_array = np.array(list(cogs.values()))
+
+    ordered_cogs = vol_est.plotting.inference_results.order_cog_dict(cogs, max_i=int(max(all_cls) + 1))
+
+    return cogs_array, ordered_cogs
+
+def get_cogs_from_polygons(masks, all_cls, image_size:tuple, offset:tuple=(0, 0)):
+    '''
+    CoGs per class from the moments of the mask polygons, without rasterization (see calc_2d_cog_binary_mask.compute_cogs_from_polygons).
+    image_size: (width, height) of the image the normalized polygons refer to.
+    cogs_array is in the order of the first appearance of each class in all_cls and relative to offset (e.g. the ROI, see get_roi).
+    '''
+    width, height = image_size
+    px_polygons = [vol_est.analyze_segments.xyn_to_bin_mask.xyn_to_px(xyn, width, height) for xyn in masks]
+    cogs_array, class_ids = vol_est.analyze_segments.calc_2d_cog_binary_mask.compute_cogs_from_polygons(px_polygons, all_cls)
+    cogs_array = cogs_array - np.asarray(offset, dtype=float)
+
+    cogs = {str(cls): tuple(cog) for cls, cog in zip(class_ids.tolist(), cogs_array)}
+    ordered_cogs = vol_est.plotting.inference_results.order_cog_dict(cogs, max_i=int(max(all_cls) + 1))
+
+    return cogs_array, ordered_cogs
+
+def get_orth_lines(num_lines:int, fitted_points, combined_mask, mask_w_label, label_names:Optional[dict]=None):
+    'mask_w_label: binary mask per segment or label map (requires label_names, see OrthogonalLinesGenerator)'
+    generator = vol_est.extract_skeleton.orthogonal_slicer.OrthogonalLinesGenerator(fitted_points, combined_mask, separate_masks=mask_w_label, label_names=label_names)
     generator.generate_orthogonal_lines(num_lines=num_lines)
     lines = generator.get_orthogonal_lines()
     return lines, generator
 
-def get_middle_line_points(generator, cogs_array, combined_mask, n_polynom:int=2):
+def get_orth_lines_from_polygons(num_lines:int, fitted_points, polygons:list, all_cls, label_names:dict):
+    'Orthogonal lines cut exactly at the mask polygons (same coordinates as fitted_points), see extract_skeleton.polygon_slicer.PolygonSlicer'
+    generator = vol_est.extract_skeleton.polygon_slicer.PolygonSlicer(fitted_points, polygons, all_cls, label_names)
+    generator.generate_orthogonal_lines(num_lines=num_lines)
+    lines = generator.get_orthogonal_lines()
+    return lines, generator
+
+def get_middle_line_points(generator, cogs_array, combined_mask, n_polynom:int=2, n_samples:int=110):
+    fitted_points = fit_middle_line(generator, cogs_array, n_polynom=n_polynom)
+    fitted_points = trim_middle_line(fitted_points, combined_mask, n_samples=n_samples)
+    return fitted_points
+
+def fit_middle_line(generator, cogs_array, n_polynom:int=2):
+    'Middle line through the CoGs (parametric spline), polynomial ODR fit to the mask points if there are less than 2 CoGs'
     try:
         fitted_points = generator.interpolate_points_parametric_spline(given_points=cogs_array)
     except ValueError:
-        print("Could not fit points with method 3 (Less than 2 CoGs). Fall back to regression...")
+        logger.debug("Could not fit points with method 3 (Less than 2 CoGs). Fall back to regression...")
         fitted_points = generator.fit_get_odr(degree=n_polynom)
+    return fitted_points
+
+def trim_middle_line(fitted_points, combined_mask, n_samples:int=110):
+    'Trim the middle line to the combined mask and resample it to n_samples equidistant points'
     fitted_points = vol_est.extract_skeleton.line_refiner.trim_line(combined_mask, fitted_points)
-    fitted_points = vol_est.extract_skeleton.line_refiner.sample_points_from_segments(fitted_points, n=110)
+    fitted_points = vol_est.extract_skeleton.line_refiner.sample_points_from_segments(fitted_points, n=n_samples)
     return fitted_points
 
 def get_volume_from_lines(lines, generator, k_mm_per_px) -> pd.DataFrame:
     h_value = generator.get_h_mean()
-    estimator = vol_est.length_estimation.volume_estimation.VolumeEstimator(lines, h_value, k_conv_factor=k_mm_per_px)
+    endpoints = generator.get_line_endpoints()
+    estimator = vol_est.length_estimation.volume_estimation.ArrayVolumeEstimator(endpoints, h_value, k_conv_factor=k_mm_per_px)
     total_estimated_volume, body_part_volumes = estimator.calculate_volume_in_mm_3(round_to=3)
     volumes = {"total_volume": total_estimated_volume, **body_part_volumes}
     volumes = pd.DataFrame(volumes, index=[0])
     return volumes
 
-def get_length_from_lines(fitted_points, mask_w_label, k_mm_per_px) -> pd.DataFrame:
-    estimator = vol_est.length_estimation.length_estimation.LengthEstimator(fitted_points, mask_w_label, k_mm_per_px)
+def get_length_from_lines(fitted_points, mask_w_label, k_mm_per_px, label_names:Optional[dict]=None) -> pd.DataFrame:
+    estimator = vol_est.length_estimation.length_estimation.LengthEstimator(fitted_points, mask_w_label, k_mm_per_px, label_names=label_names)
     length_per_segment = estimator.calculate_lengths(round_to=3)
     total_length = estimator.calculate_total_length(round_to=3)
-    print(f"total length: {total_length} mm")
-    print(f"lengths: {length_per_segment} mm")
+    logger.debug("total length: %s mm, lengths: %s mm", total_length, length_per_segment)
     lengths = {"total_length": total_length, **length_per_segment}
     lengths = pd.DataFrame(lengths, index=[0])
     return lengths
\ No newline at end of file
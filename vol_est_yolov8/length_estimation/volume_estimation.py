@@ -32,11 +32,21 @@ h_value = ...  # Actual distance between the lines
 
 estimator = VolumeEstimator(orthogonal_lines, h_value)
 estimated_volume = estimator.calculate_volume()
+
+ArrayVolumeEstimator:
+The same estimation on arrays. Only the endpoints of the orthogonal lines are needed, as (N, 2, 2) array per body part
+(see lines_to_endpoints / OrthogonalLinesGenerator.get_line_endpoints). All widths, areas and frustum volumes are computed
+in one vectorized pass, several specimens can be stacked to an (S, N, 2, 2) array (see stack_endpoints, calculate_volumes_batch).
 """
 
+import logging
 import numpy as np
 from typing import Optional
 
+from vol_est_yolov8.utils.geometry import row_norms
+
+logger = logging.getLogger(__name__)
+
 class VolumeEstimator:
     def __init__(self, orthogonal_lines_dict: dict, h: float, k_conv_factor: Optional[float]):
         """
@@ -82,8 +92,7 @@ class VolumeEstimator:
                 elements_per_line_i = [len(line) for line in lines[i]]
 
                 if len(elements_per_line_i) < 2 or len(elements_per_line_i_1) < 2:
-                    print(f'Both lines must contain at least two points. Got {len(elements_per_line_i_1)} and {len(elements_per_line_i)} points for segment: {object_part}')
-                    print("Skipping...")
+                    logger.debug('Both lines must contain at least two points. Got %d and %d points for segment: %s. Skipping...', len(elements_per_line_i_1), len(elements_per_line_i), object_part)
                     continue
 
                 A1 = self._calculate_area(lines[i - 1])
@@ -98,3 +107,104 @@ class VolumeEstimator:
 
         total_volume = round(total_volume, round_to)
         return total_volume, body_part_volumes
+
+
+def lines_to_endpoints(lines: list) -> np.ndarray:
+    """
+    Convert orthogonal lines to an (N, 2, 2) array with the first and last point of each line.
+    Lines with less than two points are NaN (they are skipped by the volume estimation).
+    """
+    endpoints = np.full((len(lines), 2, 2), np.nan)
+    for i, line in enumerate(lines):
+        if len(line) >= 2:
+            endpoints[i, 0] = line[0]
+            endpoints[i, 1] = line[-1]
+    return endpoints
+
+def stack_endpoints(endpoints_list: list) -> np.ndarray:
+    """
+    Stack the (N_i, 2, 2) endpoints of several specimens to an (S, max(N_i), 2, 2) array (padded with NaN).
+    """
+    max_lines = max((len(endpoints) for endpoints in endpoints_list), default=0)
+    stacked = np.full((len(endpoints_list), max_lines, 2, 2), np.nan)
+    for i, endpoints in enumerate(endpoints_list):
+        stacked[i, :len(endpoints)] = endpoints
+    return stacked
+
+
+class ArrayVolumeEstimator:
+    def __init__(self, endpoints_dict: dict, h: float, k_conv_factor: Optional[float]):
+        """
+        Initialize the ArrayVolumeEstimator.
+
+        Note: All lengths must be in pixel! The conversion factor k_conv_factor is used to convert from pixels to mm.
+
+        Parameters:
+            endpoints_dict: Dictionary with keys being the name of the object_part and values being (N, 2, 2) arrays
+                with the two endpoints of each orthogonal line (NaN for lines with less than two points).
+            h: Distance between two adjacent orthogonal lines.
+            k_conv_factor: Conversion factor to convert from pixels to mm. [mm/pixel]
+        """
+        self.endpoints_dict = endpoints_dict
+        self.h = h
+        self.k_conv_factor = k_conv_factor if k_conv_factor is not None else 1
+
+    @staticmethod
+    def calculate_slice_volumes(endpoints: np.ndarray, h, k_conv_factor: float = 1) -> np.ndarray:
+        """
+        Calculate the volumes between all adjacent orthogonal lines.
+
+        Parameters:
+            endpoints: (..., N, 2, 2) endpoints of the orthogonal lines
+            h: Distance between two adjacent orthogonal lines, scalar or one value per specimen (...)
+
+        Returns:
+            (..., N-1) slice volumes, 0 for slices with a missing (NaN) line
+        """
+        widths = row_norms(endpoints[..., 0, :] - endpoints[..., 1, :])
+        areas = np.pi * (widths / 2) ** 2
+
+        A1, A2 = areas[..., :-1], areas[..., 1:]
+        h = np.asarray(h, dtype=float)[..., np.newaxis]
+        slice_volumes = k_conv_factor**3 * ((h / 3) * (A1 + A2 + np.sqrt(A1 * A2)))
+        return np.where(np.isnan(slice_volumes), 0.0, slice_volumes)
+
+    @staticmethod
+    def sum_slice_volumes(slice_volumes: np.ndarray) -> np.ndarray:
+        "Sum along the last axis in sequential order (same result as adding up the slices in a loop)"
+        if slice_volumes.shape[-1] == 0:
+            return np.zeros(slice_volumes.shape[:-1])
+        return np.cumsum(slice_volumes, axis=-1)[..., -1]
+
+    def calculate_volume_in_mm_3(self, round_to) -> tuple[float, dict]:
+        """
+        Calculate the estimated volume of the structure for each object_part separately and the total volume.
+        Units: mm^3
+        """
+        total_volume = 0
+        body_part_volumes = {}
+
+        for object_part, endpoints in self.endpoints_dict.items():
+            slice_volumes = self.calculate_slice_volumes(np.asarray(endpoints, dtype=float).reshape(-1, 2, 2), self.h, self.k_conv_factor)
+            body_part_volumes[f"volume_{object_part}"] = round(float(self.sum_slice_volumes(slice_volumes)), round_to)
+            total_volume += body_part_volumes[f"volume_{object_part}"]
+
+        total_volume = round(total_volume, round_to)
+        return total_volume, body_part_volumes
+
+
+def calculate_volumes_batch(endpoints: np.ndarray, h, k_conv_factor: Optional[float] = None) -> np.ndarray:
+    """
+    Volume of many specimens (or body parts) at once.
+
+    Parameters:
+        endpoints: (S, N, 2, 2) stacked endpoints (see stack_endpoints)
+        h: Distance between two adjacent orthogonal lines, scalar or (S,)
+        k_conv_factor: Conversion factor to convert from pixels to mm. [mm/pixel]
+
+    Returns:
+        (S,) volumes (not rounded)
+    """
+    k_conv_factor = k_conv_factor if k_conv_factor is not None else 1
+    slice_volumes = ArrayVolumeEstimator.calculate_slice_volumes(np.asarray(endpoints, dtype=float), h, k_conv_factor)
+    return ArrayVolumeEstimator.sum_slice_volumes(slice_volumes)
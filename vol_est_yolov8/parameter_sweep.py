@@ -0,0 +1,84 @@
+'''
+Parameter sweeps of the volume estimation, e.g. to study the sensitivity of the estimates to the number of orthogonal lines.
+
+All parameter combinations of an image are run with a shared pipeline_stages.ArtifactStore, so the stages upstream of the
+swept parameters are computed once per image and only the differing stages are computed per combination.
+
+Usage:
+    df_sweep = sweep(imgs_upload, predictions,
+                     grid={'num_orthogonal_lines': [50, 100, 150], 'n_samples': [55, 110, 220]},
+                     params={'k_mm_per_px': 0.003118, 'n_polynom_fallback': 3})
+    df_sweep.pivot_table(index=['num_orthogonal_lines', 'n_samples'], columns='quantity', values='value')
+'''
+
+import itertools
+import logging
+import time
+from typing import Optional
+
+import pandas as pd
+from tqdm import tqdm
+
+from vol_est_yolov8 import pipeline_stages, process_vol_est_main
+
+logger = logging.getLogger(__name__)
+
+
+def parameter_grid(grid: dict) -> list:
+    '''
+    All combinations of the grid values as list of dicts. The parameters of upstream stages vary slowest,
+    so consecutive combinations share the longest possible prefix of the pipeline.
+    '''
+    stage_parameters = list(dict.fromkeys(parameter for _, _, parameters in pipeline_stages.STAGES.values() for parameter in parameters))
+    unknown = [parameter for parameter in grid if parameter not in stage_parameters]
+    if unknown:
+        raise ValueError(f"Unknown parameters {unknown}, possible parameters: {stage_parameters}")
+    names = [parameter for parameter in stage_parameters if parameter in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def sweep(imgs_upload, predictions, grid: dict, params: Optional[dict] = None, labels: Optional[dict] = None, show_progress: bool = False) -> pd.DataFrame:
+    '''
+    Runs the volume estimation of every image for all combinations of the grid.
+
+    Parameters:
+        grid: Values per swept parameter, e.g. {'num_orthogonal_lines': [50, 100], 'k_mm_per_px': [0.003, 0.0031]}.
+            Possible parameters: roi_padding, n_polynom_fallback, n_samples, num_orthogonal_lines, slicing_method, k_mm_per_px (see pipeline_stages.STAGES).
+        params: Values of the parameters that are not swept (see pipeline_stages.run_stages).
+        labels: Class labels of the model. Default: predictions[0][0].names
+        show_progress: Show a progress bar over the images.
+
+    Returns:
+        pd.DataFrame: Long format, one row per image, parameter combination and quantity with the columns
+            'img_name', the swept parameters, 'quantity' (e.g. 'total_volume', 'length_head'), 'value' and 'error'.
+            A failing combination has a single row with quantity None and the message in 'error'.
+    '''
+    if labels is None:
+        labels = predictions[0][0].names
+    params = params if params is not None else {}
+    combinations = parameter_grid(grid)
+
+    rows = []
+    start = time.perf_counter()
+    for img_upload, prediction in tqdm(zip(imgs_upload, predictions), total=len(predictions), desc="Parameter sweep", disable=not show_progress):
+        img_name = process_vol_est_main.get_img_name(img_upload)
+        # All artifacts of one image are kept until its combinations are done
+        store = pipeline_stages.ArtifactStore(max_entries=None)
+        for combination in combinations:
+            try:
+                artifacts = pipeline_stages.run_stages(prediction[0], labels, {**params, **combination}, store=store)
+            except Exception as e:
+                logger.warning("Volume estimation failed for %s with %s: %s", img_name, combination, e)
+                rows.append({'img_name': img_name, **combination, 'quantity': None, 'value': float('nan'), 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            measurements = artifacts['measurements']
+            values = {**measurements['volumes'].iloc[0].to_dict(), **measurements['lengths'].iloc[0].to_dict()}
+            for quantity, value in values.items():
+                rows.append({'img_name': img_name, **combination, 'quantity': quantity, 'value': value, 'error': None})
+
+        logger.debug("Sweep of %s: stages computed %s", img_name, store.computed)
+
+    logger.info("Parameter sweep of %d image(s) x %d combination(s) finished in %.2f s", len(predictions), len(combinations), time.perf_counter() - start)
+    columns = ['img_name', *(combinations[0].keys() if combinations else []), 'quantity', 'value', 'error']
+    return pd.DataFrame(rows, columns=columns)
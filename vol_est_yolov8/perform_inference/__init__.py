@@ -0,0 +1 @@
+from . import inference_yolov8seg
\ No newline at end of file
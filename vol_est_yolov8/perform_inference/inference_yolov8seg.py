@@ -0,0 +1,133 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+import numpy as np
+from PIL import Image
+from ultralytics import YOLO
+
+
+def load_image(img_path: str) -> Image.Image:
+    'Open and decode an image. PIL decodes lazily, load() forces the decoding to happen in the calling (worker) thread.'
+    image = Image.open(img_path)
+    image.load()
+    return image
+
+
+class SegInferenceDriver:
+    def __init__(self, path_selected_model: str, task: str = "segment", batch_size: int = 8, num_decode_workers: int = 4, prefetch_batches: int = 2, warmup: bool = True, **predict_kwargs):
+        """
+        Runs YOLOv8 segmentation inference on many images with a persistent model.
+
+        The model is loaded (and warmed up) once. Images are predicted in batches, while a thread pool
+        already decodes the images of the next batches. The number of decoded images waiting for inference
+        is bounded by batch_size * prefetch_batches.
+
+        Parameters:
+        - path_selected_model: Path to the model weights (e.g. yolov8n-seg.pt)
+        - task: YOLO task
+        - batch_size: Number of images passed to model.predict at once
+        - num_decode_workers: Number of threads decoding images
+        - prefetch_batches: Number of batches that are decoded in advance
+        - warmup: Run a dummy prediction on initialization, so the first real batch does not pay for the model setup
+        - predict_kwargs: Passed to model.predict (e.g. conf, imgsz, device)
+        """
+        self.model = YOLO(path_selected_model, task=task)
+        self.predict_kwargs = {'verbose': False}
+        self.configure(batch_size=batch_size, num_decode_workers=num_decode_workers, prefetch_batches=prefetch_batches, **predict_kwargs)
+        if warmup:
+            self.warmup()
+
+    def configure(self, batch_size: Optional[int] = None, num_decode_workers: Optional[int] = None, prefetch_batches: Optional[int] = None, **predict_kwargs):
+        """
+        Change the batching and prediction settings of the loaded model (None keeps the current value).
+        predict_kwargs are merged into the current ones.
+        """
+        if batch_size is not None:
+            if batch_size < 1:
+                raise ValueError(f"batch_size must be at least 1, but got {batch_size}")
+            self.batch_size = batch_size
+        if num_decode_workers is not None:
+            self.num_decode_workers = num_decode_workers
+        if prefetch_batches is not None:
+            self.prefetch_batches = max(prefetch_batches, 1)
+        self.predict_kwargs.update(predict_kwargs)
+
+    def warmup(self):
+        """
+        Run a prediction on a blank image to initialize the model (fusing, device transfer, ...).
+        """
+        imgsz = self.predict_kwargs.get('imgsz', 640)
+        imgsz = imgsz if isinstance(imgsz, (list, tuple)) else (imgsz, imgsz)
+        dummy_img = np.zeros((*imgsz, 3), dtype=np.uint8)
+        self.model.predict(dummy_img, **self.predict_kwargs)
+
+    def iter_predictions(self, img_names) -> Iterator[tuple[str, list]]:
+        """
+        Yield (img_name, prediction) for every image in the order of img_names.
+        prediction is the list of Results returned by model.predict for this image (same structure as run_seg_inference).
+        """
+        max_queued = self.batch_size * self.prefetch_batches
+        img_names = iter(img_names)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.num_decode_workers) as executor:
+
+            def fill_queue():
+                for img_name in img_names:
+                    pending.append((img_name, executor.submit(load_image, img_name)))
+                    if len(pending) >= max_queued:
+                        break
+
+            fill_queue()
+            while pending:
+                batch = [pending.popleft() for _ in range(min(self.batch_size, len(pending)))]
+                # Decode the next images while the current batch is predicted
+                fill_queue()
+
+                images = [future.result() for _, future in batch]
+                results = self.model.predict(images, **self.predict_kwargs)
+
+                for (img_name, _), result in zip(batch, results):
+                    # Inference on PIL images does not know the file name
+                    result.path = img_name
+                    yield img_name, [result]
+
+    def predict(self, img_names: list) -> list:
+        """
+        Predict all images. Returns one prediction (list of Results) per image.
+        """
+        return [prediction for _, prediction in self.iter_predictions(img_names)]
+
+
+_drivers = {}
+
+def get_driver(path_selected_model: str, task: str = "segment", **driver_kwargs) -> SegInferenceDriver:
+    '''
+    Return a cached driver per model, so repeated calls do not reload the model.
+    driver_kwargs (see SegInferenceDriver) are applied to a cached driver as well, warmup only matters when the driver is created.
+    '''
+    key = (path_selected_model, task)
+    if key not in _drivers:
+        _drivers[key] = SegInferenceDriver(path_selected_model, task=task, **driver_kwargs)
+    else:
+        driver_kwargs.pop('warmup', None)
+        _drivers[key].configure(**driver_kwargs)
+    return _drivers[key]
+
+
+def inference_yolov8seg_on_folder(folder_path: str, model_path: str, limit_img: Optional[int] = None, img_endings: tuple = ('.png', '.jpg', '.jpeg', '.tif', '.tiff'), **driver_kwargs) -> list:
+    """
+    Run inference on all images of a folder.
+
+    Returns:
+        predictions: one prediction (list of Results) per image, shape (num_imgs, num_predictions_per_img)
+    """
+    img_names = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(img_endings))
+    if limit_img:
+        img_names = img_names[:limit_img]
+    img_paths = [os.path.join(folder_path, img_name) for img_name in img_names]
+
+    driver = get_driver(model_path, **driver_kwargs)
+    return driver.predict(img_paths)
@@ -0,0 +1,248 @@
+'''
+The volume estimation of a single image as explicit stages with memoized artifacts.
+
+    masks -> cogs -> centerline -> resampled_line -> orthogonal_lines -> measurements
+
+Every stage has a fingerprint that is derived from the image (polygons, classes, image size, labels), its own parameters
+and the fingerprints of the stages it depends on. The artifacts of the stages are kept in an ArtifactStore under their
+fingerprint, so if a parameter changes only the stages downstream of it are computed again, e.g. a new k_mm_per_px only
+reruns the measurements, a new num_orthogonal_lines reruns the orthogonal lines and the measurements.
+
+Usage:
+    store = ArtifactStore()
+    for k_mm_per_px in [0.0030, 0.0031, 0.0032]:
+        artifacts = run_stages(prediction, labels, {'k_mm_per_px': k_mm_per_px, 'n_polynom_fallback': 3, 'num_orthogonal_lines': 150}, store=store)
+        volumes = artifacts['measurements']['volumes']
+'''
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+import vol_est_yolov8 as vol_est
+from vol_est_yolov8.converter import converter_result_to_arrays
+from vol_est_yolov8.utils import profiling
+
+logger = logging.getLogger(__name__)
+
+# Default values of the optional parameters
+DEFAULT_PARAMETERS = {'roi_padding': 10, 'n_samples': 110, 'slicing_method': 'raster'}
+
+SLICING_METHODS = ['raster', 'polygon']
+
+
+def masks_stage(prediction, labels: dict, roi_padding: Optional[int], profiler=None) -> dict:
+    'Loads the masks of the Results object and rasterizes them into one label map on a crop around all masks (roi_padding=None: full image)'
+    with profiling.stage(profiler, 'rasterization'):
+        # The masks and the decoded image are taken directly from the Results object (no JSON round trip, no second decode)
+        loader = converter_result_to_arrays.ResultsArrayConverter(prediction, labels=labels)
+        img_np, img, boxes, masks, scores, all_cls, mask_w_label, labels = loader.load()
+
+        if roi_padding is not None:
+            roi = vol_est.length_estimation.utils_vol_estimation.get_roi(masks, img_np, padding=roi_padding)
+        else:
+            roi = (0, 0, img_np.shape[1], img_np.shape[0])
+        # One label image (class ID + 1 per pixel) replaces the binary masks per instance and per segment
+        label_map = vol_est.length_estimation.utils_vol_estimation.get_label_map(masks, all_cls, img_np, roi=roi)
+        label_names = vol_est.analyze_segments.label_map.get_label_names(all_cls, labels)
+        # Polygons in (sub-pixel) crop coordinates for the polygon slicing
+        size = np.array([img_np.shape[1], img_np.shape[0]], dtype=float)
+        polygons = [np.asarray(xyn, dtype=float).reshape(-1, 2) * size - roi[:2] for xyn in masks]
+
+    # Only the image size is kept, a stored artifact must not hold on to the full image
+    return {'image_size': (img_np.shape[1], img_np.shape[0]), 'masks': masks, 'all_cls': all_cls, 'labels': labels, 'roi': roi, 'offset': roi[:2],
+            'label_map': label_map, 'label_names': label_names, 'polygons': polygons}
+
+
+def cogs_stage(masks: dict, profiler=None) -> dict:
+    'CoGs per class (crop coordinates) and their result columns (image coordinates)'
+    offset = masks['offset']
+    with profiling.stage(profiler, 'cog'):
+        # Moments of the polygons, no pass over the label map
+        cogs_array, ordered_cogs = vol_est.length_estimation.utils_vol_estimation.get_cogs_from_polygons(masks['masks'], masks['all_cls'], masks['image_size'], offset=offset)
+
+        present_label_names = [masks['labels'][i_cls.item()] for i_cls in masks['all_cls']]
+        present_label_names = list(dict.fromkeys(present_label_names)) # Remove duplicates (in case a label is present multiple times)
+
+        cog_dict = {}
+        for idx, present_label in enumerate(present_label_names):
+            cog_dict[f'x_{present_label}'] = cogs_array[idx][0] + offset[0]
+            cog_dict[f'y_{present_label}'] = cogs_array[idx][1] + offset[1]
+
+        df_cogs = pd.DataFrame(cog_dict, index=[0])
+
+    return {'cogs_array': cogs_array, 'ordered_cogs': ordered_cogs, 'df_cogs': df_cogs}
+
+
+def centerline_stage(masks: dict, cogs: dict, n_polynom_fallback: int, profiler=None) -> dict:
+    'Middle line through the CoGs (polynomial fit to the mask if there are less than 2 CoGs), not yet trimmed'
+    with profiling.stage(profiler, 'centerline_fit'):
+        generator = vol_est.extract_skeleton.polynom_regression_in_mask.MaskPointGenerator(masks['label_map'], cogs['cogs_array'], offset=masks['offset'], image_size=masks['image_size'])
+        combined_mask = generator.get_combined_mask()
+        fitted_points = vol_est.length_estimation.utils_vol_estimation.fit_middle_line(generator, cogs['cogs_array'], n_polynom=n_polynom_fallback)
+
+    return {'fitted_points': fitted_points, 'combined_mask': combined_mask}
+
+
+def resampled_line_stage(centerline: dict, n_samples: int, profiler=None) -> dict:
+    'Middle line trimmed to the mask and resampled to n_samples equidistant points'
+    with profiling.stage(profiler, 'trimming'):
+        fitted_points = vol_est.length_estimation.utils_vol_estimation.trim_middle_line(centerline['fitted_points'], centerline['combined_mask'], n_samples=n_samples)
+
+    return {'fitted_points': fitted_points}
+
+
+def orthogonal_lines_stage(masks: dict, centerline: dict, resampled_line: dict, num_orthogonal_lines: int, slicing_method: str, profiler=None) -> dict:
+    '''
+    Lines orthogonal to the middle line, cut at the mask boundary and assigned to a segment.
+    slicing_method: 'raster' (pixels of the label map) or 'polygon' (exact intersections with the mask polygons, see extract_skeleton.polygon_slicer)
+    '''
+    if slicing_method not in SLICING_METHODS:
+        raise ValueError(f"Unknown slicing_method {slicing_method!r}, possible methods: {SLICING_METHODS}")
+    with profiling.stage(profiler, 'slicing'):
+        if slicing_method == 'polygon':
+            lines, generator = vol_est.length_estimation.utils_vol_estimation.get_orth_lines_from_polygons(num_orthogonal_lines, resampled_line['fitted_points'], masks['polygons'], masks['all_cls'], masks['label_names'])
+        else:
+            lines, generator = vol_est.length_estimation.utils_vol_estimation.get_orth_lines(num_orthogonal_lines, resampled_line['fitted_points'], centerline['combined_mask'], masks['label_map'], label_names=masks['label_names'])
+
+    return {'lines': lines, 'generator': generator}
+
+
+def measurements_stage(masks: dict, resampled_line: dict, orthogonal_lines: dict, k_mm_per_px: float, slicing_method: str, profiler=None) -> dict:
+    'Volume and length per segment [mm^3, mm], the segments of the middle line points are taken from the polygons if slicing_method is polygon'
+    with profiling.stage(profiler, 'volume'):
+        volumes = vol_est.length_estimation.utils_vol_estimation.get_volume_from_lines(orthogonal_lines['lines'], orthogonal_lines['generator'], k_mm_per_px)
+
+    with profiling.stage(profiler, 'length'):
+        estimator = vol_est.length_estimation.length_estimation.LengthEstimator(resampled_line['fitted_points'], masks['label_map'], k_mm_per_px, label_names=masks['label_names'])
+        if slicing_method == 'polygon':
+            point_labels = vol_est.extract_skeleton.polygon_slicer.label_points(resampled_line['fitted_points'], masks['polygons'], masks['all_cls'])
+            length_per_segment = estimator.calculate_lengths_from_point_labels(point_labels, round_to=3)
+        else:
+            length_per_segment = estimator.calculate_lengths(round_to=3)
+        total_length = estimator.calculate_total_length(round_to=3)
+        lengths = {"total_length": total_length, **length_per_segment}
+        lengths = pd.DataFrame(lengths, index=[0])
+
+    return {'volumes': volumes, 'lengths': lengths}
+
+
+# Stage name -> (function, stages it depends on, parameters), in the order the stages are run
+STAGES = OrderedDict([
+    ('masks', (masks_stage, [], ['roi_padding'])),
+    ('cogs', (cogs_stage, ['masks'], [])),
+    ('centerline', (centerline_stage, ['masks', 'cogs'], ['n_polynom_fallback'])),
+    ('resampled_line', (resampled_line_stage, ['centerline'], ['n_samples'])),
+    ('orthogonal_lines', (orthogonal_lines_stage, ['masks', 'centerline', 'resampled_line'], ['num_orthogonal_lines', 'slicing_method'])),
+    ('measurements', (measurements_stage, ['masks', 'resampled_line', 'orthogonal_lines'], ['k_mm_per_px', 'slicing_method'])),
+])
+
+
+class ArtifactStore:
+    def __init__(self, max_entries: Optional[int] = 512):
+        """
+        In-memory store of stage artifacts, keyed by (stage, fingerprint).
+
+        Parameters:
+        - max_entries: Maximum number of artifacts (one per stage and image / parameter combination),
+            the least recently used artifacts are dropped (None: unbounded). The masks stage holds the label map
+            (crop around the masks) and the polygons of the image, but not the image itself.
+        """
+        self.max_entries = max_entries
+        self.artifacts = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.computed = {stage: 0 for stage in STAGES}
+
+    def get(self, stage: str, fingerprint: str) -> Optional[dict]:
+        "Artifact of the stage or None"
+        artifact = self.artifacts.get((stage, fingerprint))
+        if artifact is None:
+            self.misses += 1
+            return None
+        self.artifacts.move_to_end((stage, fingerprint))
+        self.hits += 1
+        return artifact
+
+    def put(self, stage: str, fingerprint: str, artifact: dict):
+        self.artifacts[(stage, fingerprint)] = artifact
+        self.artifacts.move_to_end((stage, fingerprint))
+        self.computed[stage] += 1
+        if self.max_entries is not None:
+            while len(self.artifacts) > self.max_entries:
+                self.artifacts.popitem(last=False)
+
+    def clear(self):
+        self.artifacts.clear()
+
+
+def prediction_fingerprint(prediction, labels: dict) -> str:
+    "Fingerprint of the inputs of the masks stage: image size, mask polygons, classes and labels of a Results object"
+    h = hashlib.sha256()
+    h.update(str(np.shape(prediction.orig_img)).encode())
+    if prediction.masks is None:
+        # No detections in this image
+        h.update(b"no masks")
+    else:
+        for xyn in prediction.masks.xyn:
+            xyn = np.ascontiguousarray(xyn, dtype=np.float32)
+            h.update(len(xyn).to_bytes(8, 'little'))
+            h.update(xyn)
+        h.update(np.asarray(prediction.boxes.cls, dtype=np.float32).tobytes())
+    h.update(json.dumps({str(i_cls): name for i_cls, name in labels.items()}, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def stage_fingerprints(input_fingerprint: str, params: dict, stages: Optional[list] = None) -> dict:
+    "Fingerprint per stage (default: all stages): hash of the stage name, its parameters and the fingerprints of the stages it depends on"
+    fingerprints = {}
+    for stage in (stages if stages is not None else STAGES):
+        _, dependencies, parameters = STAGES[stage]
+        upstream = [fingerprints[dependency] for dependency in dependencies] if dependencies else [input_fingerprint]
+        description = [stage, {parameter: params[parameter] for parameter in parameters}, upstream]
+        fingerprints[stage] = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+    return fingerprints
+
+
+def run_stages(prediction, labels: dict, params: dict, store: Optional[ArtifactStore] = None, profiler=None, until: str = 'measurements') -> dict:
+    '''
+    Runs the stages of one image up to (and including) the stage until, reusing the artifacts in store.
+
+    Parameters:
+        prediction: ultralytics Results object of the image.
+        labels: Class labels of the model.
+        params: Parameters of the stages: k_mm_per_px, n_polynom_fallback, num_orthogonal_lines and optionally
+            roi_padding, n_samples, slicing_method (see DEFAULT_PARAMETERS).
+        store: ArtifactStore of previous runs. If None, all stages are computed.
+        profiler: Optional utils.profiling.StageProfiler, only computed stages are recorded.
+
+    Returns:
+        dict: Artifact per stage (each a dict, see the *_stage functions) and 'fingerprints'.
+    '''
+    params = {**DEFAULT_PARAMETERS, **params}
+    stages = list(STAGES)[:list(STAGES).index(until) + 1]
+    missing = [parameter for stage in stages for parameter in STAGES[stage][2] if parameter not in params]
+    if missing:
+        raise ValueError(f"Missing stage parameters: {missing}")
+
+    fingerprints = stage_fingerprints(prediction_fingerprint(prediction, labels), params, stages)
+    artifacts = {}
+    for stage in stages:
+        function, dependencies, parameters = STAGES[stage]
+        artifact = store.get(stage, fingerprints[stage]) if store is not None else None
+        if artifact is None:
+            inputs = {dependency: artifacts[dependency] for dependency in dependencies} if dependencies else {'prediction': prediction, 'labels': labels}
+            artifact = function(**inputs, **{parameter: params[parameter] for parameter in parameters}, profiler=profiler)
+            if store is not None:
+                store.put(stage, fingerprints[stage], artifact)
+        else:
+            logger.debug("Stage %s reused", stage)
+        artifacts[stage] = artifact
+
+    artifacts['fingerprints'] = fingerprints
+    return artifacts
@@ -1,3 +1,4 @@
+import logging
 import cv2
 import itertools
 import torch
@@ -7,13 +8,15 @@ from PIL import Image
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
+logger = logging.getLogger(__name__)
+
 
 def box_label(image, box, label='', color=(128, 128, 128), txt_color=(255, 255, 255)):
     font_scale_inverse = 3
     lw = max(round(sum(image.shape) / font_scale_inverse * 0.003), 2)
     p1, p2 = (int(box[0]), int(box[1])), (int(box[2]), int(box[3]))
     cv2.rectangle(image, p1, p2, color, thickness=lw, lineType=cv2.LINE_AA)
-    print("Label in box_label:", label)
+    logger.debug("Label in box_label: %s", label)
     if label:
         tf = max(lw - 1, 1)  # font thickness
         w, h = cv2.getTextSize(label, cv2.FONT_HERSHEY_TRIPLEX, fontScale=lw / 3, thickness=tf)[0]  # text width, height
@@ -90,8 +93,7 @@ def plot_segments(image, boxes, masks, cls:torch.tensor, labels:dict, conf:Union
     h, w = image.shape[:2]
     image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
 
-    print("CLS", cls)
-    print("LABELS", labels)
+    logger.debug("CLS %s, LABELS %s", cls, labels)
 
     # Note for my future me:
     #i is used to index boxes and masks, as they are ordered in the same sequence as the detections.
@@ -104,8 +106,7 @@ def plot_segments(image, boxes, masks, cls:torch.tensor, labels:dict, conf:Union
         #NEW- fix error
         #label_name = labels[cls[i].item()]
         label_name = labels[class_id.item()]
-        print("Label_name", label_name)
-        print("CLS i", class_id)
+        logger.debug("Label_name %s, CLS i %s", label_name, class_id)
         if score:
             # THIS LINE IS FALSE!!
             #label = labels[cls[i]] + " " + str(round(100 * float(conf[i]), 1)) + "%"
@@ -247,8 +248,6 @@ def plot_segments_from_results(result, return_image:bool=False):
     # Visualize bounding boxes and segmentations
     if return_image:
         image = plot_segments(image, boxes, masks, cls, labels, conf, score, return_image=return_image)
-        print("Image type check inside inference_results.py")
-        print(type(image))
         return image
     else:
         plot_segments(image, boxes, masks, cls, labels, conf, score, return_image=return_image)
@@ -1,81 +1,339 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterator, Optional
+
+import numpy as np
 import pandas as pd
-from PIL import Image
+from tqdm import tqdm
 
 import vol_est_yolov8 as vol_est
-from vol_est_yolov8.converter import converter_result_to_json, converter_annotation
-from vol_est_yolov8 import utils
+from vol_est_yolov8 import pipeline_stages
+from vol_est_yolov8.converter import converter_result_to_arrays
+from vol_est_yolov8.utils import profiling
+from vol_est_yolov8.utils.result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+def vol_est_single_image(img_upload, prediction, labels, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, roi_padding: Optional[int] = 10, slicing_method: str = 'raster', profiler: Optional[profiling.StageProfiler] = None, artifact_store: Optional[pipeline_stages.ArtifactStore] = None) -> tuple[pd.DataFrame, dict]:
+    '''
+    Runs the volume estimation for a single image and returns its result row and geometry.
+
+    The geometry is computed on a crop around all masks (padded by roi_padding pixels), the returned
+    CoGs, middle line and orthogonal lines are in image coordinates. With roi_padding=None the full image is used.
+    If a profiler is given, the duration of every stage (see utils.profiling.PIPELINE_STAGES) is recorded.
+    With an artifact_store (see pipeline_stages.ArtifactStore) only the stages affected by changed parameters are computed again.
+    slicing_method: 'raster' cuts the orthogonal lines at the pixels of the rasterized masks, 'polygon' intersects them exactly
+        with the mask polygons (sub-pixel widths, see extract_skeleton.polygon_slicer).
+    '''
+    params = {'roi_padding': roi_padding, 'n_polynom_fallback': n_polynom_fallback, 'num_orthogonal_lines': num_orthogonal_lines, 'k_mm_per_px': k_mm_per_px, 'slicing_method': slicing_method}
+    artifacts = pipeline_stages.run_stages(prediction[0], labels, params, store=artifact_store, profiler=profiler)
+    offset = artifacts['masks']['offset']
+
+    # Combine to df_cogs and volumes
+    measurements = artifacts['measurements']
+    df_res_row = pd.concat([artifacts['cogs']['df_cogs'], measurements['volumes'], measurements['lengths']], axis=1)
+
+    # Map the geometry from the crop back to image coordinates
+    lines = vol_est.length_estimation.utils_vol_estimation.shift_lines(artifacts['orthogonal_lines']['lines'], offset)
+    fitted_points = vol_est.length_estimation.utils_vol_estimation.shift_points(artifacts['resampled_line']['fitted_points'], offset)
+    # The image is taken from this prediction, a reused masks artifact may come from another Results object with the same polygons
+    res = {'lines': lines, 'fitted_points': fitted_points, 'img_np': converter_result_to_arrays.ResultsArrayConverter(prediction[0]).get_image()}
+
+    return df_res_row, res
 
 
-def all_vol_est_main(imgs_upload, predictions, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines) -> tuple[pd.DataFrame, dict]:
-    'Collects all necessary functions for volume estimation'
+def all_vol_est_main(imgs_upload, predictions, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, profiler: Optional[profiling.StageProfiler] = None, show_progress: bool = False, cache: Optional[ResultCache] = None, artifact_store: Optional[pipeline_stages.ArtifactStore] = None, *, roi_padding: Optional[int] = 10, slicing_method: str = 'raster') -> tuple[pd.DataFrame, dict]:
+    '''
+    Collects all necessary functions for volume estimation
+
+    profiler: Optional utils.profiling.StageProfiler that records the duration of every stage per image.
+    show_progress: Show a single progress bar for the whole batch. A summary of the batch is logged with level INFO (see utils.log.set_verbosity).
+    cache: Optional utils.result_cache.ResultCache, images with unchanged inputs are not computed again.
+    artifact_store: Optional pipeline_stages.ArtifactStore that keeps the stage artifacts between calls, e.g. to only
+        recompute the measurements if k_mm_per_px changes (see pipeline_stages).
+    roi_padding, slicing_method: Keyword only, see vol_est_single_image.
+    '''
     all_rows = []
     first = True
     first_res = {'lines': None, 'fitted_points': None, 'img_np': None}
     labels = predictions[0][0].names
-    for img_upload, prediction in zip(imgs_upload, predictions):
-        img_pil = Image.open(img_upload)
-        converter = converter_result_to_json.ResultsConverter(prediction[0], img_name=img_upload)
-        json_anno_data = converter.get_as_json()
-        loader = utils.load_json_annotation.AnnotationConverter(labels, json_annotation=json_anno_data, img=img_pil)
-        img_np, img, boxes, masks, scores, all_cls, mask_w_label, labels = loader.load()
-
-        #***************
-        # Get binary masks
-        #***************
-        bin_masks, mask_w_label = vol_est.length_estimation.utils_vol_estimation.get_binary_masks(masks, img_np, img, mask_w_label)
-
-        #***************
-        # Compute COGs
-        #***************
-        cogs_array, ordered_cogs = vol_est.length_estimation.utils_vol_estimation.get_cogs(bin_masks, all_cls, labels)
-
-        present_label_names = [labels[i_cls.item()] for i_cls in all_cls]
-        present_label_names = list(dict.fromkeys(present_label_names)) # Remove duplicates (in case a label is present multiple times)
-
-        cog_dict = {}
-        for idx, present_label in enumerate(present_label_names):
-            cog_dict[f'x_{present_label}'] = cogs_array[idx][0]
-            cog_dict[f'y_{present_label}'] = cogs_array[idx][1]
-
-        df_cogs = pd.DataFrame(cog_dict, index=[0])
-
-        #***************
-        # Compute skeleton
-        #***************
-        generator = vol_est.extract_skeleton.polynom_regression_in_mask.MaskPointGenerator(bin_masks, cogs_array)
-        combined_mask = generator.get_combined_mask()
-
-        fitted_points = vol_est.length_estimation.utils_vol_estimation.get_middle_line_points(generator, cogs_array, combined_mask, n_polynom=n_polynom_fallback)
-
-        #***************
-        # Calculate orthogonal lines
-        #***************
-        lines, generator = vol_est.length_estimation.utils_vol_estimation.get_orth_lines(num_orthogonal_lines, fitted_points, combined_mask, mask_w_label)
-
-        #***************
-        # Compute volume
-        #***************
-        volumes = vol_est.length_estimation.utils_vol_estimation.get_volume_from_lines(lines, generator, k_mm_per_px)
+    start = time.perf_counter()
+    for img_upload, prediction in tqdm(zip(imgs_upload, predictions), total=len(predictions), desc="Volume estimation", disable=not show_progress):
+        task = (img_upload, prediction, labels, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, roi_padding, slicing_method)
+        key = _cache_key(cache, task)
+        output = _cache_get(cache, key)
+        if output is not None:
+            df_res_row, res, _ = output
+            res['img_np'] = converter_result_to_arrays.ResultsArrayConverter(prediction[0]).get_image()
+        else:
+            with profiling.image(profiler, get_img_name(img_upload)):
+                df_res_row, res = vol_est_single_image(*task, profiler=profiler, artifact_store=artifact_store)
+            _cache_put(cache, key, (df_res_row, res, None))
 
         if first:
-            first_res['lines'] = lines
-            first_res['fitted_points'] = fitted_points
-            first_res['img_np'] = img_np
+            first_res = res
+            # Copy the view on Results.orig_img, so drawing on it does not alter the prediction
+            first_res['img_np'] = np.ascontiguousarray(res['img_np'])
             first = False
 
-        #***************
-        # Compute length
-        #***************
-        estimator = vol_est.length_estimation.length_estimation.LengthEstimator(fitted_points, mask_w_label, k_mm_per_px)
-        length_per_segment = estimator.calculate_lengths(round_to=3)
-        total_length = estimator.calculate_total_length(round_to=3)
-        lengths = {"total_length": total_length, **length_per_segment}
-        lengths = pd.DataFrame(lengths, index=[0])
-
-        # Combine to df_cogs and volumes
-        df_res_row = pd.concat([df_cogs, volumes, lengths], axis=1)
         all_rows.append(df_res_row)
 
     df_vol_res = pd.concat(all_rows, axis=0, ignore_index=True)
+    logger.info("Volume estimation of %d image(s) finished in %.2f s", len(all_rows), time.perf_counter() - start)
+
+    return df_vol_res, first_res
+
+
+def _cache_key(cache: Optional[ResultCache], task) -> Optional[str]:
+    '''
+    Key of a task (arguments of vol_est_single_image) in the result cache, None without cache.
+    If the key cannot be computed, the image is processed without cache, so a broken prediction only fails its own image.
+    '''
+    if cache is None:
+        return None
+    _, prediction, labels, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, roi_padding, slicing_method = task
+    params = {
+        'labels': {str(i_cls): name for i_cls, name in labels.items()},
+        'k_mm_per_px': k_mm_per_px,
+        'n_polynom_fallback': n_polynom_fallback,
+        'num_orthogonal_lines': num_orthogonal_lines,
+        'roi_padding': roi_padding,
+        'slicing_method': slicing_method,
+    }
+    try:
+        return cache.key(prediction[0], params)
+    except Exception as e:
+        logger.warning("No result cache key for %s: %s", get_img_name(task[0]), e)
+        return None
+
+
+def _cache_get(cache: Optional[ResultCache], key: Optional[str]):
+    'Cached worker output (df_res_row, res, None) of the key (res without image) or None'
+    if cache is None or key is None:
+        return None
+    cached = cache.get(key)
+    if cached is None:
+        return None
+    df_res_row, res = cached
+    return df_res_row, res, None
+
+
+def _cache_put(cache: Optional[ResultCache], key: Optional[str], output):
+    'Store a successful worker output (without the image) in the result cache'
+    if cache is None or key is None:
+        return
+    df_res_row, res, error = output
+    if error is None:
+        cache.put(key, (df_res_row, {**res, 'img_np': None}))
+
+
+def _vol_est_worker(args, profiler=None) -> tuple[Optional[pd.DataFrame], Optional[dict], Optional[str]]:
+    'Process pool entry point: runs a single image and turns any exception into an error message'
+    try:
+        df_res_row, res = vol_est_single_image(*args, profiler=profiler)
+    except Exception as e:
+        return None, None, f"{type(e).__name__}: {e}"
+
+    # Do not send the full resolution image back to the parent process (the parent already holds it in the Results object)
+    res['img_np'] = None
+    return df_res_row, res, None
+
+
+def _vol_est_worker_recorded(args) -> tuple[tuple, list]:
+    'Same as _vol_est_worker, additionally returns the (stage, duration) pairs of the image for the profiler of the parent process'
+    recorder = profiling.StageRecorder()
+    return _vol_est_worker(args, recorder), recorder.records
+
+
+def _run_worker(task, profiler: Optional[profiling.StageProfiler]):
+    'Runs _vol_est_worker in the calling process, within the image context of the profiler'
+    with profiling.image(profiler, get_img_name(task[0])):
+        return _vol_est_worker(task, profiler)
+
+
+def all_vol_est_main_parallel(imgs_upload, predictions, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, max_workers: Optional[int] = None, chunksize: int = 1, profiler: Optional[profiling.StageProfiler] = None, show_progress: bool = False, cache: Optional[ResultCache] = None, *, roi_padding: Optional[int] = 10, slicing_method: str = 'raster') -> tuple[pd.DataFrame, dict]:
+    '''
+    Parallel version of all_vol_est_main that distributes the images over a process pool.
+
+    The rows of df_vol_res keep the order of imgs_upload. A failing image does not abort the batch;
+    its row only contains the message in the additional 'error' column (None for successful images).
+    first_res holds the geometry of the first image that was processed successfully.
+
+    Parameters:
+        max_workers: Number of worker processes (default: number of CPUs). With max_workers=1 the images are processed in the calling process.
+        chunksize: Number of images that are sent to a worker at once.
+        profiler: Optional utils.profiling.StageProfiler. The stage durations of the worker processes are forwarded to it,
+            the cProfile/tracemalloc capture of an image is only possible with max_workers=1.
+        show_progress: Show a single progress bar for the whole batch (see all_vol_est_main).
+        cache: Optional utils.result_cache.ResultCache. It is only accessed by the calling process, cached images are not sent to the workers.
+        roi_padding, slicing_method: Keyword only, see vol_est_single_image.
+
+    Note: imgs_upload and predictions have to be picklable (e.g. image paths and ultralytics Results objects).
+    '''
+    labels = predictions[0][0].names
+    tasks = [(img_upload, prediction, labels, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, roi_padding, slicing_method) for img_upload, prediction in zip(imgs_upload, predictions)]
+    start = time.perf_counter()
+
+    keys = [_cache_key(cache, task) for task in tasks]
+    all_outputs = [_cache_get(cache, key) for key in keys]
+    uncached = [i for i, output in enumerate(all_outputs) if output is None]
+
+    with tqdm(total=len(tasks), desc="Volume estimation", disable=not show_progress) as progress_bar:
+        progress_bar.update(len(tasks) - len(uncached))
+        if max_workers == 1:
+            for i in uncached:
+                all_outputs[i] = _run_worker(tasks[i], profiler)
+                _cache_put(cache, keys[i], all_outputs[i])
+                progress_bar.update()
+        elif uncached:
+            worker = _vol_est_worker if profiler is None else _vol_est_worker_recorded
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for i, output in zip(uncached, executor.map(worker, [tasks[i] for i in uncached], chunksize=chunksize)):
+                    all_outputs[i] = _collect_output(tasks[i], output, profiler)
+                    _cache_put(cache, keys[i], all_outputs[i])
+                    progress_bar.update()
+
+    all_rows = []
+    first_res = {'lines': None, 'fitted_points': None, 'img_np': None}
+    num_errors = 0
+    for task, (df_res_row, res, error) in zip(tasks, all_outputs):
+        prediction = task[1]
+        if error is not None:
+            logger.warning("Volume estimation failed for %s: %s", get_img_name(task[0]), error)
+            num_errors += 1
+            all_rows.append(pd.DataFrame({'error': [error]}))
+            continue
+
+        df_res_row['error'] = None
+        all_rows.append(df_res_row)
+
+        if first_res['lines'] is None:
+            first_res = res
+            img_np = converter_result_to_arrays.ResultsArrayConverter(prediction[0]).get_image()
+            first_res['img_np'] = np.ascontiguousarray(img_np)
+
+    df_vol_res = pd.concat(all_rows, axis=0, ignore_index=True)
+    logger.info("Volume estimation of %d image(s) finished in %.2f s (%d failed)", len(all_rows), time.perf_counter() - start, num_errors)
+
+    return df_vol_res, first_res
+
+
+def result_columns(labels: dict) -> list:
+    'All result columns that can occur for the given labels, i.e. a fixed schema independent of the labels present per image'
+    label_names = list(labels.values())
+    cog_columns = [column for name in label_names for column in (f'x_{name}', f'y_{name}')]
+    volume_columns = ['total_volume'] + [f'volume_{name}' for name in label_names]
+    length_columns = ['total_length'] + [f'length_{name}' for name in label_names]
+    return cog_columns + volume_columns + length_columns
+
+
+def _iter_worker_outputs(tasks, max_workers: Optional[int], max_in_flight: Optional[int], profiler: Optional[profiling.StageProfiler] = None, cache: Optional[ResultCache] = None):
+    '''
+    Yields (task, worker output) in task order while at most max_in_flight images are queued in the process pool.
+    Outputs found in the cache are yielded without running a worker.
+    '''
+    if max_workers == 1:
+        for task in tasks:
+            key = _cache_key(cache, task)
+            output = _cache_get(cache, key)
+            if output is None:
+                output = _run_worker(task, profiler)
+                _cache_put(cache, key, output)
+            yield task, output
+        return
+
+    worker = _vol_est_worker if profiler is None else _vol_est_worker_recorded
+
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * max_workers
+    def result(task, key, output):
+        'Output of a pending entry, either a cached output or a future of the process pool'
+        if not isinstance(output, Future):
+            return output
+        output = _collect_output(task, output.result(), profiler)
+        _cache_put(cache, key, output)
+        return output
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for task in tasks:
+                key = _cache_key(cache, task)
+                output = _cache_get(cache, key)
+                pending.append((task, key, output if output is not None else executor.submit(worker, task)))
+                if len(pending) >= max_in_flight:
+                    yield pending[0][0], result(*pending.popleft())
+            while pending:
+                yield pending[0][0], result(*pending.popleft())
+        finally:
+            # Consumer stopped early: do not compute the remaining images
+            for _, _, output in pending:
+                if isinstance(output, Future):
+                    output.cancel()
+
+
+def _collect_output(task, output, profiler: Optional[profiling.StageProfiler]):
+    'Forward the stage durations of a worker process to the profiler and return the worker output'
+    if profiler is None:
+        return output
+    output, records = output
+    profiler.record_image(get_img_name(task[0]), records)
+    return output
+
+
+def iter_vol_est(imgs_upload, predictions, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, sinks: Optional[list] = None, max_workers: Optional[int] = 1, max_in_flight: Optional[int] = None, labels: Optional[dict] = None, profiler: Optional[profiling.StageProfiler] = None, show_progress: bool = False, cache: Optional[ResultCache] = None, *, roi_padding: Optional[int] = 10, slicing_method: str = 'raster') -> Iterator[dict]:
+    '''
+    Generator variant of all_vol_est_main that yields one result record per image as soon as it is computed.
+
+    Every record is a dict with the keys 'img_name', result_columns(labels) and 'error'. Values of labels
+    that are not present in the image are None, 'error' is None for successful images (see all_vol_est_main_parallel).
+    Records are yielded in the order of imgs_upload and written to all sinks (see utils.result_sinks) before they are yielded,
+    so nothing but the current records is kept in memory.
+
+    Parameters:
+        sinks: List of result sinks, e.g. [utils.result_sinks.CsvResultSink('results.csv')]. The caller is responsible for closing them.
+        max_workers: Number of worker processes. With max_workers=1 (default) the images are processed in the calling process.
+        max_in_flight: Maximum number of images queued in the process pool (default: 2 * max_workers).
+        labels: Class labels of the model. Default: predictions[0][0].names
+        profiler: Optional utils.profiling.StageProfiler (see all_vol_est_main_parallel).
+        show_progress: Show a single progress bar for all images (see all_vol_est_main).
+        cache: Optional utils.result_cache.ResultCache (see all_vol_est_main_parallel).
+        roi_padding, slicing_method: Keyword only, see vol_est_single_image.
+    '''
+    if labels is None:
+        labels = predictions[0][0].names
+    columns = result_columns(labels)
+    sinks = sinks if sinks is not None else []
+
+    tasks = ((img_upload, prediction, labels, k_mm_per_px, n_polynom_fallback, num_orthogonal_lines, roi_padding, slicing_method) for img_upload, prediction in zip(imgs_upload, predictions))
+    start = time.perf_counter()
+    num_images, num_errors = 0, 0
+    with tqdm(desc="Volume estimation", disable=not show_progress) as progress_bar:
+        for task, (df_res_row, res, error) in _iter_worker_outputs(tasks, max_workers, max_in_flight, profiler, cache):
+            values = df_res_row.iloc[0].to_dict() if df_res_row is not None else {}
+            record = {'img_name': get_img_name(task[0])}
+            record.update({column: values.get(column) for column in columns})
+            record['error'] = error
+            if error is not None:
+                logger.warning("Volume estimation failed for %s: %s", record['img_name'], error)
+                num_errors += 1
+            num_images += 1
+            progress_bar.update()
+
+            for sink in sinks:
+                sink.write(record)
+
+            yield record
+
+    logger.info("Volume estimation of %d image(s) finished in %.2f s (%d failed)", num_images, time.perf_counter() - start, num_errors)
+
 
-    return df_vol_res, first_res
\ No newline at end of file
+def get_img_name(img_upload) -> str:
+    'File path or name of an uploaded file object'
+    if isinstance(img_upload, (str, os.PathLike)):
+        return str(img_upload)
+    return getattr(img_upload, 'name', str(img_upload))
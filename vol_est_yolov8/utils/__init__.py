@@ -1,3 +1,9 @@
 from . import convert_img_format
 from . import load_config
-from . import load_json_annotation
\ No newline at end of file
+from . import load_json_annotation
+from . import result_sinks
+from . import synthetic_specimens
+from . import profiling
+from . import log
+from . import result_cache
+from . import geometry
@@ -0,0 +1,10 @@
+import numpy as np
+
+
+def row_norms(vectors: np.ndarray) -> np.ndarray:
+    """
+    Euclidean norm along the last axis.
+    Uses the same accumulation as np.linalg.norm on a single vector, so results are identical to per-vector loops.
+    """
+    vectors = np.asarray(vectors, dtype=float)
+    return np.sqrt((vectors[..., np.newaxis, :] @ vectors[..., :, np.newaxis])[..., 0, 0])
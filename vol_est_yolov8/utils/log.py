@@ -0,0 +1,25 @@
+import logging
+from typing import Optional, Union
+
+PACKAGE_LOGGER = 'vol_est_yolov8'
+
+
+def set_verbosity(level: Union[int, str] = logging.INFO, handler: Optional[logging.Handler] = None) -> logging.Logger:
+    '''
+    Enable the log output of the package (silent by default, see vol_est_yolov8/__init__.py).
+
+    Parameters:
+        level: Log level of the package logger, e.g. logging.INFO (progress per batch) or logging.DEBUG (details per image).
+            logging.WARNING restores the quiet default.
+        handler: Handler that receives the records. Default: a StreamHandler to stderr, added only once.
+            If the application configures logging itself (e.g. logging.basicConfig), only the level needs to be set.
+    '''
+    logger = logging.getLogger(PACKAGE_LOGGER)
+    logger.setLevel(level)
+    if handler is not None:
+        logger.addHandler(handler)
+    elif not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+        logger.addHandler(stream_handler)
+    return logger
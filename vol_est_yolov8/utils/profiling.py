@@ -0,0 +1,171 @@
+import cProfile
+import contextlib
+import io
+import pstats
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Callable, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+# Stages of process_vol_est_main.vol_est_single_image in the order they are run
+PIPELINE_STAGES = ['rasterization', 'cog', 'centerline_fit', 'trimming', 'slicing', 'volume', 'length']
+
+
+class StageProfiler:
+    def __init__(self, callbacks: Optional[list] = None, capture_image: Optional[Union[int, str]] = None, capture_memory: bool = True):
+        """
+        Collects the latency of named pipeline stages over a batch of images.
+
+        Usage:
+            profiler = StageProfiler(capture_image=0)
+            df_vol_res, first_res = process_vol_est_main.all_vol_est_main(..., profiler=profiler)
+            print(profiler.report())
+
+        Parameters:
+        - callbacks: Functions called after every stage with (stage, duration [s], img_name), e.g. to forward to a metrics system.
+        - capture_image: Index (order in which the images are processed) or name of one image that is run under
+            cProfile (and tracemalloc if capture_memory). Only possible for images processed in the calling process.
+        - capture_memory: Trace the peak memory of the captured image (above the memory traced when the image starts).
+        """
+        self.callbacks = list(callbacks) if callbacks is not None else []
+        self.capture_image = capture_image
+        self.capture_memory = capture_memory
+        self.durations = defaultdict(list)
+        self.current_image = None
+        self.num_images = 0
+        self.profile_stats = None
+        self.memory_peak_bytes = None
+        self.memory_snapshot = None
+
+    def add_callback(self, callback: Callable):
+        "Register a function that is called with (stage, duration [s], img_name) after every stage"
+        self.callbacks.append(callback)
+
+    def record(self, stage: str, duration: float, img_name: Optional[str] = None):
+        "Add a stage duration [s] that was measured elsewhere (e.g. in a worker process)"
+        img_name = img_name if img_name is not None else self.current_image
+        self.durations[stage].append(duration)
+        for callback in self.callbacks:
+            callback(stage, duration, img_name)
+
+    def record_image(self, img_name: Optional[str], records: list):
+        "Add all (stage, duration) pairs of one image that was processed elsewhere (see StageRecorder)"
+        for stage, duration in records:
+            self.record(stage, duration, img_name)
+        self.num_images += 1
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        "Measure the wall time of the enclosed block as stage"
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    @contextlib.contextmanager
+    def image(self, img_name: Optional[str] = None):
+        "Enclose the processing of one image, the chosen capture image is run under cProfile/tracemalloc"
+        self.current_image = img_name
+        capture = self.capture_image is not None and self.capture_image in (self.num_images, img_name)
+        if capture:
+            profile = cProfile.Profile()
+            # Do not end a trace of the caller (e.g. a benchmark measuring the peak memory), only reset its peak
+            was_tracing = tracemalloc.is_tracing()
+            if self.capture_memory:
+                if was_tracing:
+                    tracemalloc.reset_peak()
+                else:
+                    tracemalloc.start()
+                # Memory already allocated by the caller does not count for the image
+                start_bytes = tracemalloc.get_traced_memory()[0]
+            profile.enable()
+        try:
+            yield
+        finally:
+            if capture:
+                profile.disable()
+                self.profile_stats = pstats.Stats(profile)
+                if self.capture_memory:
+                    _, peak_bytes = tracemalloc.get_traced_memory()
+                    self.memory_peak_bytes = peak_bytes - start_bytes
+                    self.memory_snapshot = tracemalloc.take_snapshot()
+                    if not was_tracing:
+                        tracemalloc.stop()
+            self.current_image = None
+            self.num_images += 1
+
+    def histograms(self, bins: int = 20) -> dict:
+        """
+        Latency histogram per stage.
+
+        Returns:
+        - dict: {stage: (counts, bin_edges [s])}, see np.histogram
+        """
+        return {stage: np.histogram(durations, bins=bins) for stage, durations in self.durations.items()}
+
+    def summary(self) -> pd.DataFrame:
+        "Latency statistics per stage [ms] (one row per stage, in pipeline order)"
+        stages = [stage for stage in PIPELINE_STAGES if stage in self.durations] + [stage for stage in self.durations if stage not in PIPELINE_STAGES]
+        rows = []
+        for stage in stages:
+            durations = np.asarray(self.durations[stage]) * 1000
+            rows.append({
+                'stage': stage,
+                'count': len(durations),
+                'mean_ms': durations.mean(),
+                'p50_ms': np.percentile(durations, 50),
+                'p90_ms': np.percentile(durations, 90),
+                'p99_ms': np.percentile(durations, 99),
+                'max_ms': durations.max(),
+                'total_s': durations.sum() / 1000,
+            })
+        df_summary = pd.DataFrame(rows, columns=['stage', 'count', 'mean_ms', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'total_s'])
+        df_summary['share'] = df_summary['total_s'] / df_summary['total_s'].sum()
+        return df_summary.set_index('stage')
+
+    def report(self, top_functions: int = 15) -> str:
+        "Text report with the latency statistics per stage and the cProfile/tracemalloc result of the captured image"
+        lines = [f"Stage latencies over {self.num_images} image(s):", self.summary().round(3).to_string()]
+        if self.memory_peak_bytes is not None:
+            lines.append(f"Peak traced memory of the captured image: {self.memory_peak_bytes / 1024**2:.1f} MB")
+        if self.profile_stats is not None:
+            stream = io.StringIO()
+            self.profile_stats.stream = stream
+            self.profile_stats.sort_stats('cumulative').print_stats(top_functions)
+            lines.append(stream.getvalue())
+        return "\n".join(lines)
+
+
+def stage(profiler: Optional[StageProfiler], name: str):
+    "profiler.stage(name), or a no-op context if no profiler is given"
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(name)
+
+
+def image(profiler: Optional[StageProfiler], img_name: Optional[str] = None):
+    "profiler.image(img_name), or a no-op context if no profiler is given"
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.image(img_name)
+
+
+class StageRecorder:
+    def __init__(self):
+        """
+        Minimal picklable profiler for worker processes, only keeps the (stage, duration) pairs in order.
+        The parent process forwards them with StageProfiler.record.
+        """
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.records.append((stage, time.perf_counter() - start))
@@ -0,0 +1,198 @@
+"""
+Content-addressed on-disk cache of the volume estimation results per image.
+
+The key of an image is the SHA-256 hash of everything its result depends on: the decoded image, the model weights,
+the detected polygons and classes, the class labels and the pipeline parameters. Every entry is a pickle file
+<key>.pkl in the cache directory with the result row and the geometry (without the image) of vol_est_single_image.
+If the directory grows beyond max_bytes, the least recently used entries (file modification time) are deleted
+until the cache is below low_water * max_bytes. Entries that cannot be unpickled (corrupt, or stale after a code change)
+are deleted and count as misses. The size of the cache is tracked in memory, the directory is only
+scanned on initialization and for an eviction.
+
+Usage:
+    cache = ResultCache('.vol_est_cache', model_weights='weights/best.pt')
+    df_vol_res, first_res = process_vol_est_main.all_vol_est_main(..., cache=cache)
+    print(cache.stats())
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Increase if the results of the pipeline change for unchanged inputs, invalidates all existing entries
+CACHE_VERSION = 1
+
+
+class ResultCache:
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = 1024**3, model_weights: Optional[Union[str, bytes]] = None, hash_pixels: bool = True, low_water: float = 0.8):
+        """
+        Parameters:
+        - cache_dir: Directory of the cache entries (created if it does not exist).
+        - max_bytes: Maximum total size of all entries, older entries are evicted (None: unbounded).
+        - model_weights: Path to the weights file of the model (its content is hashed) or any identifier of the model.
+        - hash_pixels: Include the pixel values of the image in the key. The results only depend on the image size,
+            so False avoids hashing the full resolution image (about 20 ms for 12 MP) at the risk of sharing entries
+            between different images with identical predictions.
+        - low_water: An eviction deletes entries until the cache is at most low_water * max_bytes, so the directory
+            is not scanned again for the next writes.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_pixels = hash_pixels
+        self.low_water = low_water
+        self.model_hash = _hash_model_weights(model_weights)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        # Running total of the entry sizes, other processes writing to the same directory are only noticed by the next eviction
+        self.size_bytes = sum(size for _, size, _ in self._entries())
+
+    def key(self, prediction, params: dict) -> str:
+        """
+        Key of one image.
+
+        Parameters:
+        - prediction: ultralytics Results object of the image (orig_img, masks.xyn, boxes.cls and names are used).
+        - params: Pipeline parameters, e.g. {'k_mm_per_px': ..., 'n_polynom_fallback': ..., 'num_orthogonal_lines': ...}
+        """
+        h = hashlib.sha256()
+        h.update(f"vol_est_yolov8 result cache v{CACHE_VERSION}".encode())
+        h.update(self.model_hash.encode())
+
+        image = np.ascontiguousarray(prediction.orig_img)
+        h.update(f"{image.shape}{image.dtype}".encode())
+        if self.hash_pixels:
+            h.update(image)
+
+        if prediction.masks is None:
+            # No detections in this image
+            h.update(b"no masks")
+        else:
+            for xyn in prediction.masks.xyn:
+                xyn = np.ascontiguousarray(xyn, dtype=np.float32)
+                h.update(len(xyn).to_bytes(8, 'little'))
+                h.update(xyn)
+            h.update(np.asarray(prediction.boxes.cls, dtype=np.float32).tobytes())
+
+        h.update(json.dumps({str(k): v for k, v in prediction.names.items()}, sort_keys=True).encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: str) -> Optional[tuple]:
+        "Cached (df_res_row, res) of the key or None. A hit marks the entry as recently used."
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            # Missing or evicted by another process
+            self.misses += 1
+            return None
+        except Exception as e:
+            # Corrupt entry or a stale one that refers to renamed modules/classes
+            logger.warning("Deleting unreadable result cache entry %s: %s: %s", path, type(e).__name__, e)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.size_bytes -= size
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: tuple):
+        "Store (df_res_row, res) under key and evict the least recently used entries if the cache is too large"
+        path = self._path(key)
+        try:
+            replaced_bytes = os.path.getsize(path)
+        except FileNotFoundError:
+            replaced_bytes = 0
+        # Write to a temporary file first, so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+                entry_bytes = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.size_bytes += entry_bytes - replaced_bytes
+        if self.max_bytes is not None and self.size_bytes > self.max_bytes:
+            self.evict(int(self.low_water * self.max_bytes))
+
+    def _entries(self) -> list:
+        "(mtime, size, path) of all entries"
+        entries = []
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.pkl'):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self, max_bytes: int):
+        "Delete the least recently used entries until the total size is at most max_bytes"
+        entries = self._entries()
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_bytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+        self.size_bytes = total_bytes
+        logger.debug("Result cache size %d bytes after eviction", total_bytes)
+
+    def clear(self):
+        "Delete all entries"
+        self.evict(0)
+
+    def stats(self) -> dict:
+        "Hit/miss statistics of this instance and the current size of the cache"
+        entries = self._entries()
+        requests = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / requests if requests else 0.0,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'size_bytes': sum(size for _, size, _ in entries),
+        }
+
+
+def _hash_model_weights(model_weights: Optional[Union[str, bytes]]) -> str:
+    "SHA-256 of the weights file (if model_weights is an existing path) or of the identifier"
+    h = hashlib.sha256()
+    if isinstance(model_weights, (str, os.PathLike)) and os.path.isfile(model_weights):
+        with open(model_weights, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+    elif isinstance(model_weights, bytes):
+        h.update(model_weights)
+    elif model_weights is not None:
+        h.update(str(model_weights).encode())
+    return h.hexdigest()
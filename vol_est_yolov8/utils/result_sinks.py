@@ -0,0 +1,168 @@
+import csv
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class BaseResultSink(ABC):
+    def __init__(self, path: str, columns: Optional[list] = None):
+        """
+        Initialize the BaseResultSink.
+
+        Parameters:
+        - path: Target file (or directory) the records are written to.
+        - columns: Column order of the records. If None, the keys of the first record are used.
+        """
+        self.path = path
+        self.columns = columns
+
+    @abstractmethod
+    def write(self, record: dict):
+        """
+        Write a single result record (one image) to the sink.
+        """
+        pass
+
+    def flush(self):
+        """
+        Persist all records written so far.
+        """
+        pass
+
+    def close(self):
+        """
+        Flush and release the underlying resources.
+        """
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _prepare(self, record: dict) -> dict:
+        "Fix the column order with the first record and convert numpy scalars / NaN to plain python values"
+        if self.columns is None:
+            self.columns = list(record.keys())
+        return {column: to_python_value(record.get(column)) for column in self.columns}
+
+
+class CsvResultSink(BaseResultSink):
+    def __init__(self, path: str, columns: Optional[list] = None):
+        """
+        Append-only CSV sink. The header is only written if the file is new or empty,
+        so a crashed run can be continued with the same file.
+        """
+        super().__init__(path, columns)
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'a', newline='')
+        self.writer = None
+        self.write_header = write_header
+
+    def write(self, record: dict):
+        record = self._prepare(record)
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns)
+            if self.write_header:
+                self.writer.writeheader()
+        self.writer.writerow(record)
+        self.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class JsonLinesResultSink(BaseResultSink):
+    def __init__(self, path: str, columns: Optional[list] = None):
+        """
+        Append-only JSON Lines sink (one JSON object per image and line).
+        """
+        super().__init__(path, columns)
+        self.file = open(path, 'a')
+
+    def write(self, record: dict):
+        record = self._prepare(record)
+        self.file.write(json.dumps(record) + "\n")
+        self.flush()
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+class ParquetResultSink(BaseResultSink):
+    def __init__(self, path: str, columns: Optional[list] = None, row_group_size: int = 1000):
+        """
+        Parquet sink that writes every row group as a separate part file into the directory `path`.
+        Finished row groups stay readable if the run crashes (e.g. pd.read_parquet(path)).
+        Existing part files are kept, new ones are appended.
+
+        Note: Requires pyarrow.
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError("ParquetResultSink requires pyarrow. Install it with: pip install pyarrow") from e
+
+        super().__init__(path, columns)
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.row_group_size = row_group_size
+        self.buffer = []
+        self.schema = None
+
+        os.makedirs(path, exist_ok=True)
+        self.part_idx = len([f for f in os.listdir(path) if f.startswith('part-') and f.endswith('.parquet')])
+
+    def write(self, record: dict):
+        self.buffer.append(self._prepare(record))
+        if len(self.buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        if self.schema is None:
+            self.schema = self.pa.schema([(column, self._infer_type(column)) for column in self.columns])
+        table = self.pa.Table.from_pylist(self.buffer, schema=self.schema)
+        part_path = os.path.join(self.path, f'part-{self.part_idx:05d}.parquet')
+        self.pq.write_table(table, part_path)
+        self.part_idx += 1
+        self.buffer = []
+
+    def _infer_type(self, column: str):
+        "Use the first non-null value of the column; result columns without a value default to float64"
+        for record in self.buffer:
+            value = record[column]
+            if value is None:
+                continue
+            if isinstance(value, str):
+                return self.pa.string()
+            if isinstance(value, bool):
+                return self.pa.bool_()
+            if isinstance(value, int):
+                return self.pa.int64()
+            return self.pa.float64()
+        return self.pa.string() if column in ('img_name', 'error') else self.pa.float64()
+
+
+def to_python_value(value):
+    "Convert numpy scalars to python types and NaN to None (JSON/CSV/Parquet friendly)"
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
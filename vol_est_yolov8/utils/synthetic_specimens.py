@@ -0,0 +1,165 @@
+"""
+Synthetic multi-segment specimens with known analytic volume and length.
+
+The specimens are described by one polygon per segment (in pixel coordinates) and can be converted to an object that
+provides the attributes of ultralytics.engine.results.Results used by the volume estimation (see SyntheticResults),
+so they can be fed directly into process_vol_est_main.all_vol_est_main without a model.
+
+Shapes:
+- ellipsoid_chain: Ellipsoids of revolution placed end to end along a straight axis.
+    Volume per segment: 4/3 * pi * a * b^2, length: 2 * a (a: semi-axis along the body axis, b: radius)
+- curved_tube: Tube with constant radius r along a circular arc (radius R), split into segments of equal arc angle.
+    Volume per segment: pi * r^2 * R * dphi (Pappus), length: R * dphi
+"""
+
+import numpy as np
+import cv2
+import torch
+from typing import Optional
+
+
+class SyntheticSpecimen:
+    def __init__(self, name: str, width: int, height: int, polygons: list, volumes_px: dict, lengths_px: dict):
+        """
+        Parameters:
+            name: Name of the specimen (used as image path of the Results).
+            width, height: Image size in pixels.
+            polygons: List of (N, 2) polygons in pixel coordinates, one per segment. The class ID is the list index.
+            volumes_px: Analytic volume per segment label [px^3].
+            lengths_px: Analytic length of the middle line per segment label [px].
+        """
+        self.name = name
+        self.width = width
+        self.height = height
+        self.polygons = polygons
+        self.labels = {i_cls: f'segment_{i_cls}' for i_cls in range(len(polygons))}
+        self.volumes_px = volumes_px
+        self.lengths_px = lengths_px
+
+    def render_image(self) -> np.ndarray:
+        "BGR image with one gray value per segment"
+        image = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        for i_cls, polygon in enumerate(self.polygons):
+            cv2.fillPoly(image, [np.round(polygon).astype(np.int32)], (80 + 40 * (i_cls % 4),) * 3)
+        return image
+
+    def to_results(self, image: Optional[np.ndarray] = None) -> 'SyntheticResults':
+        "Results-like object of the specimen, see SyntheticResults"
+        if image is None:
+            image = self.render_image()
+        return SyntheticResults(self, image)
+
+    def ground_truth(self, k_mm_per_px: Optional[float] = None) -> dict:
+        """
+        Analytic values with the same keys as the result columns of all_vol_est_main (total_volume, volume_<label>, total_length, length_<label>).
+        Units: mm^3 / mm (pixels if k_mm_per_px is None)
+        """
+        k = k_mm_per_px if k_mm_per_px is not None else 1
+        volumes = {f'volume_{label}': volume * k**3 for label, volume in self.volumes_px.items()}
+        lengths = {f'length_{label}': length * k for label, length in self.lengths_px.items()}
+        return {'total_volume': sum(volumes.values()), **volumes, 'total_length': sum(lengths.values()), **lengths}
+
+
+class SyntheticMasks:
+    def __init__(self, xyn: list):
+        self.xyn = xyn
+
+class SyntheticBoxes:
+    def __init__(self, xyxy: torch.Tensor, conf: torch.Tensor, cls: torch.Tensor):
+        self.xyxy = xyxy
+        self.conf = conf
+        self.cls = cls
+
+
+class SyntheticResults:
+    def __init__(self, specimen: SyntheticSpecimen, image: np.ndarray):
+        """
+        Provides the attributes of ultralytics.engine.results.Results that are used by the volume estimation
+        (names, path, orig_img, masks.xyn, boxes.xyxy/conf/cls). The polygons are used as masks without rasterization.
+        """
+        self.names = specimen.labels
+        self.path = specimen.name
+        self.orig_img = image
+        size = np.array([specimen.width, specimen.height], dtype=np.float32)
+        self.masks = SyntheticMasks([(polygon / size).astype(np.float32) for polygon in specimen.polygons])
+        xyxy = np.array([np.concatenate((polygon.min(axis=0), polygon.max(axis=0))) for polygon in specimen.polygons], dtype=np.float32)
+        self.boxes = SyntheticBoxes(torch.from_numpy(xyxy), torch.ones(len(xyxy)), torch.arange(len(xyxy), dtype=torch.float32))
+
+
+def _rotate(points: np.ndarray, angle_deg: float, center: np.ndarray) -> np.ndarray:
+    angle = np.deg2rad(angle_deg)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    return (points - center) @ rotation.T + center
+
+
+def ellipsoid_chain(width: int = 4032, height: int = 3040, num_segments: int = 3, angle: float = 10.0, aspect: float = 0.6, num_vertices: int = 200, seed: Optional[int] = 0) -> SyntheticSpecimen:
+    """
+    Chain of ellipsoids of revolution along a straight axis through the image center, touching each other at the axis.
+
+    Parameters:
+        num_segments: Number of ellipsoids (segments).
+        angle: Rotation of the body axis in degrees.
+        aspect: Ratio of radius to semi-axis length (b / a) of every ellipsoid.
+        num_vertices: Number of polygon vertices per segment.
+        seed: Seed for the relative segment lengths (None: all segments have the same length).
+    """
+    rng = np.random.default_rng(seed)
+    rel_lengths = rng.uniform(0.7, 1.3, num_segments) if seed is not None else np.ones(num_segments)
+    # The chain covers 60% of the image width and must fit into the image height
+    total_length = min(0.6 * width, 0.8 * height / (aspect * rel_lengths.max() / rel_lengths.sum()))
+    semi_axes = total_length * rel_lengths / rel_lengths.sum() / 2
+    radii = aspect * semi_axes
+
+    center = np.array([width / 2, height / 2])
+    centers_x = center[0] - total_length / 2 + np.cumsum(2 * semi_axes) - semi_axes
+    t = np.linspace(0, 2 * np.pi, num_vertices, endpoint=False)
+
+    polygons, volumes, lengths = [], {}, {}
+    for i_cls, (cx, a, b) in enumerate(zip(centers_x, semi_axes, radii)):
+        polygon = np.column_stack((cx + a * np.cos(t), center[1] + b * np.sin(t)))
+        polygons.append(_rotate(polygon, angle, center))
+        volumes[f'segment_{i_cls}'] = 4 / 3 * np.pi * a * b**2
+        lengths[f'segment_{i_cls}'] = 2 * a
+
+    return SyntheticSpecimen(f'ellipsoid_chain_{width}x{height}_{num_segments}', width, height, polygons, volumes, lengths)
+
+
+def curved_tube(width: int = 4032, height: int = 3040, num_segments: int = 3, bend_angle: float = 90.0, rel_tube_radius: float = 0.08, num_vertices: int = 200) -> SyntheticSpecimen:
+    """
+    Tube with constant radius along a circular arc that is split into num_segments segments of equal arc angle.
+    The ends of the tube are flat (orthogonal to the arc).
+
+    Parameters:
+        bend_angle: Arc angle of the whole tube in degrees.
+        rel_tube_radius: Tube radius relative to the arc radius.
+        num_vertices: Number of polygon vertices per segment (half on the outer, half on the inner arc).
+    """
+    if not 0 < bend_angle <= 180:
+        raise ValueError(f"bend_angle must be in (0, 180], got {bend_angle}.")
+    phi_total = np.deg2rad(bend_angle)
+    # Bounding box of the tube relative to the arc radius, the tube covers 80% of the image in the limiting direction
+    rel_width = 2 * (1 + rel_tube_radius) * np.sin(phi_total / 2)
+    rel_height = (1 + rel_tube_radius) - (1 - rel_tube_radius) * np.cos(phi_total / 2)
+    arc_radius = 0.8 * min(width / rel_width, height / rel_height)
+    tube_radius = rel_tube_radius * arc_radius
+    # Circle center below the arc, arc symmetric to the vertical image axis and vertically centered
+    center = np.array([width / 2, height / 2 + arc_radius * ((1 + rel_tube_radius) + (1 - rel_tube_radius) * np.cos(phi_total / 2)) / 2])
+
+    phi_bounds = np.linspace(-phi_total / 2, phi_total / 2, num_segments + 1) - np.pi / 2
+    polygons, volumes, lengths = [], {}, {}
+    for i_cls in range(num_segments):
+        phi = np.linspace(phi_bounds[i_cls], phi_bounds[i_cls + 1], num_vertices // 2)
+        outer = center + (arc_radius + tube_radius) * np.column_stack((np.cos(phi), np.sin(phi)))
+        inner = center + (arc_radius - tube_radius) * np.column_stack((np.cos(phi[::-1]), np.sin(phi[::-1])))
+        polygons.append(np.concatenate((outer, inner)))
+        d_phi = phi_bounds[i_cls + 1] - phi_bounds[i_cls]
+        volumes[f'segment_{i_cls}'] = np.pi * tube_radius**2 * arc_radius * d_phi
+        lengths[f'segment_{i_cls}'] = arc_radius * d_phi
+
+    return SyntheticSpecimen(f'curved_tube_{width}x{height}_{num_segments}', width, height, polygons, volumes, lengths)
+
+
+SPECIMEN_SHAPES = {
+    'ellipsoid_chain': ellipsoid_chain,
+    'curved_tube': curved_tube,
+}